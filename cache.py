@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+
+"""
+Persistent caches: emissivity maps shared by runs across scenes and the
+provenance of the outputs of each processing stage
+
+Emissivities depend only on the FROM-GLC map, the computational region and
+the emissivity look-up table, not on the scene. Emissivity maps derived once
+are kept in the current mapset and copied, instead of derived again, in
+subsequent runs over the same landcover map and region. An index of the
+cached maps, in JSON, is kept next to them and the least recently used
+entries are evicted beyond a given number of entries.
+
+The outputs of each stage (brightness temperature, emissivity, column water
+vapor, land surface temperature) are recorded along with a digest of their
+provenance: the input maps, identified by a digest of their content, the
+MTL constants, the options of the stage, the code and the coefficient
+tables. A stage whose outputs exist with a matching digest is skipped in a
+rerun, for example after a crash.
+
+@author nik | Created on October 2026
+"""
+
+import os
+import json
+import time
+import tempfile
+import hashlib
+import fcntl
+from contextlib import contextmanager
+import grass.script as grass
+from grass.pygrass.modules.shortcuts import general as g
+from helpers import run
+
+CACHE_INDEX = 'swlst_emissivity_cache.json'
+STAGE_INDEX = 'swlst_stage_cache.json'
+CACHE_MAP_NAME = 'swlst_emissivity_{digest}_{emissivity}'
+CACHE_SIZE = 8
+REGION_KEYS = ('n', 's', 'e', 'w', 'nsres', 'ewres', 'rows', 'cols')
+MAP_MISC_FILES = ('null', 'null2', 'f_format', 'f_quant', 'gdal', 'vrt')
+HASH_CHUNK_SIZE = 2**20
+
+
+def mapset_path(filename):
+    """
+    Return the path to a file in the current mapset's directory
+    """
+    environment = grass.gisenv()
+    return os.path.join(environment['GISDBASE'],
+                        environment['LOCATION_NAME'],
+                        environment['MAPSET'],
+                        filename)
+
+
+def map_files(cell_path):
+    """
+    Return the existing files holding a raster map, given the path to its
+    'cell' element, as (element, path) tuples: its header, integer or
+    floating point cells, NULL cells and format or external source
+    descriptions
+    """
+    element_directory, name = os.path.split(cell_path)
+    mapset_directory = os.path.dirname(element_directory)
+    elements = [
+        os.path.join('cellhd', name),
+        os.path.join('cell', name),
+        os.path.join('fcell', name),
+    ]
+    elements += [os.path.join('cell_misc', name, filename)
+                 for filename in MAP_MISC_FILES]
+    files = [(element, os.path.join(mapset_directory, element))
+             for element in elements]
+    return [(element, path) for element, path in files
+            if os.path.isfile(path)]
+
+
+def map_identity(mapname):
+    """
+    Return a dictionary identifying the version of a raster map, its full
+    name and a digest of its content, that is of the files holding it, or
+    None if it does not exist
+    """
+    found = grass.find_file(name=mapname, element='cell')
+    if not found['file']:
+        return None
+    digest = hashlib.sha256()
+    for element, path in map_files(found['file']):
+        digest.update(element.encode('utf-8'))
+        with open(path, 'rb') as map_file:
+            for chunk in iter(lambda: map_file.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    return {
+        'name': found['fullname'],
+        'digest': digest.hexdigest(),
+    }
+
+
+def region_identity():
+    """
+    Return the items of the computational region which determine raster
+    outputs
+    """
+    region = grass.region()
+    return {name: str(region[name]) for name in REGION_KEYS}
+
+
+def coefficient_tables():
+    """
+    Return the emissivity and column water vapor coefficients, as parsed
+    from the CSV tables or their built-in fallbacks, as a JSON serialisable
+    dictionary
+    """
+    import csv_to_dictionary as coefficients
+    tables = {
+        'emissivity': coefficients.get_average_emissivities(),
+        'column_water_vapor': coefficients.get_column_water_vapor(),
+    }
+    return {
+        table: {
+            key: {name: value for name, value in vars(row).items()
+                  if isinstance(value, (int, float, str, tuple))
+                  and not name.startswith('_')}
+            for key, row in rows.items()
+        }
+        for table, rows in tables.items()
+    }
+
+
+def code_digest():
+    """
+    Return a digest of the source code of the module, that is of the Python
+    files next to this one, and of the coefficient tables it reads
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.py'):
+            with open(os.path.join(directory, filename), 'rb') as source:
+                digest.update(source.read())
+    tables = json.dumps(coefficient_tables(), sort_keys=True)
+    digest.update(tables.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def provenance_digest(stage, **provenance):
+    """
+    Return a digest of the provenance of the outputs of a stage. Keyword
+    arguments are JSON serialisable descriptions of the inputs and options,
+    including the digests of the stages producing the inputs.
+    """
+    text = json.dumps({'stage': stage, 'provenance': provenance},
+                      sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def read_index(path):
+    """
+    Return a JSON index, or an empty one if missing or unreadable, for
+    example truncated
+    """
+    try:
+        with open(path) as index_file:
+            return json.load(index_file)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def write_index(path, index):
+    """
+    Write a JSON index atomically, via a temporary file in the same
+    directory replacing it, so that concurrent runs never read a partial
+    index
+    """
+    directory, filename = os.path.split(path)
+    descriptor, temporary_path = tempfile.mkstemp(prefix=filename + '.',
+                                                  dir=directory or None)
+    try:
+        with os.fdopen(descriptor, 'w') as index_file:
+            json.dump(index, index_file, indent=1, sort_keys=True)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
+@contextmanager
+def index_lock(path):
+    """
+    Hold an exclusive lock on a JSON index, via a lock file next to it, so
+    that concurrent runs read, modify and write it one at a time. The lock
+    is released when the lock file is closed, also if a run is killed.
+    """
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def cache_key(landcover_map, region, lookup_digest):
+    """
+    Return a digest identifying emissivity maps derived from a landcover map
+    within a region with an emissivity look-up table
+
+    Parameters
+    ----------
+    landcover_map
+        A dictionary identifying the version of the landcover map, for
+        example its full name and a digest of its content
+
+    region
+        A dictionary of the computational region, as returned by
+        grass.region()
+
+    lookup_digest
+        A digest of the emissivity look-up table, see
+        SplitWindowLST.emissivity_lookup_digest()
+    """
+    key = {
+        'landcover': landcover_map,
+        'region': {name: str(region[name]) for name in REGION_KEYS},
+        'lookup': lookup_digest,
+    }
+    text = json.dumps(key, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def touch(index, digest, emissivities=(), now=None):
+    """
+    Mark an entry of a cache index as used, adding the given emissivities to
+    it, and return it
+    """
+    entry = index.setdefault(digest, {'maps': {}})
+    for emissivity in emissivities:
+        entry['maps'][emissivity] = CACHE_MAP_NAME.format(
+                digest=digest,
+                emissivity=emissivity,
+        )
+    entry['used'] = time.time() if now is None else now
+    return entry
+
+
+def evict(index, size):
+    """
+    Remove the least recently used entries of a cache index beyond 'size'
+    entries and return the names of their maps
+    """
+    evicted = []
+    by_use = sorted(index, key=lambda digest: index[digest]['used'])
+    for digest in by_use[:max(len(index) - size, 0)]:
+        evicted.extend(index.pop(digest)['maps'].values())
+    return evicted
+
+
+class EmissivityCache():
+    """
+    A size-bounded, least recently used, cache of emissivity maps in the
+    current mapset. Looking up, storing and evicting maps hold a lock on the
+    index, hence concurrent runs neither lose entries nor evict maps being
+    copied.
+    """
+
+    def __init__(self, size=CACHE_SIZE, index_path=None):
+        """
+        Parameters
+        ----------
+        size
+            Maximum number of cached landcover map, region and look-up table
+            combinations
+
+        index_path
+            Path to the JSON index, by default in the current mapset's
+            directory
+        """
+        self.size = size
+        self.index_path = index_path or mapset_path(CACHE_INDEX)
+
+    def _read_index(self):
+        return read_index(self.index_path)
+
+    def _write_index(self, index):
+        write_index(self.index_path, index)
+
+    def key(self, landcover_map, split_window_lst):
+        """
+        Return the cache key of emissivity maps derived from a landcover map
+        within the current computational region
+        """
+        return cache_key(map_identity(landcover_map), grass.region(),
+                         split_window_lst.emissivity_lookup_digest())
+
+    def lookup(self, digest, outnames):
+        """
+        Copy cached emissivity maps to the requested output maps
+
+        Parameters
+        ----------
+        outnames
+            A dictionary of emissivities to output map names
+
+        Returns
+        -------
+        A dictionary of the emissivities and output map names not found in
+        the cache
+        """
+        missing = {}
+        found = []
+        with index_lock(self.index_path):
+            index = self._read_index()
+            cached = index.get(digest, {'maps': {}})['maps']
+            for emissivity, outname in outnames.items():
+                mapname = cached.get(emissivity)
+                if mapname and grass.find_file(name=mapname,
+                                               element='cell')['file']:
+                    run('g.copy', raster=(mapname, outname), overwrite=True)
+                    found.append(emissivity)
+                else:
+                    missing[emissivity] = outname
+            if found:
+                touch(index, digest)
+                self._write_index(index)
+        if found:
+            msg = ('\n|i Copied cached ' + ', '.join(found) + ' emissivity '
+                   'maps')
+            g.message(msg)
+        return missing
+
+    def store(self, digest, outnames):
+        """
+        Copy derived emissivity maps in to the cache, evicting the least
+        recently used entries beyond the cache size
+
+        Parameters
+        ----------
+        outnames
+            A dictionary of emissivities to the names of the derived maps
+        """
+        with index_lock(self.index_path):
+            index = self._read_index()
+            entry = touch(index, digest, outnames)
+            for emissivity, outname in outnames.items():
+                run('g.copy', raster=(outname, entry['maps'][emissivity]),
+                    overwrite=True)
+            evicted = evict(index, self.size)
+            if evicted:
+                run('g.remove', flags='f', type='raster', name=evicted)
+            self._write_index(index)
+
+
+class StageCache():
+    """
+    A record of the provenance digests of the outputs of processing stages,
+    in the current mapset
+    """
+
+    def __init__(self, index_path=None, reuse=True):
+        """
+        Parameters
+        ----------
+        index_path
+            Path to the JSON index, by default in the current mapset's
+            directory
+
+        reuse
+            Whether to skip stages whose outputs are current, also if
+            overwriting outputs is requested, as rerunning over existing
+            outputs requires. If False, all stages run and their outputs are
+            recorded for subsequent runs.
+        """
+        self.index_path = index_path or mapset_path(STAGE_INDEX)
+        self.reuse = reuse
+        self.index = read_index(self.index_path)
+        self.code = code_digest()
+        self.region = region_identity()
+
+    def digest(self, stage, **provenance):
+        """
+        Return the provenance digest of the outputs of a stage, within the
+        current computational region and for the current code. See
+        provenance_digest().
+        """
+        return provenance_digest(stage, code=self.code, region=self.region,
+                                 **provenance)
+
+    def is_current(self, mapnames, digest):
+        """
+        Return True if all maps exist, unmodified since they were recorded
+        with the given digest
+        """
+        for mapname in mapnames:
+            identity = map_identity(mapname)
+            record = self.index.get(mapname)
+            if not (identity and record and record['digest'] == digest
+                    and record['identity'] == identity):
+                return False
+        return True
+
+    def skip(self, mapnames, digest, stage, reads=()):
+        """
+        Return True, reporting it, if the outputs of a stage are current
+
+        Parameters
+        ----------
+        reads
+            Maps of the stage read by later stages. Unless all of them are
+            named among the outputs, the stage is not skipped, as temporary
+            maps do not outlive a run.
+        """
+        if not self.reuse:
+            return False
+        mapnames = [mapname for mapname in mapnames if mapname]
+        if not all(mapname in mapnames for mapname in reads):
+            return False
+        if mapnames and self.is_current(mapnames, digest):
+            msg = (f'\n|i Skipping {stage}, reusing the up to date maps '
+                   + ', '.join(mapnames))
+            g.message(msg)
+            return True
+        return False
+
+    def record(self, mapnames, digest):
+        """
+        Record the provenance digest of existing maps, merged in to the
+        index as currently written, which concurrent runs may have updated.
+        The index is locked while read, updated and written.
+        """
+        records = {}
+        for mapname in mapnames:
+            if not mapname:
+                continue
+            identity = map_identity(mapname)
+            if identity:
+                records[mapname] = {'digest': digest, 'identity': identity}
+        with index_lock(self.index_path):
+            self.index = read_index(self.index_path)
+            self.index.update(records)
+            write_index(self.index_path, self.index)
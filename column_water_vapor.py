@@ -15,14 +15,27 @@ from constants import DUMMY_Ti_MEDIAN
 from constants import DUMMY_Tj_MEDIAN
 from constants import DUMMY_Rji
 from constants import EQUATION
-from constants import NUMERATOR
-from constants import DENOMINATOR_Ti
-from constants import DENOMINATOR_Tj
+from expressions import Variable
+from expressions import evaluate
+from expressions import function
+from expressions import summation
+from expressions import memoise
 from randomness import random_adjacent_pixel_values
 from grass.pygrass.modules.shortcuts import general as g
 from dummy_mapcalc_strings import replace_dummies
 import grass.script as grass
 from helpers import run
+from helpers import open_raster_rows
+from helpers import read_raster_rows
+from helpers import write_raster_row
+from helpers import tmp_map_name
+from helpers import region_override
+import math
+
+CWV_ENGINES = ('mapcalc', 'separable', 'numpy', 'neighbors')
+SEPARABLE_WINDOW_SIZE = 11  # from this size on, 'mapcalc' goes 'separable'
+BLOCK_ROWS = 1024
+TEMPERATURE_OFFSET = 290  # Kelvin, centers moments of brightness temperatures
 
 class Column_Water_Vapor():
     """
@@ -110,8 +123,29 @@ class Column_Water_Vapor():
     Canada, July 2014; pp. 3045–3048.
     """
 
-    def __init__(self, window_size, ti, tj):
+    def __init__(self, window_size, ti, tj, window_stride=1,
+                 min_valid_fraction=1.0, mask=None):
         """
+        Parameters
+        ----------
+        window_size
+            Odd number n sizing an n^2 spatial window
+
+        ti, tj
+            Names of the brightness temperature maps
+
+        window_stride
+            Use only every k-th row and column offset of the window
+
+        min_valid_fraction
+            Fraction of the adjacent pixels that need to be valid (not NULL
+            in either Ti or Tj) for a pixel to get a column water vapor value.
+            Window statistics are then normalised by the count of valid
+            pixels. The default of 1 requires complete windows.
+
+        mask
+            An optional CloudMask. Masked pixels of Ti and Tj read as NULL,
+            the mask predicate tested at each adjacent pixel.
         """
 
         # citation
@@ -136,22 +170,26 @@ class Column_Water_Vapor():
         self.window_size = window_size
         self.window_height = self.window_size
         self.window_width = self.window_size
+        assert 1 <= window_stride < window_size // 2, \
+            "Window stride should be positive and smaller than half the window size."
+        self.window_stride = window_stride
         self.adjacent_pixels = self._derive_adjacent_pixels()
+        assert 0 < min_valid_fraction <= 1, \
+            "Minimum fraction of valid pixels should be in (0, 1]."
+        self.min_valid_fraction = min_valid_fraction
+        self.min_valid_count = max(
+                math.ceil(min_valid_fraction * len(self.adjacent_pixels)), 1)
+        self.window_radius = max(abs(offset)
+                                 for pixel in self.adjacent_pixels
+                                 for offset in pixel)
 
         # maps for transmittance
         self.ti = ti
         self.tj = tj
+        self.mask = mask
 
-        # mapcalc modifiers to access neighborhood pixels
-        self.modifiers_ti = self._derive_modifiers(self.ti)
-        self.modifiers_tj = self._derive_modifiers(self.tj)
-        self.modifiers = list(zip(self.modifiers_ti, self.modifiers_tj))
-
-        # mapcalc expression for means; medians
-        self.mean_ti_expression = self._mean_tirs_expression(self.modifiers_ti)
-        self.mean_tj_expression = self._mean_tirs_expression(self.modifiers_tj)
-        self.median_ti_expression = self._median_tirs_expression(self.modifiers_ti)
-        self.median_tj_expression = self._median_tirs_expression(self.modifiers_tj)
+        # mapcalc modifiers and expressions for means; medians are built
+        # lazily, see the properties below
 
         # mapcalc expression for ratio ji
         self.ratio_ji_expression = str()
@@ -163,7 +201,7 @@ class Column_Water_Vapor():
         """
         The object's self string
         """
-        msg = (f'- Window size: {self.window_size} by + {self.window_size}'
+        msg = (f'- Window size: {self.window_size} by {self.window_size}\n'
         '- Expression for r.mapcalc to determine column water vapor: ')
         return msg + str(self.column_water_vapor_expression)
 
@@ -203,6 +241,14 @@ class Column_Water_Vapor():
         [-1, -1] [-1, 0] [-1, 1]
         [ 0, -1] [ 0, 0] [ 0, 1]
         [ 1, -1] [ 1, 0] [ 1, 1]
+
+        For a window stride k > 1, only offsets that are multiples of k are
+        kept. The spatial footprint of the window remains the same while the
+        number of adjacent pixels drops by about k^2, for example for k = 2:
+
+        [-2, -2] [-2, 0] [-2, 2]
+        [ 0, -2] [ 0, 0] [ 0, 2]
+        [ 2, -2] [ 2, 0] [ 2, 2]
         """
         # center row indexing
         half_height = (self.window_height - 1) // 2
@@ -210,27 +256,105 @@ class Column_Water_Vapor():
         # center col indexing
         half_width = (self.window_width - 1) // 2
 
+        stride = self.window_stride
         return [[col, row]
                 for col in range(-half_width + 1, half_width)
-                for row in range(-half_height + 1, half_height)]
+                for row in range(-half_height + 1, half_height)
+                if col % stride == 0 and row % stride == 0]
+
+    def _expression_key(self):
+        """
+        Return the attributes which determine the expressions built by an
+        object, keying the caches of memoised methods
+        """
+        return (self.window_size,
+                self.window_stride,
+                self.min_valid_count,
+                self.ti,
+                self.tj,
+                None if not self.mask or self.mask.empty
+                else self.mask.mask_map)
+
+    @property
+    def modifiers_ti(self):
+        """
+        Mapcalc modifiers to access the adjacent pixels of Ti
+        """
+        return self._derive_modifiers(self.ti)
+
+    @property
+    def modifiers_tj(self):
+        """
+        Mapcalc modifiers to access the adjacent pixels of Tj
+        """
+        return self._derive_modifiers(self.tj)
+
+    @property
+    def modifiers(self):
+        """
+        Pairs of mapcalc modifiers to access the adjacent pixels of Ti, Tj
+        """
+        return list(zip(self.modifiers_ti, self.modifiers_tj))
+
+    @property
+    def column_water_vapor_expression(self):
+        """
+        Mapcalc expression for column water vapor, based on window means
+        """
+        return self._cwv_expression_mean()
+
+    @property
+    def mean_ti_expression(self):
+        return self._window_statistic_expression('mean', self.ti)
+
+    @property
+    def mean_tj_expression(self):
+        return self._window_statistic_expression('mean', self.tj)
 
+    @property
+    def median_ti_expression(self):
+        return self._window_statistic_expression('median', self.ti)
+
+    @property
+    def median_tj_expression(self):
+        return self._window_statistic_expression('median', self.tj)
+
+    @memoise
+    def _window_statistic_expression(self, statistic, tx):
+        """
+        Return the mapcalc expression for the window 'mean' or 'median' of
+        the input map tx
+        """
+        modifiers = self._derive_modifiers(tx)
+        if statistic == 'median':
+            return self._median_tirs_expression(modifiers)
+        return self._mean_tirs_expression(modifiers)
+
+    @memoise
     def _derive_modifiers(self, tx):
         """
         Return mapcalc map modifiers for adjacent pixels for the input map tx
         """
-        return [tx + str(pixel)
+        return [self._cell(tx, str(pixel))
                 for pixel
                 in self.adjacent_pixels]
 
+    def _cell(self, tx, modifier=''):
+        """
+        Return a mapcalc reference to a pixel of the input map tx, offset by
+        a neighborhood modifier, NULL if masked
+        """
+        if self.mask:
+            return self.mask.apply(tx + modifier, modifier)
+        return tx + modifier
+
     def _mean_tirs_expression(self, modifiers):
         """
         Return mapcalc expression for window means based on the given mapcalc
         pixel modifiers.
         """
-        tx_sum = '(' + ' + '.join(modifiers) + ')'
-        tx_length = len(modifiers)
-        tx_mean_expression = f'{tx_sum} / {tx_length}'
-        return tx_mean_expression
+        tx_mean = summation(modifiers) / len(modifiers)
+        return str(tx_mean)
 
     def _median_tirs_expression(self, modifiers):
         """
@@ -246,9 +370,188 @@ class Column_Water_Vapor():
             A mapcalc expression for window medians based on the given mapcalc
             pixel modifiers.
         """
-        modifiers = ', '.join(modifiers)
-        tx_median_expression = f'median({modifiers})'
-        return tx_median_expression
+        return str(function('median', *modifiers))
+
+    def _derive_row_offsets(self):
+        """
+        Return the distinct offsets, along a single row or column, of the
+        adjacent pixels. The window of adjacent pixels is their outer product.
+        """
+        return sorted({pixel[1] for pixel in self.adjacent_pixels})
+
+    def _row_sum_expressions(self, offset=TEMPERATURE_OFFSET, tj_tj=False):
+        """
+        Return mapcalc expressions for the row-direction partial sums of the
+        window moments Ti, Tj, Ti^2 and Ti * Tj, and optionally Tj^2, each
+        centered on 'offset'. Each expression sums n neighbors of the same
+        row.
+
+        Unless complete windows are required, terms of pixels that are NULL
+        in either Ti or Tj count as 0 and an additional 'count' expression
+        sums the valid pixels.
+
+        Returns
+        -------
+        A dictionary of mapcalc expressions keyed by moment name
+        """
+        offsets = self._derive_row_offsets()
+        ti_cells = [self._cell(self.ti, f'[0,{col}]') for col in offsets]
+        tj_cells = [self._cell(self.tj, f'[0,{col}]') for col in offsets]
+        ti_terms = [f'({ti} - {offset})' for ti in ti_cells]
+        tj_terms = [f'({tj} - {offset})' for tj in tj_cells]
+        terms = {
+                'ti': ti_terms,
+                'tj': tj_terms,
+                'ti_ti': [f'{ti}^2' for ti in ti_terms],
+                'ti_tj': [f'{ti} * {tj}' for ti, tj in zip(ti_terms, tj_terms)],
+        }
+        if tj_tj:
+            terms['tj_tj'] = [f'{tj}^2' for tj in tj_terms]
+        if self.masked:
+            nulls = [f'isnull({ti} + {tj})'
+                     for ti, tj in zip(ti_cells, tj_cells)]
+            terms = {moment: [f'if({null}, 0, {term})'
+                              for null, term in zip(nulls, moment_terms)]
+                     for moment, moment_terms in terms.items()}
+            terms['count'] = [f'!{null}' for null in nulls]
+        return {moment: ' + '.join(moment_terms)
+                for moment, moment_terms in terms.items()}
+
+    @property
+    def masked(self):
+        """
+        Whether windows may hold NULL pixels, i.e. whether window statistics
+        are normalised by the count of valid pixels
+        """
+        return self.min_valid_count < len(self.adjacent_pixels)
+
+    def _column_sum_expression(self, row_sums):
+        """
+        Return a mapcalc expression summing the row-direction partial sums
+        of the map 'row_sums' along the column, completing a window sum.
+        """
+        offsets = self._derive_row_offsets()
+        if self.masked:
+            # outside the region
+            return ' + '.join(
+                    f'if(isnull({row_sums}[{row},0]), 0, {row_sums}[{row},0])'
+                    for row in offsets)
+        return ' + '.join(f'{row_sums}[{row},0]' for row in offsets)
+
+    def _masked_median_expression(self, tx, ty):
+        """
+        Return a mapcalc expression for the window median of tx over pixels
+        that are valid in both tx and ty
+        """
+        modifiers = ', '.join(
+                f'if(isnull({self._cell(ty, str(pixel))}), null(), '
+                f'{self._cell(tx, str(pixel))})'
+                for pixel in self.adjacent_pixels)
+        return f'nmedian({modifiers})'
+
+    def _window_median_expressions(self):
+        """
+        Return mapcalc expressions for the window medians of Ti and Tj, keyed
+        by 'median_ti' and 'median_tj'. Unless complete windows are required,
+        over the pixels valid in both Ti and Tj.
+        """
+        if self.masked:
+            return {
+                    'median_ti': self._masked_median_expression(self.ti, self.tj),
+                    'median_tj': self._masked_median_expression(self.tj, self.ti),
+            }
+        return {
+                'median_ti': self._median_tirs_expression(self.modifiers_ti),
+                'median_tj': self._median_tirs_expression(self.modifiers_tj),
+        }
+
+    def _separable_bindings(self, row_sums, offset=TEMPERATURE_OFFSET):
+        """
+        Return the eval() bindings shared by _cwv_expression_separable() and
+        _accuracy_expression_separable(): the window sums, the 'numerator'
+        and the 'denominator' of Rji and, given row sums of Tj^2, the
+        'denominator_ij' of Rij.
+        """
+        moments = ['ti', 'tj', 'ti_ti', 'ti_tj']
+        if 'tj_tj' in row_sums:
+            moments.append('tj_tj')
+        sums = {moment: self._column_sum_expression(row_sums[moment])
+                for moment in moments}
+        count = len(self.adjacent_pixels)
+        bindings = (f'\\ \n  si = {sums["ti"]},'
+                    f'\\ \n  sj = {sums["tj"]},'
+                    f'\\ \n  sii = {sums["ti_ti"]},'
+                    f'\\ \n  sij = {sums["ti_tj"]},')
+        if 'tj_tj' in sums:
+            bindings += f'\\ \n  sjj = {sums["tj_tj"]},'
+        if self.masked:
+            count_sum = self._column_sum_expression(row_sums['count'])
+            bindings += f'\\ \n  n = {count_sum},'
+            count = 'n'
+        if 'median_ti' in row_sums:
+            bindings += (f'\\ \n  ai = {row_sums["median_ti"]} - {offset},'
+                         f'\\ \n  aj = {row_sums["median_tj"]} - {offset},'
+                         '\\ \n  numerator = sij - aj * si - ai * sj'
+                         f' + {count} * ai * aj,'
+                         '\\ \n  denominator = sii - 2 * ai * si'
+                         f' + {count} * ai^2,')
+            if 'tj_tj' in sums:
+                bindings += ('\\ \n  denominator_ij = sjj - 2 * aj * sj'
+                             f' + {count} * aj^2,')
+        else:
+            bindings += (f'\\ \n  numerator = sij - si * sj / {count},'
+                         f'\\ \n  denominator = sii - si^2 / {count},')
+            if 'tj_tj' in sums:
+                bindings += f'\\ \n  denominator_ij = sjj - sj^2 / {count},'
+        return bindings
+
+    def _cwv_expression_separable(self, row_sums, offset=TEMPERATURE_OFFSET):
+        """
+        Build and return a mapcalc expression for Column Water Vapor from maps
+        of row-direction partial sums (see _row_sum_expressions()). Each
+        window moment costs n neighbor reads along the column here, plus n
+        along the row for the partial sums, instead of the n^2 neighbor reads
+        of each term in _cwv_expression_mean().
+
+        Parameters
+        ----------
+        row_sums
+            A dictionary of map names of the row-direction partial sums,
+            keyed by moment name ('ti', 'tj', 'ti_ti', 'ti_tj', optionally
+            'tj_tj' and 'count'). Window median maps keyed by 'median_ti'
+            and 'median_tj', if present, replace the window means. The
+            medians are not separable, yet they are computed only once per
+            pixel.
+
+        Returns
+        -------
+        cwv_expression
+            A mapcalc expression
+        """
+        cwv = self._cwv_model('rji')
+        if self.masked:
+            cwv = f'if(n < {self.min_valid_count}, null(), {cwv})'
+        cwv_expression = ('eval('
+               f'{self._separable_bindings(row_sums, offset)}'
+               '\\ \n  rji = numerator / denominator,'
+               f'\\ \n  {cwv})')
+        return cwv_expression
+
+    def _accuracy_expression_separable(self, row_sums,
+                                       offset=TEMPERATURE_OFFSET):
+        """
+        Build and return a mapcalc expression for the retrieval accuracy
+        Rji * Rij from the same maps of row-direction partial sums as
+        _cwv_expression_separable(), which need to include the sums of Tj^2.
+        See _compute_retrieval_accuracy().
+        """
+        accuracy = 'numerator^2 / (denominator * denominator_ij)'
+        if self.masked:
+            accuracy = f'if(n < {self.min_valid_count}, null(), {accuracy})'
+        accuracy_expression = ('eval('
+               f'{self._separable_bindings(row_sums, offset)}'
+               f'\\ \n  {accuracy})')
+        return accuracy_expression
 
     def _numerator_for_ratio(self, ti_m, tj_m):
         """
@@ -287,34 +590,32 @@ class Column_Water_Vapor():
                 tj_m = median_tj,
             )
         """
-        numerator = ' + '.join([NUMERATOR.format(Ti=modifier_ti,
-                                        Tim=ti_m,
-                                        Tj=modifier_tj,
-                                        Tjm=tj_m)
-                            for modifier_ti, modifier_tj
-                            in self.modifiers])
-        return numerator
+        ti_m = Variable(ti_m)
+        tj_m = Variable(tj_m)
+        numerator = summation((Variable(modifier_ti) - ti_m)
+                              * (Variable(modifier_tj) - tj_m)
+                              for modifier_ti, modifier_tj
+                              in self.modifiers)
+        return str(numerator)
 
     def _denominator_for_ratio_ji(self, ti_m):
         """
         Denominator for Ratio ji which is:
         Sum ( (Tik - Ti_mean)^2 )
         """
-        denominator_ji = ' + '.join([DENOMINATOR_Ti.format(Ti=modifier_ti,
-                                        Tim=ti_m)
-                            for modifier_ti
-                            in self.modifiers_ti])
-        return denominator_ji
+        ti_m = Variable(ti_m)
+        denominator_ji = summation((Variable(modifier_ti) - ti_m) ** 2
+                                   for modifier_ti in self.modifiers_ti)
+        return str(denominator_ji)
 
     def _denominator_for_ratio_ij(self, tj_m):
         """
         Denominator for Ratio ij.
         """
-        denominator_ij = ' + '.join([DENOMINATOR_Tj.format(Tj=modifier_tj,
-                                        Tjm=tj_m)
-                            for modifier_tj
-                            in self.modifiers_tj])
-        return denominator_ij
+        tj_m = Variable(tj_m)
+        denominator_ij = summation((Variable(modifier_tj) - tj_m) ** 2
+                                   for modifier_tj in self.modifiers_tj)
+        return str(denominator_ij)
 
     def _ratio_ji_expression(self, statistic):
         """
@@ -361,17 +662,15 @@ class Column_Water_Vapor():
         self.ratio_ij_expression = rij
         return rij
 
+    @memoise
     def _cwv_expression_mean(self):
         """
         Build and return a valid mapcalc expression for deriving a Column
         Water Vapor map from Landsat8's brightness temperature channels
         B10, B11 based on the MSWCVM method (see citation).
         """
-        modifiers_ti = self._derive_modifiers(self.ti)
-        ti_mean = self._mean_tirs_expression(modifiers_ti)
-
-        modifiers_tj = self._derive_modifiers(self.tj)
-        tj_mean = self._mean_tirs_expression(modifiers_tj)
+        ti_mean = self.mean_ti_expression
+        tj_mean = self.mean_tj_expression
 
         numerator = self._numerator_for_ratio(
                         ti_m=DUMMY_Ti_MEAN,
@@ -385,20 +684,18 @@ class Column_Water_Vapor():
                f'\ \n  numerator = {numerator},'
                f'\ \n  denominator = {denominator},'
                '\ \n  rji = numerator / denominator,'
-               f'\ \n  {self.c0} + {self.c1} * (rji) + {self.c2} * (rji)^2)')
+               f'\ \n  {self._cwv_model("rji")})')
         return cwv_expression
 
+    @memoise
     def _cwv_expression_mean_ij(self):
         """
         Build and return a valid mapcalc expression for deriving a Column
         Water Vapor map from Landsat8's brightness temperature channels
         B10, B11 based on the MSWCVM method (see citation).
         """
-        modifiers_ti = self._derive_modifiers(self.ti)
-        ti_mean = self._mean_tirs_expression(modifiers_ti)
-
-        modifiers_tj = self._derive_modifiers(self.tj)
-        tj_mean = self._mean_tirs_expression(modifiers_tj)
+        ti_mean = self.mean_ti_expression
+        tj_mean = self.mean_tj_expression
 
         numerator = self._numerator_for_ratio(
                         ti_m=DUMMY_Ti_MEAN,
@@ -412,20 +709,18 @@ class Column_Water_Vapor():
                f'\ \n  numerator = {numerator},'
                f'\ \n  denominator = {denominator},'
                '\ \n  rji = numerator / denominator,'
-               f'\ \n  {self.c0} + {self.c1} * (rji) + {self.c2} * (rji)^2)')
+               f'\ \n  {self._cwv_model("rji")})')
         return cwv_expression
 
+    @memoise
     def _cwv_expression_median(self):
         """
         Build and return a valid mapcalc expression for deriving a Column
         Water Vapor map from Landsat8's brightness temperature channels
         B10, B11 based on the MSWCVM method (see citation).
         """
-        modifiers_ti = self._derive_modifiers(self.ti)
-        ti_median = self._median_tirs_expression(modifiers_ti)
-
-        modifiers_tj = self._derive_modifiers(self.tj)
-        tj_median = self._median_tirs_expression(modifiers_tj)
+        ti_median = self.median_ti_expression
+        tj_median = self.median_tj_expression
 
         numerator = self._numerator_for_ratio(
                         ti_m=DUMMY_Ti_MEDIAN,
@@ -439,20 +734,18 @@ class Column_Water_Vapor():
                f'\ \n  numerator = {numerator},'
                f'\ \n  denominator = {denominator},'
                '\ \n  rji = numerator / denominator,'
-               f'\ \n  {self.c0} + {self.c1} * (rji) + {self.c2} * (rji)^2)')
+               f'\ \n  {self._cwv_model("rji")})')
         return cwv_expression
 
+    @memoise
     def _cwv_expression_median_ij(self):
         """
         Build and return a valid mapcalc expression for deriving a Column
         Water Vapor map from Landsat8's brightness temperature channels
         B10, B11 based on the MSWCVM method (see citation).
         """
-        modifiers_ti = self._derive_modifiers(self.ti)
-        ti_median = self._median_tirs_expression(modifiers_ti)
-
-        modifiers_tj = self._derive_modifiers(self.tj)
-        tj_median = self._median_tirs_expression(modifiers_tj)
+        ti_median = self.median_ti_expression
+        tj_median = self.median_tj_expression
 
         numerator = self._numerator_for_ratio(
                         ti_m=DUMMY_Ti_MEDIAN,
@@ -466,50 +759,372 @@ class Column_Water_Vapor():
                f'\ \n  numerator = {numerator},'
                f'\ \n  denominator = {denominator},'
                '\ \n  rji = numerator / denominator,'
-               f'\ \n  {self.c0} + {self.c1} * (rji) + {self.c2} * (rji)^2)')
+               f'\ \n  {self._cwv_model("rji")})')
         return cwv_expression
 
-    def _compute_retrieval_accuracy(self, **kwargs):
+    def _sums_of_products_from_moments(self, moments, medians=None):
         """
+        Return the sums of products of deviations from window moments (see
+        window_moments.py) based on the covariance identities:
+
+            SUM [(Tik - Ti_mean) * (Tjk - Tj_mean)] =
+                SUM [Tik * Tjk] - SUM [Tik] * SUM [Tjk] / N
+
+            SUM [(Tik - Ti_mean)^2] = SUM [Tik^2] - SUM [Tik]^2 / N
+
+        or, given the window medians (Ti_median, Tj_median) shifted by the
+        same offsets as the moments:
+
+            SUM [(Tik - Ti_median) * (Tjk - Tj_median)] =
+                SUM [Tik * Tjk] - Tj_median * SUM [Tik]
+                - Ti_median * SUM [Tjk] + N * Ti_median * Tj_median
+
+            SUM [(Tik - Ti_median)^2] =
+                SUM [Tik^2] - 2 * Ti_median * SUM [Tik] + N * Ti_median^2
+
+        where N is the count of valid cells in each window.
+
+        Returns
+        -------
+        A tuple (numerator, denominator_ji, denominator_ij) of the sums of
+        (Tik - Ti_m) * (Tjk - Tj_m), (Tik - Ti_m)^2 and (Tjk - Tj_m)^2. The
+        latter is None unless the moments hold sums of Tj^2.
         """
-        if 'mean' in kwargs:
-            numerator_ji = self._numerator_for_ratio(
-                            ti_m=DUMMY_Ti_MEAN,
-                            tj_m=DUMMY_Tj_MEAN,
-                        )
-            numerator_ij = numerator_ji
-            denominator_ji = self._denominator_for_ratio_ji(ti_m=DUMMY_Ti_MEAN)
-            denominator_ij = self._denominator_for_ratio_ij(tj_m=DUMMY_Tj_MEAN)
+        import numpy
+        count = moments.count
+        denominator_ij = None
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            if medians:
+                median_ti, median_tj = medians
+                numerator = (moments.ti_tj
+                             - median_tj * moments.ti
+                             - median_ti * moments.tj
+                             + count * median_ti * median_tj)
+                denominator_ji = (moments.ti_ti
+                                  - 2 * median_ti * moments.ti
+                                  + count * median_ti ** 2)
+                if moments.tj_tj is not None:
+                    denominator_ij = (moments.tj_tj
+                                      - 2 * median_tj * moments.tj
+                                      + count * median_tj ** 2)
+            else:
+                numerator = moments.ti_tj - moments.ti * moments.tj / count
+                denominator_ji = moments.ti_ti - moments.ti ** 2 / count
+                if moments.tj_tj is not None:
+                    denominator_ij = moments.tj_tj - moments.tj ** 2 / count
+        return numerator, denominator_ji, denominator_ij
+
+    def _ratio_ji_from_moments(self, moments, medians=None):
+        """
+        Return the Ratio ji from window moments, see
+        _sums_of_products_from_moments().
+
+        Pixels with fewer than 'min_valid_count' valid cells, either because
+        of NULL cells or because the window exceeds the region, are set to
+        NaN. By default, this is any incomplete window, as r.mapcalc does for
+        the expressions built by _cwv_expression_mean() and
+        _cwv_expression_median().
+        """
+        import numpy
+        numerator, denominator, _ = self._sums_of_products_from_moments(
+                moments,
+                medians,
+        )
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            ratio_ji = numerator / denominator
+        incomplete = (moments.count < self.min_valid_count) | (denominator == 0)
+        ratio_ji[incomplete] = numpy.nan
+        return ratio_ji
 
-        if 'median' in kwargs:
-            numerator_ji = self._numerator_for_ratio(
-                            ti_m=DUMMY_Ti_MEDIAN,
-                            tj_m=DUMMY_Tj_MEDIAN,
-                        )
-            numerator_ij = numerator_ji
-            denominator_ji = self._denominator_for_ratio_ji(ti_m=DUMMY_Ti_MEDIAN)
-            denominator_ij = self._denominator_for_ratio_ij(tj_m=DUMMY_Tj_MEDIAN)
+    def _compute_retrieval_accuracy(self, moments, medians=None):
+        """
+        Return the retrieval accuracy, that is the product of the ratios
 
-        ratio_ji = numerator_ji / denominator_ji
-        ratio_ij = numerator_ij / denominator_ij
-        x2 = ratio_ji * ratio_ij
-        self.retrieval_accuracy = x2
+            Rji * Rij = SUM [(Tik - Ti_m) * (Tjk - Tj_m)]^2 /
+                (SUM [(Tik - Ti_m)^2] * SUM [(Tjk - Tj_m)^2])
 
-        return ratio_ji * ratio_ij
+        from window moments that include the sums of Tj^2. For window means,
+        this is the squared correlation coefficient r^2 of Ti and Tj. Values
+        close to 1 indicate a reliable estimation of column water vapor.
+        """
+        import numpy
+        numerator, denominator_ji, denominator_ij = \
+                self._sums_of_products_from_moments(moments, medians)
+        denominator = denominator_ji * denominator_ij
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            accuracy = numerator ** 2 / denominator
+        incomplete = (moments.count < self.min_valid_count) | (denominator == 0)
+        accuracy[incomplete] = numpy.nan
+        return accuracy
+
+    def _cwv_model(self, ratio_ji):
+        """
+        Return the expression tree (see expressions.py) of column water vapor
+        for the named Ratio ji: c0 + c1 * Rji + c2 * Rji^2
+        """
+        ratio_ji = Variable(ratio_ji)
+        return self.c0 + self.c1 * ratio_ji + self.c2 * ratio_ji ** 2
 
-    def _retrieval_accuracy_expression_mean():
+    def _cwv_from_ratio(self, ratio_ji):
+        """
+        Return column water vapor values for the given Ratio ji values
+        """
+        return evaluate(self._cwv_model('rji'), {'rji': ratio_ji})
+
+    def _moment_bindings(
+            self,
+            mean_ti,
+            mean_tj,
+            mean_ti_tj,
+            mean_ti_ti,
+            mean_tj_tj=None,
+            median_ti=None,
+            median_tj=None,
+            offset=TEMPERATURE_OFFSET,
+        ):
         """
+        Return the eval() bindings shared by _cwv_expression_from_moments()
+        and _accuracy_expression_from_moments(): the 'numerator' and the
+        'denominator' of Rji and, given window means of Tj^2, the
+        'denominator_ij' of Rij.
         """
-        ratio_ji = self._cwv_expression_mean()
-        ratio_ij = self._cwv_expression_mean_ij
-        return ratio_ji * ratio_ij
+        bindings = (f'\\ \n  mi = {mean_ti} - {offset},'
+                    f'\\ \n  mj = {mean_tj} - {offset},')
+        if median_ti and median_tj:
+            bindings += (f'\\ \n  ai = {median_ti} - {offset},'
+                         f'\\ \n  aj = {median_tj} - {offset},'
+                         f'\\ \n  numerator = {mean_ti_tj} - aj * mi - ai * mj + ai * aj,'
+                         f'\\ \n  denominator = {mean_ti_ti} - 2 * ai * mi + ai^2,')
+            if mean_tj_tj:
+                bindings += f'\\ \n  denominator_ij = {mean_tj_tj} - 2 * aj * mj + aj^2,'
+        else:
+            bindings += (f'\\ \n  numerator = {mean_ti_tj} - mi * mj,'
+                         f'\\ \n  denominator = {mean_ti_ti} - mi^2,')
+            if mean_tj_tj:
+                bindings += f'\\ \n  denominator_ij = {mean_tj_tj} - mj^2,'
+        return bindings
+
+    def _cwv_expression_from_moments(
+            self,
+            count,
+            mean_ti,
+            mean_tj,
+            mean_ti_tj,
+            mean_ti_ti,
+            median_ti=None,
+            median_tj=None,
+            offset=TEMPERATURE_OFFSET,
+        ):
+        """
+        Build and return a short mapcalc expression deriving Column Water
+        Vapor from maps of window moments, as opposed to the neighborhood
+        modifiers of _cwv_expression_mean() and _cwv_expression_median().
+
+        The products of brightness temperatures are expected to be centered
+        on 'offset', i.e. mean_ti_tj is the window mean of
+        (Ti - offset) * (Tj - offset). The window means and medians of Ti and
+        Tj are plain. Based on the covariance identities, for the mean:
+
+            SUM [(Tik - Ti_mean) * (Tjk - Tj_mean)] / N =
+                mean(Ti * Tj) - mean(Ti) * mean(Tj)
+
+        and for the median:
+
+            SUM [(Tik - Ti_median) * (Tjk - Tj_median)] / N =
+                mean(Ti * Tj) - Tj_median * mean(Ti) - Ti_median * mean(Tj)
+                + Ti_median * Tj_median
+
+        Parameters
+        ----------
+        count
+            Map of the number of valid pixels in each window
+
+        mean_ti, mean_tj
+            Maps of window means of Ti and Tj
 
-    def _retrieval_accuracy_expression_median():
+        mean_ti_tj, mean_ti_ti
+            Maps of window means of the (centered) products Ti * Tj, Ti^2
+
+        median_ti, median_tj
+            Maps of window medians of Ti and Tj, for the median based
+            estimation
+
+        Returns
+        -------
+        cwv_expression
+            A mapcalc expression
         """
+        bindings = self._moment_bindings(
+                mean_ti,
+                mean_tj,
+                mean_ti_tj,
+                mean_ti_ti,
+                median_ti=median_ti,
+                median_tj=median_tj,
+                offset=offset,
+        )
+        cwv_expression = ('eval('
+               f'{bindings}'
+               '\\ \n  rji = numerator / denominator,'
+               f'\\ \n  if({count} < {self.min_valid_count}, null(),'
+               f' {self._cwv_model("rji")}))')
+        return cwv_expression
+
+    def _accuracy_expression_from_moments(
+            self,
+            count,
+            mean_ti,
+            mean_tj,
+            mean_ti_tj,
+            mean_ti_ti,
+            mean_tj_tj,
+            median_ti=None,
+            median_tj=None,
+            offset=TEMPERATURE_OFFSET,
+        ):
+        """
+        Build and return a mapcalc expression for the retrieval accuracy
+        Rji * Rij from the same maps of window moments as
+        _cwv_expression_from_moments(), plus the window means of the
+        (centered) squares Tj^2. See _compute_retrieval_accuracy().
+        """
+        bindings = self._moment_bindings(
+                mean_ti,
+                mean_tj,
+                mean_ti_tj,
+                mean_ti_ti,
+                mean_tj_tj=mean_tj_tj,
+                median_ti=median_ti,
+                median_tj=median_tj,
+                offset=offset,
+        )
+        accuracy_expression = ('eval('
+               f'{bindings}'
+               f'\\ \n  if({count} < {self.min_valid_count}, null(),'
+               ' numerator^2 / (denominator * denominator_ij)))')
+        return accuracy_expression
+
+    def compute_column_water_vapor_array(
+            self,
+            ti,
+            tj,
+            median=False,
+            block_rows=BLOCK_ROWS,
+            accuracy=False,
+        ):
         """
-        ratio_ji = self._cwv_expression_median()
-        ratio_ij = self._cwv_expression_median_ij
-        return ratio_ji * ratio_ij
+        Compute column water vapor from NumPy arrays of brightness
+        temperatures based on summed-area tables. The cost per pixel is
+        independent of the window size. Window medians, if requested, are
+        derived from running histograms at a cost of O(n) per pixel.
+        The retrieval accuracy, if requested, costs a single additional
+        summed-area table of Tj^2.
+
+        Parameters
+        ----------
+        ti, tj
+            2D arrays of brightness temperatures, NULL cells as NaN
+
+        median
+            Use window medians instead of means of Ti and Tj
+
+        block_rows
+            Number of rows processed at once, bounding memory use for full
+            scenes
+
+        accuracy
+            Compute the retrieval accuracy as well, see
+            _compute_retrieval_accuracy()
+
+        Returns
+        -------
+        A 2D array of column water vapor values, NULL cells as NaN, or, if
+        'accuracy' is requested, a tuple of this and a 2D array of retrieval
+        accuracy values
+        """
+        results = compute_column_water_vapor_arrays(
+                [self],
+                ti,
+                tj,
+                median=median,
+                block_rows=block_rows,
+                accuracy=accuracy,
+        )
+        return results[0]
+
+
+def compute_column_water_vapor_arrays(
+        cwvs,
+        ti,
+        tj,
+        median=False,
+        block_rows=BLOCK_ROWS,
+        accuracy=False,
+    ):
+    """
+    Compute column water vapor for several window sizes from NumPy arrays of
+    brightness temperatures. The summed-area tables do not depend on the
+    window size, hence they are built once per block of rows and shared by
+    all windows. See Column_Water_Vapor.compute_column_water_vapor_array().
+
+    Parameters
+    ----------
+    cwvs
+        A sequence of Column_Water_Vapor objects of the same window stride
+
+    Returns
+    -------
+    A list of the results of compute_column_water_vapor_array() for each of
+    the Column_Water_Vapor objects
+    """
+    import numpy
+    from window_moments import moment_tables
+    from window_moments import moments_from_tables
+    from window_moments import window_median
+    from window_moments import row_blocks
+    stride = cwvs[0].window_stride
+    cwv_arrays = [numpy.empty(ti.shape, dtype=numpy.float64) for _ in cwvs]
+    if accuracy:
+        accuracy_arrays = [numpy.empty(ti.shape, dtype=numpy.float64)
+                           for _ in cwvs]
+    halo = max(cwv.window_radius for cwv in cwvs)
+    for read_start, read_end, start, end in row_blocks(
+            ti.shape[0], block_rows, halo):
+        block_ti = ti[read_start:read_end]
+        block_tj = tj[read_start:read_end]
+        tables, (offset_ti, offset_tj) = moment_tables(
+                block_ti,
+                block_tj,
+                stride=stride,
+                tj_tj=accuracy,
+        )
+        if median and any(cwv.masked for cwv in cwvs):
+            # medians over the cells valid in both bands
+            invalid = numpy.isnan(block_ti) | numpy.isnan(block_tj)
+            masked_ti = numpy.where(invalid, numpy.nan, block_ti)
+            masked_tj = numpy.where(invalid, numpy.nan, block_tj)
+        block = slice(start - read_start, end - read_start)
+        for index, cwv in enumerate(cwvs):
+            radius = cwv.window_radius
+            moments = moments_from_tables(tables, radius, stride)
+            medians = None
+            if median:
+                median_ti, median_tj = block_ti, block_tj
+                if cwv.masked:
+                    median_ti, median_tj = masked_ti, masked_tj
+                medians = (
+                    window_median(median_ti, radius, stride=stride) - offset_ti,
+                    window_median(median_tj, radius, stride=stride) - offset_tj,
+                )
+            ratio_ji = cwv._ratio_ji_from_moments(moments, medians)
+            cwv_arrays[index][start:end] = cwv._cwv_from_ratio(ratio_ji[block])
+            if accuracy:
+                accuracy_arrays[index][start:end] = \
+                        cwv._compute_retrieval_accuracy(moments, medians)[block]
+    if accuracy:
+        return list(zip(cwv_arrays, accuracy_arrays))
+    return cwv_arrays
+
 
 def estimate_cwv(
         temporary_map,
@@ -519,54 +1134,616 @@ def estimate_cwv(
         window_size,
         median=False,
         info=False,
+        engine='mapcalc',
+        nprocs=1,
+        cwv_resolution=None,
+        window_stride=1,
+        min_valid_fraction=1.0,
+        accuracy_map=None,
+        mask=None,
     ):
     """
-    Derive a column water vapor map using a single mapcalc expression based on
-    eval.
+    Derive a column water vapor map using either a single mapcalc expression
+    based on eval (engine='mapcalc'), two mapcalc passes of separable window
+    sums (engine='separable', also chosen by the 'mapcalc' engine for windows
+    of SEPARABLE_WINDOW_SIZE or larger), summed-area tables of the brightness
+    temperature maps in NumPy (engine='numpy') or window moment maps derived
+    via r.neighbors and combined in a short mapcalc expression
+    (engine='neighbors').
+
+    Given a 'cwv_resolution', column water vapor is estimated on a coarser
+    grid, aligned to the current region, from the average brightness
+    temperatures of each coarse cell, and bilinearly interpolated back to the
+    current region. The resolution should be larger than, ideally a multiple
+    of, the region's one. Note, the window size then counts coarse cells.
+
+    A 'min_valid_fraction' below 1 lets windows holding NULL pixels, such as
+    masked clouds or water, yield a value normalised by the count of their
+    valid pixels, so that NULL areas do not grow by the window radius. The
+    'mapcalc' engine then goes 'separable'.
+
+    Given an 'accuracy_map', the retrieval accuracy Rji * Rij is derived from
+    the same window moments as column water vapor, adding only those of
+    Tj^2. The 'mapcalc' engine then goes 'separable' too.
+
+    Given a CloudMask, 'mask', masked pixels of the brightness temperatures
+    read as NULL, via the mask predicate within the expressions or on the
+    arrays read.
 
             *** To Do: evaluate -- does it work correctly? *** !
     """
+    estimate_cwv_sweep(
+            temporary_maps=[temporary_map],
+            cwv_maps=[cwv_map],
+            t10=t10,
+            t11=t11,
+            window_sizes=[window_size],
+            median=median,
+            info=info,
+            engine=engine,
+            nprocs=nprocs,
+            cwv_resolution=cwv_resolution,
+            window_stride=window_stride,
+            min_valid_fraction=min_valid_fraction,
+            accuracy_maps=[accuracy_map],
+            mask=mask,
+    )
+
+
+def estimate_cwv_sweep(
+        temporary_maps,
+        cwv_maps,
+        t10,
+        t11,
+        window_sizes,
+        median=False,
+        info=False,
+        engine='mapcalc',
+        nprocs=1,
+        cwv_resolution=None,
+        window_stride=1,
+        min_valid_fraction=1.0,
+        accuracy_maps=None,
+        mask=None,
+    ):
+    """
+    Derive one column water vapor map for each of several window sizes in a
+    single sweep. See estimate_cwv() for the engines and options. The work
+    that does not depend on the window size is shared by all windows:
+
+    - numpy: the brightness temperature maps are read once and the
+      summed-area tables are built once per block of rows
+    - separable: the row sums of all windows are written in a single
+      r.mapcalc pass, the column sums and CWV (and accuracy) maps in another
+    - mapcalc: the expressions of all windows are evaluated in a single
+      r.mapcalc pass
+    - neighbors: the products of brightness temperatures are derived once
+    - coarse grid: the brightness temperatures are aggregated once
+
+    Parameters
+    ----------
+    temporary_maps, cwv_maps, accuracy_maps
+        Lists of output map names, one per window size. Items of cwv_maps and
+        accuracy_maps may be None.
+
+    window_sizes
+        A list of odd numbers n sizing n^2 spatial windows
+    """
+    if not accuracy_maps:
+        accuracy_maps = [None] * len(window_sizes)
+
+    if cwv_resolution:
+        _estimate_cwv_coarse(
+                temporary_maps,
+                cwv_maps,
+                t10,
+                t11,
+                window_sizes,
+                cwv_resolution,
+                median=median,
+                info=info,
+                engine=engine,
+                nprocs=nprocs,
+                window_stride=window_stride,
+                min_valid_fraction=min_valid_fraction,
+                accuracy_maps=accuracy_maps,
+                mask=mask,
+        )
+        return
+
+    if mask and mask.empty:
+        mask = None
+    cwvs = [Column_Water_Vapor(window_size, t10, t11, window_stride,
+                               min_valid_fraction, mask)
+            for window_size in window_sizes]
+    windows = ', '.join(f'{window_size}^2' for window_size in window_sizes)
+
     msg = "\n|i Estimating atmospheric column water vapor"
-    cwv = Column_Water_Vapor(window_size, t10, t11)
+    if len(window_sizes) > 1:
+        msg += f' for the spatial windows {windows}'
+    if mask:
+        msg += f'\n|! Masking {mask}'
+    if window_stride > 1:
+        msg += (f'\n|! Using every {window_stride}th row and column of the '
+                f'{windows} pixel neighborhood')
+    for cwv in cwvs:
+        if cwv.masked:
+            msg += (f'\n|! Requiring {cwv.min_valid_count} of '
+                    f'{len(cwv.adjacent_pixels)} valid pixels per window')
+    median_msg = f'\n|! Computing median value in a {windows} pixel neighborhood'
+
+    if engine == 'numpy':
+        msg += ' based on summed-area tables'
+        if median:
+            msg += (f'\n|! Computing running median values in a '
+                    f'{windows} pixel neighborhood')
+        g.message(msg)
+        _estimate_cwv_numpy(cwvs, temporary_maps, median, accuracy_maps)
+
+    elif engine == 'neighbors':
+        msg += ' based on r.neighbors window moments'
+        if median:
+            msg += median_msg
+        g.message(msg)
+        _estimate_cwv_neighbors(cwvs, temporary_maps, median, nprocs,
+                                accuracy_maps)
 
-    if median:
-        msg += f'\n|! Computing median value in a {window_size}^2 pixel neighborhood'
-        cwv_expression = cwv._cwv_expression_median()
     else:
-        cwv_expression = cwv._cwv_expression_mean()
+        reasons = [_separable_reason(cwv, accuracy_map)
+                   for cwv, accuracy_map in zip(cwvs, accuracy_maps)]
+        separable = [engine == 'separable' or bool(reason)
+                     for reason in reasons]
+        if any(separable):
+            msg += ' based on separable window sums'
+        if engine != 'separable':
+            for cwv, reason in zip(cwvs, reasons):
+                if reason:
+                    msg += (f'\n|! Using separable window sums instead of '
+                            f'the mapcalc engine for the {cwv.window_size}^2 '
+                            f'window: {reason}')
+        if median:
+            msg += median_msg
+        if info and not all(separable):
+            msg += '\n   Expression:\n'
+        g.message(msg)
+
+        if any(separable):
+            _estimate_cwv_separable(
+                    [cwv for cwv, sums in zip(cwvs, separable) if sums],
+                    [outname for outname, sums
+                     in zip(temporary_maps, separable) if sums],
+                    median,
+                    [accuracy_map for accuracy_map, sums
+                     in zip(accuracy_maps, separable) if sums],
+            )
+        if not all(separable):
+            _estimate_cwv_mapcalc(
+                    [cwv for cwv, sums in zip(cwvs, separable) if not sums],
+                    [outname for outname, sums
+                     in zip(temporary_maps, separable) if not sums],
+                    median,
+                    info,
+            )
 
-    # if accuracy:
-    #     if median:
-    #         accuracy_expression = cwv._accuracy_expression_median()
-    #     else:
-    #         accuracy_expression = cwv._accuracy_expression_mean()
-    # else:
-    #     accuracy_expression = str()
+    for cwv, temporary_map, cwv_map in zip(cwvs, temporary_maps, cwv_maps):
+        _support_cwv_map(cwv, temporary_map, cwv_map, info)
 
-    if info:
-        msg += '\n   Expression:\n'
-        msg = replace_dummies(
-                cwv_expression,
-                in_ti=t10, out_ti='T10',
-                in_tj=t11, out_tj='T11',
+
+def _separable_reason(cwv, accuracy_map=None):
+    """
+    Return why the 'mapcalc' engine derives the column water vapor of a
+    window from separable window sums instead, or None if it does not: the
+    single expression grows with the square of the window size, counts no
+    valid pixels and does not derive the retrieval accuracy
+    """
+    if cwv.window_size >= SEPARABLE_WINDOW_SIZE:
+        return f'windows of {SEPARABLE_WINDOW_SIZE}^2 or larger'
+    if cwv.masked:
+        return 'counting valid pixels, min_valid_fraction is below 1'
+    if accuracy_map:
+        return 'deriving the retrieval accuracy'
+    return None
+
+
+def _create_mask_maps(cwvs):
+    """
+    Create the cloud mask maps which the r.mapcalc expressions of
+    Column_Water_Vapor objects reference, see CloudMask.create_mask_map()
+    """
+    for cwv in cwvs:
+        if cwv.mask:
+            cwv.mask.create_mask_map()
+
+
+def _estimate_cwv_mapcalc(cwvs, outnames, median=False, info=False):
+    """
+    Derive column water vapor maps from single mapcalc expressions of
+    neighborhood modifiers, evaluated in a single r.mapcalc pass
+    """
+    equations = []
+    for cwv, outname in zip(cwvs, outnames):
+        if median:
+            cwv_expression = cwv._cwv_expression_median()
+        else:
+            cwv_expression = cwv._cwv_expression_mean()
+
+        if info:
+            msg = replace_dummies(
+                    cwv_expression,
+                    in_ti=cwv.ti, out_ti='T10',
+                    in_tj=cwv.tj, out_tj='T11',
+            )
+            g.message(msg)
+
+        equations.append(EQUATION.format(
+                result=outname,
+                expression=cwv_expression,
+        ))
+    _create_mask_maps(cwvs)
+    grass.mapcalc('\n'.join(equations), overwrite=True)
+
+
+def _estimate_cwv_numpy(cwvs, outnames, median=False, accuracy_maps=None,
+                        block_rows=BLOCK_ROWS):
+    """
+    Derive column water vapor maps based on summed-area tables in NumPy,
+    shared by all windows, block of rows by block of rows. Only the rows of
+    the current block, extended by the largest window radius on either side,
+    are held in memory, not whole maps. The rows extending a block are read
+    again by the adjacent block. See compute_column_water_vapor_arrays().
+    """
+    import numpy
+    from window_moments import row_blocks
+    if not accuracy_maps:
+        accuracy_maps = [None] * len(cwvs)
+    accuracy = any(accuracy_maps)
+    mask = cwvs[0].mask
+    if mask and mask.empty:
+        mask = None
+
+    inputs = [cwvs[0].ti, cwvs[0].tj] + ([mask.mapname] if mask else [])
+    readers = [open_raster_rows(mapname) for mapname in inputs]
+    writers = [open_raster_rows(outname, mode='w') for outname in outnames]
+    accuracy_writers = [open_raster_rows(accuracy_map, mode='w')
+                        if accuracy_map else None
+                        for accuracy_map in accuracy_maps]
+    try:
+        halo = max(cwv.window_radius for cwv in cwvs)
+        for read_start, read_end, start, end in row_blocks(
+                readers[0].info.rows, block_rows, halo):
+            ti = read_raster_rows(readers[0], read_start, read_end)
+            tj = read_raster_rows(readers[1], read_start, read_end)
+            if mask:
+                masked = mask.compute_array(
+                        read_raster_rows(readers[2], read_start, read_end))
+                ti = numpy.where(masked, numpy.nan, ti)
+                tj = numpy.where(masked, numpy.nan, tj)
+            results = compute_column_water_vapor_arrays(
+                    cwvs,
+                    ti,
+                    tj,
+                    median=median,
+                    block_rows=read_end - read_start,
+                    accuracy=accuracy,
+            )
+            block = slice(start - read_start, end - read_start)
+            for index, cwv_array in enumerate(results):
+                if accuracy:
+                    cwv_array, accuracy_array = cwv_array
+                    if accuracy_writers[index]:
+                        for values in accuracy_array[block]:
+                            write_raster_row(accuracy_writers[index], values)
+                for values in cwv_array[block]:
+                    write_raster_row(writers[index], values)
+    finally:
+        for raster in readers + writers + accuracy_writers:
+            if raster:
+                raster.close()
+
+
+def coarse_region(region, resolution):
+    """
+    Return the bounds and resolution of a coarser grid aligned to the grid of
+    a computational region, for g.region: it shares the north and west edges
+    of the region and extends south and east by less than one coarse cell,
+    so as to cover the whole region. Coarse cell edges fall on the edges of
+    the region's cells if the resolution is a multiple of the region's one.
+    Else r.resamp.stats weights the region's cells partly covered.
+
+    Parameters
+    ----------
+    region
+        A dictionary of the computational region, as returned by
+        grass.region()
+
+    resolution
+        The resolution of the coarse grid, in map units, coarser than the
+        region's resolution
+    """
+    assert resolution > max(region['nsres'], region['ewres']), \
+        "Coarse resolution should be larger than the region's resolution."
+    rows = math.ceil(round((region['n'] - region['s']) / resolution, 9))
+    cols = math.ceil(round((region['e'] - region['w']) / resolution, 9))
+    return {
+        'n': region['n'],
+        's': region['n'] - rows * resolution,
+        'w': region['w'],
+        'e': region['w'] + cols * resolution,
+        'res': resolution,
+    }
+
+
+def _estimate_cwv_coarse(
+        temporary_maps,
+        cwv_maps,
+        t10,
+        t11,
+        window_sizes,
+        cwv_resolution,
+        **kwargs,
+    ):
+    """
+    Estimate column water vapor on a coarser grid, aligned to the current
+    computational region (see coarse_region()), and interpolate it back to
+    the current region. See estimate_cwv().
+    """
+    msg = (f'\n|i Estimating atmospheric column water vapor at a '
+           f'{cwv_resolution} map units resolution')
+    g.message(msg)
+    coarse_t10 = tmp_map_name('coarse_t10')
+    coarse_t11 = tmp_map_name('coarse_t11')
+    coarse_cwvs = [tmp_map_name(f'coarse_cwv_{window_size}')
+                   for window_size in window_sizes]
+    accuracy_maps = kwargs.pop('accuracy_maps')
+    mask = kwargs.pop('mask', None)
+    if mask and not mask.empty:
+        # r.resamp.stats cannot evaluate a predicate
+        t10, t11 = _mask_temperatures(t10, t11, mask)
+    coarse_accuracy_maps = [
+            tmp_map_name(f'coarse_accuracy_{window_size}')
+            if accuracy_map else None
+            for window_size, accuracy_map in zip(window_sizes, accuracy_maps)]
+    with region_override(**coarse_region(grass.region(), cwv_resolution)):
+        for fine, coarse in ((t10, coarse_t10), (t11, coarse_t11)):
+            run('r.resamp.stats',
+                input=fine,
+                output=coarse,
+                method='average',
+                flags='w',
+            )
+        estimate_cwv_sweep(
+                temporary_maps=coarse_cwvs,
+                cwv_maps=[None] * len(window_sizes),
+                t10=coarse_t10,
+                t11=coarse_t11,
+                window_sizes=window_sizes,
+                accuracy_maps=coarse_accuracy_maps,
+                **kwargs,
         )
+
+    interpolations = list(zip(coarse_cwvs, temporary_maps))
+    interpolations += [(coarse, fine) for coarse, fine
+                       in zip(coarse_accuracy_maps, accuracy_maps) if fine]
+    for coarse, fine in interpolations:
+        run('r.resamp.interp',
+            input=coarse,
+            output=fine,
+            method='bilinear',
+            overwrite=True,
+        )
+    for window_size, temporary_map, cwv_map in zip(
+            window_sizes, temporary_maps, cwv_maps):
+        cwv = Column_Water_Vapor(window_size, t10, t11,
+                                 kwargs.get('window_stride', 1),
+                                 kwargs.get('min_valid_fraction', 1.0))
+        _support_cwv_map(cwv, temporary_map, cwv_map,
+                         kwargs.get('info', False))
+
+
+def _mask_temperatures(t10, t11, mask):
+    """
+    Write brightness temperature maps, masked by a CloudMask, in a single
+    r.mapcalc pass and return their names. For modules which cannot evaluate
+    a predicate, such as r.resamp.stats.
+    """
+    msg = f'\n|i Masking {mask} in to temporary maps, for r.resamp.stats'
     g.message(msg)
+    masked_t10 = tmp_map_name('cloud_masked_t10')
+    masked_t11 = tmp_map_name('cloud_masked_t11')
+    mask.create_mask_map()
+    grass.mapcalc(f'{masked_t10} = {mask.apply(t10)}'
+                  f'\n{masked_t11} = {mask.apply(t11)}', overwrite=True)
+    return masked_t10, masked_t11
+
+
+def _estimate_cwv_separable(cwvs, outnames, median=False, accuracy_maps=None):
+    """
+    Derive column water vapor maps in two r.mapcalc passes: the first writes
+    the row-direction partial sums of the window moments (and the window
+    medians, if requested) of all windows to temporary maps, the second sums
+    these along the columns and derives Rji and CWV, and optionally the
+    retrieval accuracy, of all windows.
+    """
+    if not accuracy_maps:
+        accuracy_maps = [None] * len(cwvs)
+    first_pass = []
+    second_pass = []
+    for cwv, outname, accuracy_map in zip(cwvs, outnames, accuracy_maps):
+        expressions = cwv._row_sum_expressions(tj_tj=bool(accuracy_map))
+        if median:
+            expressions.update(cwv._window_median_expressions())
+        row_sums = {moment: tmp_map_name(f'row_sum_{moment}_{cwv.window_size}')
+                    for moment in expressions}
+        first_pass.extend(
+                EQUATION.format(result=row_sums[moment], expression=expression)
+                for moment, expression in expressions.items())
+
+        cwv_expression = cwv._cwv_expression_separable(row_sums)
+        second_pass.append(EQUATION.format(
+                result=outname,
+                expression=cwv_expression,
+        ))
+        if accuracy_map:
+            accuracy_expression = cwv._accuracy_expression_separable(row_sums)
+            second_pass.append(EQUATION.format(
+                    result=accuracy_map,
+                    expression=accuracy_expression,
+            ))
+    _create_mask_maps(cwvs)
+    grass.mapcalc('\n'.join(first_pass), overwrite=True)
+    grass.mapcalc('\n'.join(second_pass), overwrite=True)
+
+
+def _write_window_weights(cwv):
+    """
+    Write an r.neighbors weights file selecting the adjacent pixels of a
+    strided window and return its name
+    """
+    offsets = cwv._derive_row_offsets()
+    radius = cwv.window_radius
+    rows = []
+    for row in range(-radius, radius + 1):
+        rows.append(' '.join('1' if row in offsets and col in offsets else '0'
+                             for col in range(-radius, radius + 1)))
+    weights = grass.tempfile()
+    with open(weights, 'w') as weights_file:
+        weights_file.write('\n'.join(rows) + '\n')
+    return weights
+
+
+def _estimate_cwv_neighbors(cwvs, outnames, median=False, nprocs=1,
+                            accuracy_maps=None):
+    """
+    Derive column water vapor maps from window moment maps computed by
+    r.neighbors: the window mean (or median) of Ti and Tj and the window mean
+    of Ti * Tj and Ti^2. A short mapcalc expression turns these in to Rji and
+    CWV (see Column_Water_Vapor._cwv_expression_from_moments()). The
+    retrieval accuracy, if requested, requires the window mean of Tj^2 only.
+    The products of brightness temperatures are shared by all windows.
+
+    r.neighbors skips NULL cells, hence all window means are normalised by
+    the count of valid cells. Windows holding NULL pixels, if accepted, read
+    Ti and Tj masked by each other's NULL cells.
+    """
+    if not accuracy_maps:
+        accuracy_maps = [None] * len(cwvs)
+    ti, tj = cwvs[0].ti, cwvs[0].tj
+    # NULL if masked by a cloud mask
+    cell_ti, cell_tj = cwvs[0]._cell(ti), cwvs[0]._cell(tj)
+    offset = TEMPERATURE_OFFSET
+    tmp_ti_tj = tmp_map_name('ti_tj')
+    tmp_ti_ti = tmp_map_name('ti_ti')
+    products = (f'{tmp_ti_tj} = ({cell_ti} - {offset}) * ({cell_tj} - {offset})'
+                f'\n{tmp_ti_ti} = ({cell_ti} - {offset})^2')
+    if any(accuracy_maps):
+        tmp_tj_tj = tmp_map_name('tj_tj')
+        products += f'\n{tmp_tj_tj} = ({cell_tj} - {offset})^2'
+    if cwvs[0].mask:
+        # r.neighbors reads maps, written along with the products
+        ti, tj = tmp_map_name('cloud_masked_ti'), tmp_map_name('cloud_masked_tj')
+        products += f'\n{ti} = {cell_ti}\n{tj} = {cell_tj}'
+    if any(cwv.masked for cwv in cwvs):
+        masked_ti = tmp_map_name('masked_ti')
+        masked_tj = tmp_map_name('masked_tj')
+        products += (f'\n{masked_ti} = if(isnull({cell_tj}), null(), {cell_ti})'
+                     f'\n{masked_tj} = if(isnull({cell_ti}), null(), {cell_tj})')
+    _create_mask_maps(cwvs)
+    grass.mapcalc(products, overwrite=True)
+
+    methods = ['average', 'median'] if median else ['average']
+    equations = []
+    for cwv, outname, accuracy_map in zip(cwvs, outnames, accuracy_maps):
+        size = 2 * cwv.window_radius + 1
+        neighbors = dict(size=size, flags='a', overwrite=True)
+        if nprocs > 1:
+            neighbors['nprocs'] = nprocs
+        if cwv.window_stride > 1:
+            neighbors.update(
+                    weighting_function='file',
+                    weight=_write_window_weights(cwv),
+            )
+
+        rasters = (('ti', ti), ('tj', tj))
+        if cwv.masked:
+            rasters = (('ti', masked_ti), ('tj', masked_tj))
+        moments = {}
+        for name, raster in rasters:
+            outputs = [tmp_map_name(f'{method}_{name}_{size}')
+                       for method in methods]
+            run('r.neighbors', input=raster, output=outputs, method=methods,
+                **neighbors)
+            moments[name] = outputs
+
+        mean_ti_tj = tmp_map_name(f'average_ti_tj_{size}')
+        count = tmp_map_name(f'count_ti_tj_{size}')
+        run('r.neighbors', input=tmp_ti_tj, output=(mean_ti_tj, count),
+            method=('average', 'count'), **neighbors)
+        mean_ti_ti = tmp_map_name(f'average_ti_ti_{size}')
+        run('r.neighbors', input=tmp_ti_ti, output=mean_ti_ti,
+            method='average', **neighbors)
+
+        window_moments = dict(
+                count=count,
+                mean_ti=moments['ti'][0],
+                mean_tj=moments['tj'][0],
+                mean_ti_tj=mean_ti_tj,
+                mean_ti_ti=mean_ti_ti,
+                median_ti=moments['ti'][1] if median else None,
+                median_tj=moments['tj'][1] if median else None,
+        )
+        cwv_expression = cwv._cwv_expression_from_moments(**window_moments)
+        equations.append(EQUATION.format(
+                result=outname,
+                expression=cwv_expression,
+        ))
+        if accuracy_map:
+            mean_tj_tj = tmp_map_name(f'average_tj_tj_{size}')
+            run('r.neighbors', input=tmp_tj_tj, output=mean_tj_tj,
+                method='average', **neighbors)
+            accuracy_expression = cwv._accuracy_expression_from_moments(
+                    mean_tj_tj=mean_tj_tj,
+                    **window_moments,
+            )
+            equations.append(EQUATION.format(
+                    result=accuracy_map,
+                    expression=accuracy_expression,
+            ))
+    grass.mapcalc('\n'.join(equations), overwrite=True)
 
-    cwv_equation = EQUATION.format(
-            result=temporary_map,
-            expression=cwv_expression,
-    )
-    grass.mapcalc(cwv_equation, overwrite=True)
 
-    # accuracy_equation = EQUATION.format(result=outname, expression=accuracy_expression)
-    # grass.mapcalc(accuracy_equation, overwrite=True)
+def report_retrieval_accuracy(accuracy_map, window_size=None):
+    """
+    Report univariate statistics of a retrieval accuracy map
+    """
+    statistics = grass.parse_command('r.univar', map=accuracy_map, flags='g')
+    if not int(statistics.get('n', 0)):
+        g.message('\n|! No valid column water vapor retrieval accuracy values')
+        return
+    window = f' in a {window_size}^2 window' if window_size else ''
+    msg = (f'\n|i Column water vapor retrieval accuracy (Rji * Rij){window}:'
+           f'\n   mean: {float(statistics["mean"]):.4f}'
+           f', min: {float(statistics["min"]):.4f}'
+           f', max: {float(statistics["max"]):.4f}'
+           f', stddev: {float(statistics["stddev"]):.4f}')
+    g.message(msg)
 
+
+def _support_cwv_map(cwv, temporary_map, cwv_map, info=False):
+    """
+    Report on and, if requested, describe and rename the column water vapor
+    map
+    """
     if info:
         run('r.info', map=temporary_map, flags='r')
 
     if cwv_map:
         history_cwv = f'\nColumn Water Vapor = {cwv._equation}'
         history_cwv += f'\nSpatial window size: {cwv.window_size}^2'
+        if cwv.masked:
+            history_cwv += (f'\nMinimum valid pixels per window: '
+                            f'{cwv.min_valid_count}')
+        if cwv.window_stride > 1:
+            history_cwv += f'\nSpatial window stride: {cwv.window_stride}'
         title_cwv = 'Column Water Vapor'
         description_cwv = 'Column Water Vapor based on MSWVCM'
         units_cwv = 'g/cm^2'
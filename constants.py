@@ -6,6 +6,7 @@ DUMMY_MAPCALC_STRING_T11 = 'Input_T11'
 DUMMY_MAPCALC_STRING_AVG_LSE = 'Input_AVG_LSE'
 DUMMY_MAPCALC_STRING_DELTA_LSE = 'Input_DELTA_LSE'
 DUMMY_MAPCALC_STRING_FROM_GLC = 'Input_FROMGLC'
+DUMMY_MAPCALC_STRING_LANDCOVER_CLASS = 'Input_LANDCOVER_CLASS'
 DUMMY_MAPCALC_STRING_CWV = 'Input_CWV'
 DUMMY_Ti_MEAN = 'ti_mean'
 DUMMY_Tj_MEAN = 'tj_mean'
@@ -1,4 +1,4 @@
-import functools
+from expressions import substitute
 
 def replace_dummies(string, *args, **kwargs):
     """
@@ -71,6 +71,24 @@ def replace_dummies(string, *args, **kwargs):
                        (in_tj, str(out_tj)), \
                        (in_cwv, str(out_cwv))
 
+    in_landcover_out = set(['in_ti', 'out_ti', 'in_tj', 'out_tj', 'in_cwv',
+                            'out_cwv', 'in_landcover', 'out_landcover'])
+
+    if in_landcover_out == set(kwargs):
+        in_cwv = kwargs.get('in_cwv', 'None')
+        out_cwv = kwargs.get('out_cwv', 'None')
+        in_ti = kwargs.get('in_ti', 'None')
+        out_ti = kwargs.get('out_ti', 'None')
+        in_tj = kwargs.get('in_tj', 'None')
+        out_tj = kwargs.get('out_tj', 'None')
+        in_landcover = kwargs.get('in_landcover', 'None')
+        out_landcover = kwargs.get('out_landcover', 'None')
+
+        replacements = (in_ti, str(out_ti)), \
+                       (in_tj, str(out_tj)), \
+                       (in_cwv, str(out_cwv)), \
+                       (in_landcover, str(out_landcover))
+
     in_lst_out = set(['in_ti', 'out_ti', 'in_tj', 'out_tj', 'in_cwv',
                       'out_cwv', 'in_avg_lse', 'out_avg_lse', 'in_delta_lse',
                       'out_delta_lse'])
@@ -93,5 +111,5 @@ def replace_dummies(string, *args, **kwargs):
                        (in_avg_lse, str(out_avg_lse)), \
                        (in_delta_lse, str(out_delta_lse))
 
-    return functools.reduce(lambda alpha, omega: alpha.replace(*omega),
-                  replacements, string)
+    # a single pass over the string, instead of one copy per replacement
+    return substitute(string, dict(replacements))
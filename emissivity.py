@@ -1,76 +1,107 @@
 from grass.pygrass.modules.shortcuts import general as g
-from dummy_mapcalc_strings import replace_dummies
-from constants import DUMMY_MAPCALC_STRING_FROM_GLC
-from constants import EQUATION
 import grass.script as grass
 from helpers import run
+from helpers import tmp_map_name
+from dummy_mapcalc_strings import replace_dummies
+from constants import DUMMY_MAPCALC_STRING_LANDCOVER_CLASS
+from constants import EQUATION
 
-def determine_average_emissivity(
-        outname,
-        emissivity_output,
-        landcover_map,
-        avg_lse_expression,
-        info=False,
-    ):
+def recode_emissivity(outname, landcover_map, rules):
     """
-    Produce an average emissivity map based on FROM-GLC map covering the region
-    of interest.
+    Recode a FROM-GLC map to emissivities, looking up the emissivity of each
+    pixel's land cover code via r.recode rules (see the SplitWindowLST
+    class' emissivity_recode_rules())
     """
-    msg = ('\n|i Determining average land surface emissivity based on a look-up table ')
-    if info:
-        msg += (f'\n   Expression:\n\n {avg_lse_expression}')
-    g.message(msg)
-    avg_lse_expression = replace_dummies(
-            avg_lse_expression,
-            instring=DUMMY_MAPCALC_STRING_FROM_GLC,
-            outstring=landcover_map,
-    )
-    avg_lse_equation = EQUATION.format(
-            result=outname,
-            expression=avg_lse_expression,
+    grass.write_command(
+            'r.recode',
+            input=landcover_map,
+            output=outname,
+            rules='-',
+            flags='d',
+            stdin=rules,
+            overwrite=True,
     )
-    grass.mapcalc(avg_lse_equation, overwrite=True)
-
-    if info:
-        run('r.info', map=outname, flags='r')
-
 
-    # save land surface emissivity map?
-    if emissivity_output:
-        run('g.rename', raster=(outname, emissivity_output))
 
-
-def determine_delta_emissivity(
-        outname,
-        delta_emissivity_output,
+def determine_emissivities(
+        outnames,
         landcover_map,
-        delta_lse_expression,
+        split_window_lst,
         info=False,
+        cache=None,
     ):
     """
-    Produce a delta emissivity map based on the FROM-GLC map covering the
-    region of interest.
+    Produce several emissivity maps based on the FROM-GLC map covering the
+    region of interest, in a single pass over it. The land cover class of
+    each pixel is looked up once for all maps: a single map is recoded via
+    r.recode, several maps look up the class of a virtual r.reclass map in a
+    single r.mapcalc call.
+
+    Parameters
+    ----------
+    outnames
+        A dictionary of emissivities, items of EMISSIVITY_ARRAYS ('average',
+        'delta', 't10' or 't11'), to output map names
+
+    landcover_map
+        A FROM-GLC map
+
+    split_window_lst
+        A SplitWindowLST object
+
+    cache
+        An EmissivityCache object to copy the maps from, if derived in a
+        previous run, and to store them in otherwise
     """
-    msg = ('\n|i Determining delta land surface emissivity based on a '
-           'look-up table ')
-    if info:
-        msg += (f'\n   Expression:\n\n {delta_lse_expression}')
+    if cache:
+        digest = cache.key(landcover_map, split_window_lst)
+        outnames = cache.lookup(digest, outnames)
+        if not outnames:
+            return
+
+    emissivities = tuple(outnames)
+    msg = ('\n|i Determining ' + ', '.join(emissivities) + ' land surface '
+           'emissivities in a single pass, based on a look-up table ')
     g.message(msg)
 
-    delta_lse_expression = replace_dummies(
-            delta_lse_expression,
-            instring=DUMMY_MAPCALC_STRING_FROM_GLC,
-            outstring=landcover_map,
-    )
-    delta_lse_equation = EQUATION.format(
-            result=outname,
-            expression=delta_lse_expression,
-    )
-    grass.mapcalc(delta_lse_equation, overwrite=True)
+    # a single map is recoded directly
+    if len(emissivities) == 1:
+        emissivity, = emissivities
+        recode_emissivity(
+                outnames[emissivity],
+                landcover_map,
+                split_window_lst.emissivity_recode_rules(emissivity),
+        )
 
-    if info:
-        run('r.info', map=outname, flags='r')
+    # several maps look up the class of a virtual, reclassified map, read
+    # once by a single r.mapcalc call for all of them
+    else:
+        landcover_classes = tmp_map_name('landcover_class')
+        grass.write_command(
+                'r.reclass',
+                input=landcover_map,
+                output=landcover_classes,
+                rules='-',
+                stdin=split_window_lst.emissivity_class_reclass_rules,
+                overwrite=True,
+                quiet=True,
+        )
+        equations = []
+        for emissivity in emissivities:
+            expression = replace_dummies(
+                    split_window_lst.emissivity_class_mapcalc(emissivity),
+                    instring=DUMMY_MAPCALC_STRING_LANDCOVER_CLASS,
+                    outstring=landcover_classes,
+            )
+            equations.append(EQUATION.format(
+                    result=outnames[emissivity],
+                    expression=expression,
+            ))
+        grass.mapcalc('\n'.join(equations), overwrite=True)
+
+    if cache:
+        cache.store(digest, outnames)
 
-    # save delta land surface emissivity map?
-    if delta_emissivity_output:
-        run('g.rename', raster=(outname, delta_emissivity_output))
+    if info:
+        for outname in outnames.values():
+            run('r.info', map=outname, flags='r')
@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+
+"""
+A small expression tree for GRASS GIS' r.mapcalc expressions
+
+Models (e.g. the split-window LST formula or the column water vapor
+polynomial) are built once as trees of Constant, Variable, Operation and
+Function nodes. A tree renders to r.mapcalc text, binding map names to its
+variables in a single pass and optionally sharing repeated subexpressions
+via eval(), or evaluates directly on NumPy arrays. Hence one model drives
+every engine.
+
+@author nik | Created on October 2026
+"""
+
+import re
+import numbers
+import functools
+from collections import OrderedDict
+
+# precedence of r.mapcalc operators, the unary minus binding tighter than ^
+# within its operand, see Negation._render()
+PRECEDENCE = {'+': 1, '-': 1, '*': 2, '/': 2, '^': 4}
+NEGATION_PRECEDENCE = 3
+SHARED_NAME = 'shared_{index}'
+EXPRESSION_CACHE_SIZE = 64  # entries per memoised method
+
+
+def _fold(operator, left, right):
+    """
+    Return the value of a binary operation of two numbers
+    """
+    if operator == '+':
+        return left + right
+    if operator == '-':
+        return left - right
+    if operator == '*':
+        return left * right
+    if operator == '/':
+        return left / right
+    return left ** right
+
+
+def as_expression(value):
+    """
+    Return the given value as an Expression: numbers become Constant nodes,
+    strings Variable nodes
+    """
+    if isinstance(value, Expression):
+        return value
+    if isinstance(value, numbers.Number):
+        return Constant(value)
+    if isinstance(value, str):
+        return Variable(value)
+    raise TypeError(f'Cannot build an expression from {value!r}')
+
+
+class Expression():
+    """
+    Base class of expression tree nodes. Nodes are immutable, compare and
+    hash structurally and combine via Python's arithmetic operators.
+    """
+    precedence = 5
+
+    def __init__(self, key):
+        self.key = key
+        self._hash = hash(key)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return (isinstance(other, Expression)
+                and self._hash == other._hash
+                and self.key == other.key)
+
+    def __add__(self, other):
+        return operation('+', self, other)
+
+    def __radd__(self, other):
+        return operation('+', other, self)
+
+    def __sub__(self, other):
+        return operation('-', self, other)
+
+    def __rsub__(self, other):
+        return operation('-', other, self)
+
+    def __mul__(self, other):
+        return operation('*', self, other)
+
+    def __rmul__(self, other):
+        return operation('*', other, self)
+
+    def __truediv__(self, other):
+        return operation('/', self, other)
+
+    def __rtruediv__(self, other):
+        return operation('/', other, self)
+
+    def __pow__(self, other):
+        return operation('^', self, other)
+
+    def __rpow__(self, other):
+        return operation('^', other, self)
+
+    def __neg__(self):
+        return Negation(self)
+
+    def __str__(self):
+        return render(self)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({render(self)!r})'
+
+    @property
+    def children(self):
+        return ()
+
+    def _render(self, names):
+        raise NotImplementedError
+
+    def _apply(self, *arguments):
+        """
+        Return the value of the node for the values of its children
+        """
+        raise NotImplementedError
+
+    def _evaluate(self, values):
+        """
+        Return the value of a node without children
+        """
+        return self._apply()
+
+
+class Constant(Expression):
+    """
+    A number, or a numeric string (e.g. as read from an MTL file) rendered
+    as is
+    """
+    def __init__(self, value):
+        self.value = value
+        super().__init__(('constant', str(value)))
+
+    @property
+    def number(self):
+        return float(self.value)
+
+    @property
+    def precedence(self):
+        if self.number < 0:
+            return NEGATION_PRECEDENCE
+        return Expression.precedence
+
+    def _render(self, names):
+        return str(self.value)
+
+    def _evaluate(self, values):
+        return self.number
+
+
+class Variable(Expression):
+    """
+    A named input: a map name, a DUMMY string or an eval() variable
+    """
+    def __init__(self, name):
+        self.name = name
+        super().__init__(('variable', name))
+
+    def _render(self, names):
+        return str(names.get(self.name, self.name))
+
+    def _evaluate(self, values):
+        return values[self.name]
+
+
+class Operation(Expression):
+    """
+    A binary operation of r.mapcalc: one of + - * / ^
+    """
+    def __init__(self, operator, left, right):
+        self.operator = operator
+        self.left = left
+        self.right = right
+        self.precedence = PRECEDENCE[operator]
+        super().__init__(('operation', operator, left.key, right.key))
+
+    @property
+    def children(self):
+        return (self.left, self.right)
+
+    def _render_operand(self, operand, names, right):
+        """
+        Render an operand, in parentheses where required. Operations of
+        equal precedence group from the left, apart from ^ which is always
+        parenthesised.
+        """
+        text = operand._render(names)
+        if operand.precedence < self.precedence:
+            return f'({text})'
+        if operand.precedence == self.precedence \
+                and (right or self.operator == '^'):
+            return f'({text})'
+        return text
+
+    def _render(self, names):
+        left = self._render_operand(self.left, names, right=False)
+        right = self._render_operand(self.right, names, right=True)
+        return f'{left} {self.operator} {right}'
+
+    def _apply(self, left, right):
+        import numpy
+        if self.operator == '/':
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                return numpy.true_divide(left, right)
+        if self.operator == '^':
+            return numpy.power(left, right)
+        return _fold(self.operator, left, right)
+
+
+class Negation(Expression):
+    """
+    The unary minus
+    """
+    precedence = NEGATION_PRECEDENCE
+
+    def __init__(self, operand):
+        self.operand = as_expression(operand)
+        super().__init__(('negation', self.operand.key))
+
+    @property
+    def children(self):
+        return (self.operand,)
+
+    def _render(self, names):
+        """
+        Render the operand in parentheses where required. r.mapcalc binds
+        the unary minus tighter than ^, hence a power is parenthesised too:
+        -x ^ 2 reads as (-x) ^ 2.
+        """
+        text = self.operand._render(names)
+        if self.operand.precedence <= self.precedence \
+                or getattr(self.operand, 'operator', None) == '^':
+            text = f'({text})'
+        return f'-{text}'
+
+    def _apply(self, operand):
+        return -operand
+
+
+def _graph(x, *points):
+    """
+    r.mapcalc's graph(): piecewise linear interpolation between points,
+    constant beyond the first and the last one
+    """
+    import numpy
+    return numpy.interp(x, points[::2], points[1::2])
+
+
+def _if(condition, true=1, false=0):
+    """
+    r.mapcalc's if(): NULL (NaN) conditions give NULL
+    """
+    import numpy
+    condition = numpy.asarray(condition, dtype=float)
+    return numpy.where(numpy.isnan(condition), numpy.nan,
+                       numpy.where(condition != 0, true, false))
+
+
+def _functions():
+    """
+    Return the NumPy counterparts of r.mapcalc functions
+    """
+    import numpy
+    return {
+        'log': numpy.log,
+        'exp': numpy.exp,
+        'sqrt': numpy.sqrt,
+        'abs': numpy.abs,
+        'graph': _graph,
+        'if': _if,
+        'null': lambda: numpy.nan,
+        'isnull': lambda x: numpy.isnan(x).astype(float),
+        'median': lambda *x: numpy.median(numpy.broadcast_arrays(*x), axis=0),
+    }
+
+
+class Function(Expression):
+    """
+    A call of an r.mapcalc function, e.g. log(), graph() or if()
+    """
+    def __init__(self, name, *arguments):
+        self.name = name
+        self.arguments = tuple(as_expression(argument)
+                               for argument in arguments)
+        super().__init__(('function', name) + tuple(argument.key
+                                                    for argument
+                                                    in self.arguments))
+
+    @property
+    def children(self):
+        return self.arguments
+
+    def _render(self, names):
+        arguments = ', '.join(argument._render(names)
+                              for argument in self.arguments)
+        return f'{self.name}({arguments})'
+
+    def _apply(self, *arguments):
+        import numpy
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return _functions()[self.name](*arguments)
+
+
+def operation(operator, left, right):
+    """
+    Return the Operation of two operands, folding operations of numbers in
+    to a Constant and dropping neutral elements
+    """
+    left = as_expression(left)
+    right = as_expression(right)
+    left_number = isinstance(left, Constant) \
+        and isinstance(left.value, numbers.Number)
+    right_number = isinstance(right, Constant) \
+        and isinstance(right.value, numbers.Number)
+    if left_number and right_number:
+        return Constant(_fold(operator, left.value, right.value))
+    if right_number and right.value == 0 and operator in '+-':
+        return left
+    if left_number and left.value == 0 and operator == '+':
+        return right
+    if right_number and right.value == 1 and operator in '*/^':
+        return left
+    if left_number and left.value == 1 and operator == '*':
+        return right
+    return Operation(operator, left, right)
+
+
+def function(name, *arguments):
+    """
+    Return the call of an r.mapcalc function
+    """
+    return Function(name, *arguments)
+
+
+def summation(terms):
+    """
+    Return the sum of the given terms as a balanced tree, keeping the depth
+    of sums over large windows logarithmic
+    """
+    terms = [as_expression(term) for term in terms]
+    if not terms:
+        return Constant(0)
+    while len(terms) > 1:
+        pairs = [terms[index] + terms[index + 1]
+                 for index in range(0, len(terms) - 1, 2)]
+        if len(terms) % 2:
+            pairs.append(terms[-1])
+        terms = pairs
+    return terms[0]
+
+
+def _count_occurrences(expression, counts):
+    """
+    Count the occurrences of each node, not descending in to repeated ones
+    """
+    counts[expression] = counts.get(expression, 0) + 1
+    if counts[expression] == 1:
+        for child in expression.children:
+            _count_occurrences(child, counts)
+
+
+def common_subexpressions(expression):
+    """
+    Return the operations and function calls which occur more than once in
+    an expression, each listed after the ones it contains
+    """
+    counts = {}
+    _count_occurrences(expression, counts)
+    shared = []
+    seen = set()
+
+    def visit(node):
+        if node in seen:
+            return
+        seen.add(node)
+        for child in node.children:
+            visit(child)
+        if counts[node] > 1 and node.children:
+            shared.append(node)
+
+    visit(expression)
+    return shared
+
+
+def _substitute(expression, replacements):
+    """
+    Return the expression with the given subexpressions replaced by
+    variables
+    """
+    if expression in replacements:
+        return replacements[expression]
+    if isinstance(expression, Operation):
+        return Operation(expression.operator,
+                         _substitute(expression.left, replacements),
+                         _substitute(expression.right, replacements))
+    if isinstance(expression, Negation):
+        return Negation(_substitute(expression.operand, replacements))
+    if isinstance(expression, Function):
+        return Function(expression.name,
+                        *(_substitute(argument, replacements)
+                          for argument in expression.arguments))
+    return expression
+
+
+def compose(expression, variables):
+    """
+    Return the expression with variables replaced by expressions, given as
+    a dictionary of variable names to Expressions (or numbers)
+    """
+    replacements = {Variable(name): as_expression(value)
+                    for name, value in variables.items()}
+    return _substitute(expression, replacements)
+
+
+def share(expression):
+    """
+    Bind subexpressions which occur more than once to variables.
+
+    Returns
+    -------
+    assignments
+        A list of (name, Expression) tuples, each expression referring only
+        to names assigned before it
+
+    result
+        The expression referring to the assigned names
+    """
+    replacements = {}
+    assignments = []
+    for index, subexpression in enumerate(common_subexpressions(expression)):
+        name = SHARED_NAME.format(index=index)
+        assignments.append((name, _substitute(subexpression, replacements)))
+        replacements[subexpression] = Variable(name)
+    return assignments, _substitute(expression, replacements)
+
+
+def render(expression, bindings=None, share_subexpressions=False):
+    """
+    Render an expression as r.mapcalc text.
+
+    Parameters
+    ----------
+    expression
+        An Expression
+
+    bindings
+        A dictionary of variable names to map names (or any other text),
+        substituted while rendering, that is in a single pass
+
+    share_subexpressions
+        Bind subexpressions which occur more than once to variables of an
+        eval(), computing each of them once per cell
+
+    Returns
+    -------
+    A valid expression for r.mapcalc
+    """
+    names = bindings or {}
+    if not share_subexpressions:
+        return expression._render(names)
+    assignments, result = share(expression)
+    if not assignments:
+        return result._render(names)
+    assignments = ''.join(f'\\ \n {name} = {subexpression._render(names)},'
+                          for name, subexpression in assignments)
+    return f'eval({assignments}\\ \n {result._render(names)})'
+
+
+def evaluate(expression, values):
+    """
+    Evaluate an expression on NumPy arrays, or scalars, NULL cells as NaN.
+
+    Parameters
+    ----------
+    expression
+        An Expression
+
+    values
+        A dictionary of variable names to arrays or scalars
+
+    Returns
+    -------
+    A NumPy array or scalar
+    """
+    cache = {}
+
+    def visit(node):
+        # repeated subexpressions are evaluated once
+        if node not in cache:
+            if node.children:
+                cache[node] = node._apply(*(visit(child)
+                                            for child in node.children))
+            else:
+                cache[node] = node._evaluate(values)
+        return cache[node]
+
+    return visit(as_expression(expression))
+
+
+def substitute(string, replacements):
+    """
+    Replace, in a single pass, all occurrences of the keys of the
+    'replacements' dictionary in a string by their values. Longer keys take
+    precedence over shorter keys they start with.
+    """
+    if not replacements:
+        return string
+    keys = sorted(replacements, key=len, reverse=True)
+    pattern = re.compile('|'.join(re.escape(key) for key in keys))
+    return pattern.sub(lambda match: str(replacements[match.group(0)]),
+                       string)
+
+
+def memoise(method):
+    """
+    Decorate a method building expressions so that its results are cached
+    across objects, keyed by the object's _expression_key() and the
+    method's (hashable) arguments, in a bounded least-recently-used cache of
+    EXPRESSION_CACHE_SIZE entries. Cached results are shared, hence not to
+    be modified by callers.
+    """
+    cache = OrderedDict()
+
+    @functools.wraps(method)
+    def memoised(self, *arguments):
+        key = (self._expression_key(), arguments)
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        result = method(self, *arguments)
+        cache[key] = result
+        if len(cache) > EXPRESSION_CACHE_SIZE:
+            cache.popitem(last=False)
+        return result
+
+    memoised.cache = cache
+    return memoised
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+
+"""
+A fused, single-pass pipeline from Landsat8 TIRS digital numbers to land
+surface temperature
+
+Digital numbers are converted to spectral radiance, brightness temperature,
+emissivity, column water vapor and land surface temperature on NumPy arrays,
+block of rows by block of rows. Only the rows spanned by the column water
+vapor window of the current block are kept in memory and none of the
+in-between products is written as a raster map, unless requested.
+
+@author nik | Created on October 2026
+"""
+
+from column_water_vapor import BLOCK_ROWS
+from column_water_vapor import compute_column_water_vapor_arrays
+from temperature import round_like_mapcalc
+from radiance import lookup_brightness_temperature
+from grass.pygrass.modules.shortcuts import general as g
+from helpers import open_raster_rows
+from helpers import read_raster_row
+from helpers import write_raster_row
+from helpers import run
+
+
+class RowWindow():
+    """
+    A rolling window over the rows of a raster map. Rows are read once, in
+    order, converted by an optional function and dropped once the window
+    moves past them.
+    """
+
+    def __init__(self, read_row, convert=None):
+        """
+        Parameters
+        ----------
+        read_row
+            A function returning a row, by index, as a 1D NumPy array
+
+        convert
+            An optional function applied to each row once read
+        """
+        self.read_row = read_row
+        self.convert = convert
+        self.start = 0
+        self.rows = []
+
+    def read(self, start, end):
+        """
+        Return the rows [start, end) as a 2D NumPy array. Windows may only
+        move forward.
+        """
+        import numpy
+        assert start >= self.start, "Row windows move only forward!"
+        del self.rows[:start - self.start]
+        self.start = start
+        for row in range(start + len(self.rows), end):
+            values = self.read_row(row)
+            if self.convert:
+                values = self.convert(values)
+            self.rows.append(values)
+        return numpy.array(self.rows[:end - start])
+
+
+def fused_blocks(
+        windows,
+        rows,
+        cwvs,
+        split_window_lst,
+        median=False,
+        accuracy=False,
+        emissivities=False,
+        block_rows=BLOCK_ROWS,
+    ):
+    """
+    Estimate land surface temperature block of rows by block of rows.
+
+    Parameters
+    ----------
+    windows
+        A dictionary of RowWindow objects for the brightness temperatures
+        't10' and 't11' and, optionally, for 'landcover' (FROM-GLC codes),
+        'avg_lse' and 'delta_lse' (emissivities), 'cwv' (a column water
+        vapor map which overrides estimating it) and 'mask' (True for cells
+        to mask, see CloudMask.compute_array())
+
+    rows
+        Number of rows of the computational region
+
+    cwvs
+        A sequence of Column_Water_Vapor objects of the same window stride,
+        one per window size. Ignored if a 'cwv' window is given.
+
+    split_window_lst
+        A SplitWindowLST object
+
+    median, accuracy
+        See compute_column_water_vapor_arrays()
+
+    emissivities
+        Derive average, delta and channel emissivities from the landcover,
+        even if not required for the land surface temperature
+
+    block_rows
+        Number of rows per block
+
+    Yields
+    ------
+    Tuples (start, end, products) where 'products' is a dictionary of arrays
+    of the rows [start, end): 't10', 't11', 'avg_lse' and 'delta_lse' (if
+    given or derived), 'e10' and 'e11' (if derived), and lists, one item per
+    window size, of arrays for 'cwv', 'accuracy' (if requested) and 'lst'
+    """
+    import numpy
+    from window_moments import row_blocks
+    given_cwv = 'cwv' in windows
+    halo = 0 if given_cwv else max(cwv.window_radius for cwv in cwvs)
+    for read_start, read_end, start, end in row_blocks(rows, block_rows, halo):
+        t10 = windows['t10'].read(read_start, read_end)
+        t11 = windows['t11'].read(read_start, read_end)
+        if 'mask' in windows:
+            masked = windows['mask'].read(read_start, read_end)
+            t10 = numpy.where(masked, numpy.nan, t10)
+            t11 = numpy.where(masked, numpy.nan, t11)
+        block = slice(start - read_start, end - read_start)
+        products = {'t10': t10[block], 't11': t11[block]}
+
+        if given_cwv:
+            products['cwv'] = [windows['cwv'].read(start, end)]
+        else:
+            results = compute_column_water_vapor_arrays(
+                    cwvs,
+                    t10,
+                    t11,
+                    median=median,
+                    block_rows=read_end - read_start,
+                    accuracy=accuracy,
+            )
+            if accuracy:
+                products['cwv'] = [cwv[block] for cwv, _ in results]
+                products['accuracy'] = [values[block] for _, values in results]
+            else:
+                products['cwv'] = [cwv[block] for cwv in results]
+
+        landcover = None
+        if 'avg_lse' in windows:
+            products['avg_lse'] = windows['avg_lse'].read(start, end)
+            products['delta_lse'] = windows['delta_lse'].read(start, end)
+        elif 'landcover' in windows:
+            landcover = windows['landcover'].read(start, end)
+            if emissivities:
+                (products['avg_lse'], products['delta_lse'],
+                 products['e10'], products['e11']) = \
+                    split_window_lst.compute_emissivity_arrays(
+                            landcover,
+                            ('average', 'delta', 't10', 't11'),
+                    )
+                landcover = None
+
+        products['lst'] = [
+            split_window_lst.compute_lst_array(
+                products['t10'],
+                products['t11'],
+                cwv,
+                products.get('avg_lse'),
+                products.get('delta_lse'),
+                landcover,
+            )
+            for cwv in products['cwv']
+        ]
+        yield start, end, products
+
+
+def estimate_lst_fused(
+        outnames,
+        t10,
+        t11,
+        cwvs,
+        split_window_lst,
+        landsat8=None,
+        null=False,
+        landcover_map=None,
+        avg_lse_map=None,
+        delta_lse_map=None,
+        cwv_map=None,
+        cloud_mask=None,
+        median=False,
+        brightness_temperature_prefix=None,
+        emissivity_output=None,
+        delta_emissivity_output=None,
+        emissivity_10_output=None,
+        emissivity_11_output=None,
+        cwv_outputs=(),
+        accuracy_maps=(),
+        rounding=False,
+        celsius=False,
+        block_rows=BLOCK_ROWS,
+        info=False,
+    ):
+    """
+    Produce Land Surface Temperature maps, one per Column_Water_Vapor
+    object, in a single streamed pass over the input maps. See
+    fused_blocks().
+
+    Parameters
+    ----------
+    outnames
+        Names for the output LST maps, one per Column_Water_Vapor object
+
+    t10, t11
+        Names of the TIRS bands 10 and 11: digital numbers if a 'landsat8'
+        metadata object is given, else brightness temperatures
+
+    cwvs
+        Column_Water_Vapor objects, one per window size
+
+    split_window_lst
+        A SplitWindowLST object
+
+    landsat8
+        A Landsat8_MTL object converting digital numbers, via look-up tables
+
+    null
+        Treat zero digital numbers as NULL
+
+    landcover_map, avg_lse_map, delta_lse_map
+        Either of a FROM-GLC map or emissivity maps, or none of them for a
+        fixed land cover class
+
+    cwv_map
+        A column water vapor map, overriding its estimation
+
+    cloud_mask
+        A CloudMask, setting masked cells of the brightness temperatures to
+        NULL as they are read
+
+    brightness_temperature_prefix, emissivity_output, delta_emissivity_output,
+    emissivity_10_output, emissivity_11_output, cwv_outputs, accuracy_maps
+        Names for optional in-between products, written only if given. The
+        prefix is suffixed by the band numbers 10 and 11. Emissivities
+        are written only if derived from a landcover map, or given.
+    """
+    msg = '\n|i Estimating land surface temperature in a fused, single pass'
+    g.message(msg)
+
+    inputs = {'t10': t10, 't11': t11}
+    if avg_lse_map:
+        inputs.update(avg_lse=avg_lse_map, delta_lse=delta_lse_map)
+    elif landcover_map:
+        inputs['landcover'] = landcover_map
+    if cwv_map:
+        inputs['cwv'] = cwv_map
+    if cloud_mask and not cloud_mask.empty:
+        inputs['mask'] = cloud_mask.mapname
+
+    outputs = {('lst', index): outname
+               for index, outname in enumerate(outnames)}
+    if brightness_temperature_prefix:
+        outputs[('t10', None)] = brightness_temperature_prefix + '10'
+        outputs[('t11', None)] = brightness_temperature_prefix + '11'
+    if emissivity_output and (avg_lse_map or landcover_map):
+        outputs[('avg_lse', None)] = emissivity_output
+    if delta_emissivity_output and (avg_lse_map or landcover_map):
+        outputs[('delta_lse', None)] = delta_emissivity_output
+    if 'landcover' in inputs:
+        if emissivity_10_output:
+            outputs[('e10', None)] = emissivity_10_output
+        if emissivity_11_output:
+            outputs[('e11', None)] = emissivity_11_output
+    for index, cwv_output in enumerate(cwv_outputs):
+        if cwv_output:
+            outputs[('cwv', index)] = cwv_output
+    for index, accuracy_map in enumerate(accuracy_maps):
+        if accuracy_map:
+            outputs[('accuracy', index)] = accuracy_map
+
+    readers = {name: open_raster_rows(mapname)
+               for name, mapname in inputs.items()}
+    writers = {key: open_raster_rows(mapname, mode='w')
+               for key, mapname in outputs.items()}
+    try:
+        windows = {}
+        for name, reader in readers.items():
+            convert = None
+            if landsat8 and name in ('t10', 't11'):
+                table = landsat8.brightness_temperature_table(name[1:])
+                convert = (lambda values, table=table:
+                           lookup_brightness_temperature(values, table, null))
+            elif name == 'mask':
+                convert = cloud_mask.compute_array
+            windows[name] = RowWindow(
+                    lambda row, reader=reader: read_raster_row(reader, row),
+                    convert,
+            )
+
+        rows = readers['t10'].info.rows
+        emissivities = any(product in ('avg_lse', 'delta_lse', 'e10', 'e11')
+                           for product, _ in outputs)
+        for start, end, products in fused_blocks(
+                windows,
+                rows,
+                cwvs,
+                split_window_lst,
+                median=median,
+                accuracy=any(accuracy_maps),
+                emissivities=emissivities,
+                block_rows=block_rows,
+            ):
+            lst = products['lst']
+            if rounding:
+                lst = [round_like_mapcalc(values, 2, 0.5) for values in lst]
+            if celsius:
+                lst = [values - 273.15 for values in lst]
+            products['lst'] = lst
+            for (product, index), writer in writers.items():
+                values = products[product]
+                if index is not None:
+                    values = values[index]
+                for row_values in values:
+                    write_raster_row(writer, row_values)
+    finally:
+        for raster in list(readers.values()) + list(writers.values()):
+            raster.close()
+
+    if info:
+        for outname in outputs.values():
+            run('r.info', map=outname, flags='r')
@@ -1,4 +1,5 @@
 import os
+from contextlib import contextmanager
 import grass.script as grass
 from grass.pygrass.modules.shortcuts import raster as r
 from grass.pygrass.modules.shortcuts import general as g
@@ -11,8 +12,30 @@ def cleanup():
     grass.run_command('g.remove', flags='f', type="rast",
                       pattern='tmp.{pid}*'.format(pid=os.getpid()), quiet=True)
 
-    if grass.find_file(name='MASK', element='cell')['file']:
-        r.mask(flags='r', verbose=True)
+
+@contextmanager
+def region_override(**kwargs):
+    """
+    Temporarily override the computational region, for this process and the
+    modules it runs, via the GRASS_REGION environment variable. Keyword
+    arguments are those of g.region, for example:
+
+    with region_override(res=100, flags='a'):
+        ...
+
+    Unlike grass.use_temp_region(), this nests safely within a temporary
+    region.
+    """
+    region = grass.region_env(**kwargs)
+    previous_region = os.environ.get('GRASS_REGION')
+    os.environ['GRASS_REGION'] = region
+    try:
+        yield
+    finally:
+        if previous_region is None:
+            del os.environ['GRASS_REGION']
+        else:
+            os.environ['GRASS_REGION'] = previous_region
 
 
 def tmp_map_name(name):
@@ -33,6 +56,89 @@ def run(cmd, **kwargs):
     grass.run_command(cmd, quiet=True, **kwargs)
 
 
+def read_raster(mapname):
+    """
+    Read a raster map, within the current computational region, in to a
+    NumPy array. NULL cells are read as NaN.
+    """
+    from grass.script import array as garray
+    return garray.array(mapname=mapname, null='nan')
+
+
+def read_masked_rasters(mapnames, mask=None):
+    """
+    Read raster maps, as read_raster() does, setting the cells masked by an
+    optional CloudMask (see quality_assessment.py) to NaN. The mask map is
+    read once for all maps.
+    """
+    import numpy
+    arrays = [read_raster(mapname) for mapname in mapnames]
+    if mask and not mask.empty:
+        masked = mask.compute_array(numpy.asarray(read_raster(mask.mapname)))
+        for array in arrays:
+            array[masked] = numpy.nan
+    return arrays
+
+
+def write_raster(array, mapname):
+    """
+    Write a NumPy array, matching the current computational region, to a
+    raster map. NaN cells are written as NULL.
+    """
+    from grass.script import array as garray
+    raster = garray.array()
+    raster[...] = array
+    raster.write(mapname=mapname, null='nan', overwrite=True)
+
+
+def open_raster_rows(mapname, mode='r'):
+    """
+    Open a raster map for row-wise reading (mode 'r') or writing (mode 'w',
+    as a DCELL map) within the current computational region. Close it via
+    its close() method.
+    """
+    from grass.pygrass.raster import RasterRow
+    raster = RasterRow(mapname)
+    if mode == 'w':
+        raster.open('w', 'DCELL', overwrite=True)
+    else:
+        raster.open('r')
+    return raster
+
+
+def read_raster_row(raster, row):
+    """
+    Read a row of a raster map opened by open_raster_rows() in to a NumPy
+    array of floats. NULL cells are read as NaN.
+    """
+    import numpy
+    values = numpy.array(raster[row], dtype=numpy.float64)
+    if raster.mtype == 'CELL':
+        values[values == -2**31] = numpy.nan  # CELL NULL
+    return values
+
+
+def read_raster_rows(raster, start, end):
+    """
+    Read the rows [start, end) of a raster map opened by open_raster_rows()
+    in to a 2D NumPy array of floats. NULL cells are read as NaN.
+    """
+    import numpy
+    return numpy.array([read_raster_row(raster, row)
+                        for row in range(start, end)])
+
+
+def write_raster_row(raster, values):
+    """
+    Append a row of values to a raster map opened by open_raster_rows() in
+    mode 'w'. NaN cells are written as NULL.
+    """
+    from grass.pygrass.raster.buffer import Buffer
+    row = Buffer(values.shape, mtype='DCELL')
+    row[:] = values
+    raster.put_row(row)
+
+
 def save_map(mapname):
     """
     Helper function to save some in-between maps, assisting in debugging
@@ -73,34 +179,3 @@ def add_timestamp(mtl_filename, outname):
     #grass.verbose(msg)
 
     run('r.timestamp', map=outname, date=date_time_string)
-
-
-def mask_clouds(qa_band, qa_pixel):
-    """
-    ToDo:
-
-    - a better, independent mechanism for QA. --> see also Landsat8 class.
-    - support for multiple qa_pixel values (eg. input as a list of values)
-
-    Create and apply a cloud mask based on the Quality Assessment Band
-    (BQA.) Source: <http://landsat.usgs.gov/L8QualityAssessmentBand.php
-
-    See also:
-    http://courses.neteler.org/processing-landsat8-data-in-grass-gis-7/#Applying_the_Landsat_8_Quality_Assessment_%28QA%29_Band
-    """
-    msg = ('\n|i Masking for pixel values <{qap}> '
-           'in the Quality Assessment band.'.format(qap=qa_pixel))
-    g.message(msg)
-
-    #tmp_cloudmask = tmp_map_name('cloudmask')
-    #qabits_expression = 'if({band} == {pixel}, 1, null())'.format(band=qa_band,
-    #                                                              pixel=qa_pixel)
-
-    #cloud_masking_equation = equation.format(result=tmp_cloudmask,
-    #                                         expression=qabits_expression)
-    #grass.mapcalc(cloud_masking_equation)
-
-    r.mask(raster=qa_band, maskcats=qa_pixel, flags='i', overwrite=True)
-
-    # save for debuging
-    #save_map(tmp_cloudmask)
@@ -100,7 +100,7 @@
 
 #%flag
 #% key: n
-#% description: Set zero digital numbers in b10, b11 to NULL | ToDo: Perform in copy of input input maps!
+#% description: Treat zero digital numbers in b10, b11 as NULL, leaving the input maps untouched
 #%end
 
 #%flag
@@ -115,7 +115,7 @@
 
 #%flag
 #%  key: a
-#%  description: Report on column water vapor retrieval accuracy based on the MSWCVM method
+#%  description: Report on column water vapor retrieval accuracy (Rji * Rij) based on the MSWCVM method
 #%end
 
 #%flag
@@ -133,6 +133,16 @@
 #% description: Time-stamp the output LST (and optional CWV) map
 #%end
 
+#%flag
+#% key: f
+#% description: Fused, single pass from digital numbers to LST without in-between maps, unless requested
+#%end
+
+#%flag
+#% key: d
+#% description: Disable reusing outputs of previous runs which are up to date, recompute all stages | Up to date outputs are reused also with --overwrite
+#%end
+
 #%option G_OPT_F_INPUT
 #% key: mtl
 #% key_desc: filename
@@ -232,12 +242,39 @@
 #%option
 #% key: qapixel
 #% key_desc: pixelvalue
-#% description: Quality assessment pixel value for which to build a mask | Source: <http://landsat.usgs.gov/L8QualityAssessmentBand.php>.
-#% answer: 61440
+#% description: Quality assessment pixel values for which to build a mask, overriding the decoding of the QA band by bit flags | Source: <http://landsat.usgs.gov/L8QualityAssessmentBand.php>. For example, 61440
+#% required: no
+#% multiple: yes
+#%end
+
+#%option
+#% key: qa_collection
+#% key_desc: integer
+#% type: integer
+#% description: Landsat Collection of the Quality Assessment band, decoding it by bit flags | 1: BQA, 2: QA_PIXEL. If neither this nor 'qapixel' is given, the Collection 1 BQA pixel value 61440 is masked
+#% options: 1, 2
+#% required: no
+#%end
+
+#%option
+#% key: qa_mask
+#% key_desc: string
+#% description: Conditions, decoded from the Quality Assessment band's bit flags, for which to mask pixels
+#% options: fill, cloud, dilated_cloud, cirrus, shadow, snow
+#% answer: fill,cloud,cirrus,shadow
 #% required: no
 #% multiple: yes
 #%end
 
+#%option
+#% key: qa_confidence
+#% key_desc: string
+#% description: Minimum confidence level of the Quality Assessment band's cloud, cirrus, shadow and snow conditions to mask
+#% options: low, medium, high
+#% answer: high
+#% required: no
+#%end
+
 #%rules
 #% excludes: prefix, b10, b11, qab
 #%end
@@ -245,7 +282,7 @@
 #%option G_OPT_R_INPUT
 #% key: clouds
 #% key_desc: name
-#% description: A raster map applied as an inverted MASK | Overrides 'qab'
+#% description: A raster map of which non-NULL cells are masked | Overrides 'qab'
 #% required : no
 #%end
 
@@ -281,6 +318,20 @@
 #% required: no
 #%end
 
+#%option G_OPT_R_OUTPUT
+#% key: emissivity_10_out
+#% key_desc: name
+#% description: Name for output emissivity map of TIRS channel 10, derived from the FROM-GLC map
+#% required: no
+#%end
+
+#%option G_OPT_R_OUTPUT
+#% key: emissivity_11_out
+#% key_desc: name
+#% description: Name for output emissivity map of TIRS channel 11, derived from the FROM-GLC map
+#% required: no
+#%end
+
 #%option G_OPT_R_INPUT
 #% key: landcover
 #% key_desc: name
@@ -312,8 +363,76 @@
 #%option
 #% key: window
 #% key_desc: integer
-#% description: Odd number n sizing an n^2 spatial window for column water vapor retrieval | Increase to reduce spatial discontinuation in the final LST
+#% description: Odd number n sizing an n^2 spatial window for column water vapor retrieval | Increase to reduce spatial discontinuation in the final LST. Several sizes, e.g. 7,9,11,15, produce one column water vapor and one LST map per size, suffixed by the size
 #% answer: 7
+#% multiple: yes
+#% required: no
+#%end
+
+#%option
+#% key: window_stride
+#% key_desc: integer
+#% type: integer
+#% description: Use only every k-th row and column of the spatial window for column water vapor retrieval | Keeps the footprint of a large window at a fraction of the cost. Must be smaller than half the window size
+#% answer: 1
+#% required: no
+#%end
+
+#%option
+#% key: min_valid_fraction
+#% key_desc: fraction
+#% type: double
+#% description: Minimum fraction of valid (non-NULL) pixels in the spatial window for column water vapor retrieval | Below 1, window statistics are normalised by the count of valid pixels so that masked clouds or water do not grow by the window radius
+#% options: 0-1
+#% answer: 1
+#% required: no
+#%end
+
+#%option
+#% key: cwv_engine
+#% key_desc: string
+#% description: Engine computing the column water vapor spatial window statistics | mapcalc: a single r.mapcalc expression, switching to separable, with a message, for windows of 11 or larger, for a min_valid_fraction below 1 or for the retrieval accuracy; separable: row then column partial sums in two r.mapcalc passes; numpy: summed-area tables, cost independent of the window size, reading blocks of rows extended by the largest window radius; neighbors: window moment maps via r.neighbors
+#% options: mapcalc, separable, numpy, neighbors
+#% answer: mapcalc
+#% required: no
+#%end
+
+#%option
+#% key: bt_engine
+#% key_desc: string
+#% description: Engine converting digital numbers to at-satellite temperature | mapcalc: a single r.mapcalc pass evaluating the conversion per pixel; lut: NumPy, row by row, looking up the temperature of each digital number in a precomputed table
+#% options: mapcalc, lut
+#% answer: mapcalc
+#% required: no
+#%end
+
+#%option
+#% key: lst_engine
+#% key_desc: string
+#% description: Engine evaluating the split-window LST model | mapcalc: a single r.mapcalc expression looking up the coefficients of each pixel's column water vapor; numpy: the same look-up on NumPy arrays, holding the input maps in memory as a whole (about 8 bytes per cell and map)
+#% options: mapcalc, numpy
+#% answer: mapcalc
+#% required: no
+#%end
+
+#%option
+#% key: cache_size
+#% key_desc: integer
+#% type: integer
+#% description: Number of emissivity map sets, per landcover map and region, to keep in the current mapset for subsequent runs | 0 disables the cache
+#% answer: 8
+#% required: no
+#%end
+
+#%option G_OPT_M_NPROCS
+#% description: Number of threads for r.neighbors, used by the 'neighbors' column water vapor engine
+#%end
+
+#%option
+#% key: cwv_resolution
+#% key_desc: resolution
+#% type: double
+#% description: Resolution (map units) of a coarser grid, aligned to the current region, on which to estimate column water vapor, interpolated bilinearly back to the current region | For example 90, a multiple of 30, near the native 100m TIRS resolution. Larger than the region's resolution. Note, the window size then counts coarse cells
 #% required: no
 #%end
 
@@ -331,10 +450,19 @@
 #% required: no
 #%end
 
+#%option G_OPT_R_OUTPUT
+#% key: cwv_accuracy
+#% key_desc: name
+#% description: Name for output column water vapor retrieval accuracy map (Rji * Rij, the squared correlation of Ti and Tj in the spatial window) | Derived from the same window moments as column water vapor
+#% required: no
+#%end
+
 #%rules
 #% required: window, cwv
 #% exclusive: window, cwv
 #% exclusive: cwv, cwv_out
+#% exclusive: cwv, cwv_resolution
+#% exclusive: cwv, cwv_accuracy
 #%end
 
 # required librairies
@@ -353,7 +481,8 @@ import functools
 
 from citations import CITATION_COLUMN_WATER_VAPOR
 from citations import CITATION_SPLIT_WINDOW
-from column_water_vapor import estimate_cwv
+from column_water_vapor import estimate_cwv_sweep
+from column_water_vapor import report_retrieval_accuracy
 from split_window_lst import SplitWindowLST
 from landsat8_mtl import Landsat8_MTL
 from helpers import cleanup
@@ -362,7 +491,6 @@ from helpers import run
 from helpers import save_map
 from helpers import extract_number_from_string
 from helpers import add_timestamp
-from helpers import mask_clouds
 from randomness import random_digital_numbers
 from randomness import random_column_water_vapor_subrange
 from randomness import random_column_water_vapor_value
@@ -389,13 +517,18 @@ from messages import MSG_AVERAGE_EMISSIVITIES
 from messages import MSG_PICK_RANDOM_CLASS
 # from messages import MSG_CLOUD_MASK
 from column_water_vapor import Column_Water_Vapor
-from emissivity import determine_average_emissivity
-from emissivity import determine_delta_emissivity
+from emissivity import determine_emissivities
+from cache import EmissivityCache
+from cache import StageCache
+from cache import map_identity
 from dummy_mapcalc_strings import replace_dummies
 from radiance import digital_numbers_to_radiance
 from radiance import radiance_to_brightness_temperature
-from temperature import tirs_to_at_satellite_temperature
+from temperature import tirs_to_at_satellite_temperatures
+from quality_assessment import CloudMask
+from quality_assessment import QA_PIXEL_DEFAULT
 from temperature import estimate_lst
+from fused import estimate_lst_fused
 
 
 if "GISBASE" not in os.environ:
@@ -439,6 +572,10 @@ def main():
             qab = False
 
     qapixel = options['qapixel']
+    qa_collection = options['qa_collection']
+    qa_collection = int(qa_collection) if qa_collection else None
+    qa_conditions = tuple(options['qa_mask'].split(','))
+    qa_confidence = options['qa_confidence']
     lst_output = options['lst']
 
     # save Brightness Temperature maps?
@@ -449,12 +586,35 @@ def main():
 
     if options['cwv']:
         tmp_cwv = options['cwv']
+        cwv_window_sizes = [None]
     else:
-        tmp_cwv = tmp_map_name('cwv')
-        cwv_window_size = int(options['window'])
+        cwv_window_sizes = sorted({int(size)
+                                   for size in options['window'].split(',')})
+        cwv_window_stride = int(options['window_stride'])
+        min_valid_fraction = float(options['min_valid_fraction'])
+        cwv_engine = options['cwv_engine']
+        nprocs = int(options['nprocs'])
+        cwv_resolution = options['cwv_resolution']
+        if cwv_resolution:
+            cwv_resolution = float(cwv_resolution)
+            region = grass.region()
+            if cwv_resolution <= max(region['nsres'], region['ewres']):
+                grass.fatal(_('The column water vapor resolution should be '
+                              'coarser than the resolution of the '
+                              'computational region'))
         assertion_for_cwv_window_size_msg = MSG_ASSERTION_WINDOW_SIZE
-        assert cwv_window_size >= 7, assertion_for_cwv_window_size_msg
+        assert min(cwv_window_sizes) >= 7, assertion_for_cwv_window_size_msg
     cwv_output = options['cwv_out']
+    accuracy_map = options['cwv_accuracy']
+
+    # one set of outputs per window size, suffixed if sweeping
+    def per_window(name, window_size):
+        if name and len(cwv_window_sizes) > 1:
+            return f'{name}_{window_size}'
+        return name
+
+    lst_outputs = [per_window(lst_output, size) for size in cwv_window_sizes]
+    cwv_outputs = [per_window(cwv_output, size) for size in cwv_window_sizes]
 
     # optional maps
     average_emissivity_map = options['emissivity']
@@ -463,8 +623,13 @@ def main():
     # output for in-between maps?
     emissivity_output = options['emissivity_out']
     delta_emissivity_output = options['delta_emissivity_out']
+    emissivity_10_output = options['emissivity_10_out']
+    emissivity_11_output = options['emissivity_11_out']
+    cache_size = int(options['cache_size'])
 
     landcover_map = options['landcover']
+    lst_engine = options['lst_engine']
+    bt_engine = options['bt_engine']
     landcover_class = options['landcover_class']
 
     # flags
@@ -476,6 +641,13 @@ def main():
     rounding = flags['r']
     celsius = flags['c']
     timestamping = flags['t']
+    fused = flags['f']
+    reuse_stages = not flags['d']
+
+    if accuracy and not accuracy_map and not options['cwv']:
+        accuracy_map = tmp_map_name('cwv_accuracy')
+    accuracy_maps = [per_window(accuracy_map, size)
+                     for size in cwv_window_sizes]
 
     #
     # Pre-production actions
@@ -501,44 +673,117 @@ def main():
     # 1. Mask clouds
     #
 
+    # applied as a predicate on the brightness temperatures, not as a MASK
+    cloud_mask = None
     if cloud_map:
-        msg = f'\n|i Using user defined \'{cloud_map}\' as a MASK'
+        msg = f'\n|i Using user defined \'{cloud_map}\' as a cloud mask'
         g.message(msg)
-        r.mask(raster=cloud_map, flags='i', overwrite=True)
-
-    else:
-        # using the quality assessment band and a "QA" pixel value
-        mask_clouds(qab, qapixel)
+        cloud_mask = CloudMask(cloud_map, qa=False)
+
+    elif qab:
+        # using the quality assessment band's bit flags, given its
+        # collection, or else "QA" pixel values
+        if not (qapixel or qa_collection):
+            qapixel = QA_PIXEL_DEFAULT
+            msg = ('\n|i Masking the Collection 1 QA pixel value '
+                   f'{QA_PIXEL_DEFAULT}, set qa_collection to decode the QA '
+                   'band by bit flags instead')
+            g.message(msg)
+        cloud_mask = CloudMask(
+                qab,
+                qapixel.split(',') if qapixel else None,
+                collection=qa_collection,
+                conditions=qa_conditions,
+                confidence=qa_confidence,
+        )
+        if cloud_mask.empty:
+            g.message('\n|i No pixels to mask')
+            cloud_mask = None
+
+    # provenance of the outputs of each stage, to skip up to date stages
+    stages = StageCache(reuse=reuse_stages)
+    mask_provenance = {
+        'clouds': map_identity(cloud_map) if cloud_map else None,
+        'qab': map_identity(qab) if qab else None,
+        'qapixel': qapixel,
+        'qa_collection': qa_collection,
+        'qa_mask': qa_conditions,
+        'qa_confidence': qa_confidence,
+    }
+    bt_digests = {
+        't10': map_identity(options['t10']) if options['t10'] else None,
+        't11': map_identity(options['t11']) if options['t11'] else None,
+    }
 
     #
     # 2. TIRS > Brightness Temperatures
     #
 
-    if mtl_file:
-        # if MTL and b10 given, use it to compute at-satellite temperature t10
-        if b10:
-            t10 = tirs_to_at_satellite_temperature(
-                    b10,
-                    mtl_file,
-                    brightness_temperature_prefix,
-                    null,
-                    info=info,
+    if mtl_file and not fused:
+        # if MTL and b10, b11 given, compute at-satellite temperatures t10,
+        # t11 in a single pass, unless up to date
+        landsat8 = Landsat8_MTL(mtl_file)
+        temperatures = {'t10': options['t10'], 't11': options['t11']}
+        tirs_bands = {}
+        for name, band in (('t10', b10), ('t11', b11)):
+            if not band:
+                continue
+            band_number = extract_number_from_string(band)
+            bt_digests[name] = stages.digest(
+                    'brightness_temperature',
+                    band=map_identity(band),
+                    conversion=landsat8.toar_brightness_temperature(
+                        band_number),
+                    null=null,
+                    engine=bt_engine,
+                    mask=mask_provenance,
             )
-        # likewise for b11 -> t11
-        if b11:
-            t11 = tirs_to_at_satellite_temperature(
-                    b11,
+            bt_output = None
+            if brightness_temperature_prefix:
+                bt_output = brightness_temperature_prefix + band_number
+            if stages.skip([bt_output], bt_digests[name],
+                           f'converting {band}'):
+                temperatures[name] = bt_output
+            else:
+                tirs_bands[name] = band
+        if tirs_bands:
+            converted = tirs_to_at_satellite_temperatures(
+                    list(tirs_bands.values()),
                     mtl_file,
                     brightness_temperature_prefix,
                     null,
                     info=info,
+                    engine=bt_engine,
+                    mask=cloud_mask,
             )
+            temperatures.update(zip(tirs_bands, converted))
+            if brightness_temperature_prefix:
+                for name, bt_output in zip(tirs_bands, converted):
+                    stages.record([bt_output], bt_digests[name])
+        t10, t11 = temperatures['t10'], temperatures['t11']
+
+    # brightness temperatures converted from digital numbers are masked,
+    # given ones are masked by the stages reading them
+    temperatures_mask = None
+    if options['t10'] or options['t11']:
+        temperatures_mask = cloud_mask
 
     #
     # 3. Land Surface Emissivities
     #
 
     split_window_lst = SplitWindowLST(landcover_class)
+    lst_expression = split_window_lst.sw_lst_mapcalc
+    emissivity_digest = stages.digest(
+            'emissivity',
+            landcover_class=split_window_lst.landcover_class,
+            landcover=map_identity(landcover_map) if landcover_map else None,
+            average=(map_identity(average_emissivity_map)
+                     if average_emissivity_map else None),
+            delta=(map_identity(delta_emissivity_map)
+                   if delta_emissivity_map else None),
+            lookup=split_window_lst.emissivity_lookup_digest(),
+    )
 
     if landcover_class:
 
@@ -564,99 +809,298 @@ def main():
 
         g.message(msg)
 
+    # derive emissivities per block of rows within the fused pipeline
+    elif fused:
+        tmp_avg_lse = tmp_delta_lse = None
+
+    # look up emissivity terms from the FROM-GLC map within the LST expression
+    elif landcover_map and not (average_emissivity_map
+                                or delta_emissivity_map
+                                or emissivity_output
+                                or delta_emissivity_output
+                                or emissivity_10_output
+                                or emissivity_11_output):
+        tmp_avg_lse = tmp_delta_lse = None
+        lst_expression = split_window_lst.sw_lst_landcover_mapcalc
+        msg = ('\n|i Looking up emissivity terms per land cover class, '
+               'skipping average and delta emissivity maps')
+        g.message(msg)
+
     # use the FROM-GLC map
     elif landcover_map:
 
         if average_emissivity_map:
             tmp_avg_lse = average_emissivity_map
-
-        if not average_emissivity_map:
-            determine_average_emissivity(
-                    tmp_avg_lse,
-                    emissivity_output,
-                    landcover_map,
-                    split_window_lst.average_lse_mapcalc,
-                    info=info,
-            )
-            if options['emissivity_out']:
-                tmp_avg_lse = options['emissivity_out']
+        elif emissivity_output:
+            tmp_avg_lse = emissivity_output
 
         if delta_emissivity_map:
             tmp_delta_lse = delta_emissivity_map
+        elif delta_emissivity_output:
+            tmp_delta_lse = delta_emissivity_output
 
+        # derive the missing emissivity maps in a single pass
+        emissivity_maps = {}
+        if not average_emissivity_map:
+            emissivity_maps['average'] = tmp_avg_lse
         if not delta_emissivity_map:
-            determine_delta_emissivity(
-                    tmp_delta_lse,
-                    delta_emissivity_output,
+            emissivity_maps['delta'] = tmp_delta_lse
+        if emissivity_10_output:
+            emissivity_maps['t10'] = emissivity_10_output
+        if emissivity_11_output:
+            emissivity_maps['t11'] = emissivity_11_output
+
+        # skip requested emissivity maps, if up to date
+        emissivity_outputs = [outname for outname in emissivity_maps.values()
+                              if outname in (emissivity_output,
+                                             delta_emissivity_output,
+                                             emissivity_10_output,
+                                             emissivity_11_output)]
+        if stages.skip(emissivity_outputs, emissivity_digest,
+                       'deriving emissivities'):
+            emissivity_maps = {emissivity: outname
+                               for emissivity, outname
+                               in emissivity_maps.items()
+                               if outname not in emissivity_outputs}
+
+        if emissivity_maps:
+            emissivity_cache = None
+            if cache_size > 0:
+                emissivity_cache = EmissivityCache(cache_size)
+            determine_emissivities(
+                    emissivity_maps,
                     landcover_map,
-                    split_window_lst.delta_lse_mapcalc,
+                    split_window_lst,
                     info=info,
+                    cache=emissivity_cache,
             )
-            if options['delta_emissivity_out']:
-                tmp_delta_lse = options['delta_emissivity_out']
+            stages.record([outname for outname in emissivity_maps.values()
+                           if outname in emissivity_outputs],
+                          emissivity_digest)
 
     #
-    # 4. Estimate Column Water Vapor
+    # 4. & 5. Fused, single pass from digital numbers to Land Surface
+    # Temperature
     #
 
-    if not options['cwv']:
-        estimate_cwv(
-                temporary_map=tmp_cwv,
-                cwv_map=cwv_output,
-                t10=t10,
-                t11=t11,
-                window_size=cwv_window_size,
+    if fused:
+        if options['cwv_resolution']:
+            grass.fatal(_('The fused pipeline estimates column water vapor '
+                          'at the resolution of the computational region'))
+        landsat8 = None
+        if mtl_file and b10 and b11:
+            landsat8 = Landsat8_MTL(mtl_file)
+            t10, t11 = b10, b11
+        elif options['t10'] and options['t11']:
+            t10, t11 = options['t10'], options['t11']
+        else:
+            grass.fatal(_('The fused pipeline requires either of the '
+                          'b10, b11 or t10, t11 pairs of maps'))
+        cwvs = []
+        if not options['cwv']:
+            cwvs = [Column_Water_Vapor(window_size, t10, t11,
+                                       cwv_window_stride, min_valid_fraction)
+                    for window_size in cwv_window_sizes]
+        avg_lse_map = delta_lse_map = fused_landcover_map = None
+        if not landcover_class:
+            if average_emissivity_map and delta_emissivity_map:
+                avg_lse_map = average_emissivity_map
+                delta_lse_map = delta_emissivity_map
+            else:
+                fused_landcover_map = landcover_map
+
+        # skip the pipeline, if all requested outputs are up to date
+        fused_outputs = list(lst_outputs)
+        if brightness_temperature_prefix:
+            fused_outputs += [brightness_temperature_prefix + '10',
+                              brightness_temperature_prefix + '11']
+        if avg_lse_map or fused_landcover_map:
+            fused_outputs += [emissivity_output, delta_emissivity_output]
+        if fused_landcover_map:
+            fused_outputs += [emissivity_10_output, emissivity_11_output]
+        if cwvs:
+            fused_outputs += cwv_outputs
+            if options['cwv_accuracy']:
+                fused_outputs += accuracy_maps
+        fused_digest = stages.digest(
+                'fused',
+                temperatures=bt_digests,
+                bands=[map_identity(t10), map_identity(t11)],
+                conversions=([landsat8.toar_brightness_temperature(band)
+                              for band in ('10', '11')]
+                             if landsat8 else None),
+                null=null,
+                emissivity=emissivity_digest,
+                cwv=map_identity(options['cwv']) if options['cwv'] else None,
+                window_sizes=cwv_window_sizes,
+                window_stride=None if options['cwv'] else cwv_window_stride,
+                min_valid_fraction=(None if options['cwv']
+                                    else min_valid_fraction),
                 median=median,
-                info=info,
+                rounding=rounding,
+                celsius=celsius,
+                mask=mask_provenance,
+                outputs=fused_outputs,
         )
-    else:
-        msg = f'\n|! User defined map \'{tmp_cwv}\' for atmospheric column water vapor'
-        g.message(msg)
-
-    if cwv_output:
-        tmp_cwv = cwv_output
+        # temporary accuracy maps do not outlive a run
+        reusable = not (accuracy and cwvs and not options['cwv_accuracy'])
+        if not (reusable and stages.skip(fused_outputs, fused_digest,
+                                         'the fused pipeline')):
+            estimate_lst_fused(
+                    outnames=lst_outputs,
+                    t10=t10,
+                    t11=t11,
+                    cwvs=cwvs,
+                    split_window_lst=split_window_lst,
+                    landsat8=landsat8,
+                    null=null,
+                    landcover_map=fused_landcover_map,
+                    avg_lse_map=avg_lse_map,
+                    delta_lse_map=delta_lse_map,
+                    cwv_map=options['cwv'] or None,
+                    cloud_mask=cloud_mask,
+                    median=median,
+                    brightness_temperature_prefix=brightness_temperature_prefix,
+                    emissivity_output=emissivity_output,
+                    delta_emissivity_output=delta_emissivity_output,
+                    emissivity_10_output=emissivity_10_output,
+                    emissivity_11_output=emissivity_11_output,
+                    cwv_outputs=cwv_outputs if cwvs else (),
+                    accuracy_maps=accuracy_maps if cwvs else (),
+                    rounding=rounding,
+                    celsius=celsius,
+                    info=info,
+            )
+            stages.record(fused_outputs, fused_digest)
+        if accuracy and cwvs:
+            for size, window_accuracy_map in zip(cwv_window_sizes,
+                                                 accuracy_maps):
+                report_retrieval_accuracy(window_accuracy_map, size)
 
-    #
-    # 5. Estimate Land Surface Temperature
-    #
+    else:
+        #
+        # 4. Estimate Column Water Vapor
+        #
+
+        if not options['cwv']:
+            cwv_digest = stages.digest(
+                    'column_water_vapor',
+                    temperatures=bt_digests,
+                    window_sizes=cwv_window_sizes,
+                    window_stride=cwv_window_stride,
+                    min_valid_fraction=min_valid_fraction,
+                    median=median,
+                    engine=cwv_engine,
+                    resolution=cwv_resolution,
+                    mask=mask_provenance,
+            )
+            # named outputs only, temporary maps do not outlive a run
+            sweep_outputs = [outname for outname in cwv_outputs if outname]
+            if options['cwv_accuracy']:
+                sweep_outputs += accuracy_maps
+            elif accuracy:
+                sweep_outputs = []
+
+            # land surface temperature reads the column water vapor maps
+            if stages.skip(sweep_outputs, cwv_digest,
+                           'estimating column water vapor',
+                           reads=cwv_outputs):
+                tmp_cwvs = cwv_outputs
+
+            else:
+                tmp_cwvs = [tmp_map_name(f'cwv_{size}')
+                            for size in cwv_window_sizes]
+                estimate_cwv_sweep(
+                        temporary_maps=tmp_cwvs,
+                        cwv_maps=cwv_outputs,
+                        t10=t10,
+                        t11=t11,
+                        window_sizes=cwv_window_sizes,
+                        window_stride=cwv_window_stride,
+                        min_valid_fraction=min_valid_fraction,
+                        median=median,
+                        info=info,
+                        engine=cwv_engine,
+                        nprocs=nprocs,
+                        cwv_resolution=cwv_resolution,
+                        accuracy_maps=accuracy_maps,
+                        mask=temperatures_mask,
+                )
+                stages.record(sweep_outputs, cwv_digest)
+
+            if accuracy:
+                for size, window_accuracy_map in zip(cwv_window_sizes,
+                                                     accuracy_maps):
+                    report_retrieval_accuracy(window_accuracy_map, size)
+        else:
+            tmp_cwvs = [tmp_cwv]
+            cwv_digest = map_identity(tmp_cwv)
+            msg = f'\n|! User defined map \'{tmp_cwv}\' for atmospheric column water vapor'
+            g.message(msg)
 
-    if info and landcover_class == 'Random':
-        msg = MSG_PICK_RANDOM_CLASS
-        grass.verbose(msg)
-
-    estimate_lst(
-            outname=lst_output,
-            t10=t10,
-            t11=t11,
-            landcover_map=landcover_map,
-            landcover_class=landcover_class,
-            avg_lse_map=tmp_avg_lse,
-            delta_lse_map=tmp_delta_lse,
-            cwv_map=tmp_cwv,
-            lst_expression=split_window_lst.sw_lst_mapcalc,
-            rounding=rounding,
-            celsius=celsius,
-            info=info,
-    )
+        if cwv_output:
+            tmp_cwvs = cwv_outputs
+
+        #
+        # 5. Estimate Land Surface Temperature
+        #
+
+        if info and landcover_class == 'Random':
+            msg = MSG_PICK_RANDOM_CLASS
+            grass.verbose(msg)
+
+        for lst_output, tmp_cwv, window_size in zip(lst_outputs, tmp_cwvs,
+                                                    cwv_window_sizes):
+            lst_digest = stages.digest(
+                    'land_surface_temperature',
+                    temperatures=bt_digests,
+                    emissivity=emissivity_digest,
+                    cwv=cwv_digest,
+                    window_size=window_size,
+                    engine=lst_engine,
+                    rounding=rounding,
+                    celsius=celsius,
+                    mask=mask_provenance,
+            )
+            if stages.skip([lst_output], lst_digest,
+                           f'estimating {lst_output}'):
+                continue
+            estimate_lst(
+                    outname=lst_output,
+                    t10=t10,
+                    t11=t11,
+                    landcover_map=landcover_map,
+                    landcover_class=landcover_class,
+                    avg_lse_map=tmp_avg_lse,
+                    delta_lse_map=tmp_delta_lse,
+                    cwv_map=tmp_cwv,
+                    lst_expression=lst_expression,
+                    rounding=rounding,
+                    celsius=celsius,
+                    info=info,
+                    engine=lst_engine,
+                    split_window_lst=split_window_lst,
+                    mask=temperatures_mask,
+            )
+            stages.record([lst_output], lst_digest)
 
     #
     # Post-production actions
     #
 
-    # remove MASK
-    r.mask(flags='r', verbose=True)
-
     if timestamping:
-        add_timestamp(mtl_file, lst_output)
+        for lst_output in lst_outputs:
+            add_timestamp(mtl_file, lst_output)
 
         if cwv_output:
-            add_timestamp(mtl_file, cwv_output)
+            for cwv_output in cwv_outputs:
+                add_timestamp(mtl_file, cwv_output)
 
     if celsius:
-        run('r.colors', map=lst_output, color='celsius')
+        run('r.colors', map=lst_outputs, color='celsius')
 
     else:
-        run('r.colors', map=lst_output, color='kelvin')
+        run('r.colors', map=lst_outputs, color='kelvin')
 
     # metadata
 
@@ -674,15 +1118,19 @@ def main():
     landsat8_metadata = Landsat8_MTL(mtl_file)
     source1_lst = landsat8_metadata.scene_id
     source2_lst = landsat8_metadata.origin
-    run("r.support",
-        map=lst_output,
-        title=title_lst,
-        units=units_lst,
-        description=description_lst,
-        source1=source1_lst,
-        source2=source2_lst,
-        history=history_lst,
-    )
+    for lst_output, window_size in zip(lst_outputs, cwv_window_sizes):
+        history = history_lst
+        if window_size:
+            history += f'\n\nSpatial window size: {window_size}^2'
+        run("r.support",
+            map=lst_output,
+            title=title_lst,
+            units=units_lst,
+            description=description_lst,
+            source1=source1_lst,
+            source2=source2_lst,
+            history=history,
+        )
 
     if scene_extent:
         grass.del_temp_region()  # restoring previous region
@@ -7,12 +7,18 @@
 
 import sys
 from collections import namedtuple
+from expressions import Constant
+from expressions import Variable
+from expressions import function
+from expressions import compose
+from expressions import evaluate
 
 
 # globals
 MTLFILE = ''
 DUMMY_MAPCALC_STRING_RADIANCE = 'Radiance'
 DUMMY_MAPCALC_STRING_DN = 'DigitalNumber'
+DIGITAL_NUMBERS = 2**16  # Level-1 products are 16-bit unsigned integers
 
 
 # helper functions
@@ -137,6 +143,19 @@ class Landsat8_MTL():
         """
         return self._mtl_lines
 
+    def radiance_model(self, bandnumber):
+        """
+        Return the expression tree (see expressions.py) of the conversion of
+        Digital Numbers to TOA Radiance. See toar_radiance().
+        """
+        multiplicative_factor = getattr(self.mtl, ('RADIANCE_MULT_BAND_' +
+                                        str(bandnumber)))
+        additive_factor = getattr(self.mtl, 'RADIANCE_ADD_BAND_' +
+                                  str(bandnumber))
+        digital_number = Variable(DUMMY_MAPCALC_STRING_DN)
+        return (Constant(multiplicative_factor) * digital_number
+                + Constant(additive_factor))
+
     def toar_radiance(self, bandnumber):
         """
         Note, this function returns a valid expression for GRASS GIS' r.mapcalc
@@ -163,20 +182,7 @@ class Landsat8_MTL():
         Some code borrowed from
         <https://github.com/micha-silver/grass-landsat8/blob/master/r.in.landsat8.py>
         """
-        multiplicative_factor = getattr(self.mtl, ('RADIANCE_MULT_BAND_' +
-                                        str(bandnumber)))
-        # print "ML:", multiplicative_factor
-
-        additive_factor = getattr(self.mtl, 'RADIANCE_ADD_BAND_' +
-                                  str(bandnumber))
-        # print "AL:", additive_factor
-
-        formula = '{ML}*{DUMMY_DN} + {AL}'
-        mapcalc = formula.format(ML=multiplicative_factor,
-                                 DUMMY_DN=DUMMY_MAPCALC_STRING_DN,
-                                 AL=additive_factor)
-
-        return mapcalc
+        return str(self.radiance_model(bandnumber))
 
     def toar_reflectance(self, bandnumber):
         """
@@ -224,6 +230,17 @@ class Landsat8_MTL():
         """
         pass
 
+    def temperature_model(self, bandnumber):
+        """
+        Return the expression tree (see expressions.py) of the conversion of
+        spectral radiance to at-satellite brightness temperature. See
+        radiance_to_temperature().
+        """
+        k2 = getattr(self.mtl, ('K2_CONSTANT_BAND_' + str(bandnumber)))
+        k1 = getattr(self.mtl, ('K1_CONSTANT_BAND_' + str(bandnumber)))
+        radiance = Variable(DUMMY_MAPCALC_STRING_RADIANCE)
+        return Constant(k2) / function('log', Constant(k1) / radiance + 1)
+
     def radiance_to_temperature(self, bandnumber):
         """
         Note, this function returns a valid expression for GRASS GIS' r.mapcalc
@@ -248,15 +265,43 @@ class Landsat8_MTL():
         - K2 = Band-specific thermal conversion constant from the metadata
           (K2_CONSTANT_BAND_x, where x is the band number, 10 or 11)
         """
-        k2 = getattr(self.mtl, ('K2_CONSTANT_BAND_' + str(bandnumber)))
-        k1 = getattr(self.mtl, ('K1_CONSTANT_BAND_' + str(bandnumber)))
+        return str(self.temperature_model(bandnumber))
+
+    def brightness_temperature_model(self, bandnumber):
+        """
+        Return the expression tree of the conversion of Digital Numbers to
+        at-satellite brightness temperature, composing radiance_model() in
+        to temperature_model().
+        """
+        return compose(self.temperature_model(bandnumber),
+                       {DUMMY_MAPCALC_STRING_RADIANCE:
+                        self.radiance_model(bandnumber)})
 
-        formula = '{K2} / ( log({K1} / {DUMMY_RADIANCE} + 1))'
-        mapcalc = formula.format(K2=k2,
-                                 K1=k1,
-                                 DUMMY_RADIANCE=DUMMY_MAPCALC_STRING_RADIANCE)
+    def toar_brightness_temperature(self, bandnumber):
+        """
+        Note, this function returns a valid expression for GRASS GIS' r.mapcalc
+        raster processing module.
+
+        Conversion of Digital Numbers directly to At-Satellite Brightness
+        Temperature, that is toar_radiance() substituted for the radiance
+        of radiance_to_temperature():
 
-        return mapcalc
+        T = K2 / ln( (K1 / (ML * Qcal + AL)) + 1 )
+        """
+        return str(self.brightness_temperature_model(bandnumber))
+
+    def brightness_temperature_table(self, bandnumber, size=DIGITAL_NUMBERS):
+        """
+        Return a look-up table of at-satellite brightness temperatures, that
+        is a NumPy array whose n-th item is the temperature of the Digital
+        Number n. Brightness temperature is a function of the Digital Number
+        alone, hence it is computed once per possible value instead of once
+        per pixel.
+        """
+        import numpy
+        digital_numbers = numpy.arange(size, dtype=numpy.float64)
+        return evaluate(self.brightness_temperature_model(bandnumber),
+                        {DUMMY_MAPCALC_STRING_DN: digital_numbers})
 
 
 def main():
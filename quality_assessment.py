@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+
+"""
+Decoding of the Landsat 8 Quality Assessment band by bit flags
+
+Supported are the Collection 1 'BQA' and the Collection 2 'QA_PIXEL' bands.
+Each 16-bit value packs single bit flags (for example, cloud) and two bit
+confidence levels (for example, cloud confidence: 0 none, 1 low, 2 medium,
+3 high). Instead of enumerating QA values by hand, the values to mask are
+decoded by bit flags, once per value within the range of a band, in to a
+look-up table.
+
+A CloudMask turns the look-up table in to r.reclass rules: a virtual map,
+reclassifying the masked values to 1 and any other to NULL, is referenced
+within the r.mapcalc expressions, and the table is indexed by the values of
+NumPy arrays, instead of a mapset-wide MASK raster map. Hence, no mask is
+written and concurrent runs in one mapset do not interfere.
+
+Sources:
+
+- Landsat 8 Collection 1 Level-1 Product Guide (LSDS-1656)
+- Landsat 8-9 Collection 2 Level-1 Data Format Control Book (LSDS-1822)
+
+@author nik | Created on October 2026
+"""
+
+import grass.script as grass
+
+# field: (bit offset, number of bits)
+QA_FIELDS = {
+    1: {
+        'fill': (0, 1),
+        'cloud': (4, 1),
+        'cloud_confidence': (5, 2),
+        'shadow_confidence': (7, 2),
+        'snow_confidence': (9, 2),
+        'cirrus_confidence': (11, 2),
+    },
+    2: {
+        'fill': (0, 1),
+        'dilated_cloud': (1, 1),
+        'cirrus': (2, 1),
+        'cloud': (3, 1),
+        'shadow': (4, 1),
+        'snow': (5, 1),
+        'clear': (6, 1),
+        'water': (7, 1),
+        'cloud_confidence': (8, 2),
+        'shadow_confidence': (10, 2),
+        'snow_confidence': (12, 2),
+        'cirrus_confidence': (14, 2),
+    },
+}
+QA_CONDITIONS = ('fill', 'cloud', 'dilated_cloud', 'cirrus', 'shadow', 'snow')
+QA_DEFAULT_CONDITIONS = ('fill', 'cloud', 'cirrus', 'shadow')
+CONFIDENCE_LEVELS = {'low': 1, 'medium': 2, 'high': 3}
+# Collection 1 BQA value masked unless decoding by bit flags is requested
+QA_PIXEL_DEFAULT = '61440'
+
+
+def decode_qa(values, field, collection=2):
+    """
+    Extract a bit field from QA values, integers or NumPy arrays of integers
+
+    Parameters
+    ----------
+    field
+        A key of QA_FIELDS[collection]
+
+    collection
+        The Landsat Collection, 1 or 2
+    """
+    offset, bits = QA_FIELDS[collection][field]
+    return (values >> offset) & ((1 << bits) - 1)
+
+
+def qa_mask(
+        values,
+        collection=2,
+        conditions=QA_DEFAULT_CONDITIONS,
+        confidence='high',
+    ):
+    """
+    Decide which QA values to mask
+
+    Parameters
+    ----------
+    values
+        A NumPy array of QA values
+
+    collection
+        The Landsat Collection, 1 or 2
+
+    conditions
+        Items of QA_CONDITIONS. A value is masked if any of the conditions
+        holds, that is if its flag is set or its confidence reaches the
+        'confidence' level. Conditions without flag nor confidence in the
+        given collection (for example, 'dilated_cloud' in Collection 1) are
+        ignored.
+
+    confidence
+        A key of CONFIDENCE_LEVELS: 'low', 'medium' or 'high'
+
+    Returns
+    -------
+    A boolean NumPy array, True for the values to mask
+    """
+    import numpy
+    values = numpy.asarray(values, dtype=numpy.int64)
+    fields = QA_FIELDS[collection]
+    level = CONFIDENCE_LEVELS[confidence]
+    masked = numpy.zeros(values.shape, dtype=bool)
+    for condition in conditions:
+        if condition in fields:
+            masked |= decode_qa(values, condition, collection) == 1
+        confidence_field = condition + '_confidence'
+        if confidence_field in fields:
+            masked |= decode_qa(values, confidence_field, collection) >= level
+    return masked
+
+
+def qa_lookup_table(values, **conditions):
+    """
+    Return a look-up table, a dictionary of each unique QA value to whether
+    it is masked. Keyword arguments are those of qa_mask().
+    """
+    import numpy
+    unique = numpy.unique(values)
+    return dict(zip(unique.tolist(), qa_mask(unique, **conditions).tolist()))
+
+
+def value_ranges(values):
+    """
+    Return runs of consecutive integers, of sorted values, as a list of
+    (low, high) tuples, for example: [1, 3, 4, 5] -> [(1, 1), (3, 5)]
+    """
+    ranges = []
+    for value in values:
+        if ranges and value == ranges[-1][1] + 1:
+            ranges[-1][1] = value
+        else:
+            ranges.append([value, value])
+    return [tuple(value_range) for value_range in ranges]
+
+
+def read_qa_values(qa_band):
+    """
+    Return all values within the range of a QA band, as a NumPy array. The
+    range is read from the map's metadata, not from its cells.
+    """
+    import numpy
+    info = grass.raster_info(qa_band)
+    if info['min'] is None or info['max'] is None:
+        return numpy.array([], dtype=numpy.int64)
+    return numpy.arange(int(info['min']), int(info['max']) + 1,
+                        dtype=numpy.int64)
+
+
+class CloudMask():
+    """
+    A cloud mask, applied as a predicate instead of a MASK raster map. Cells
+    of which the mask map is NULL are never masked.
+
+    The masked values of a QA band are reclassified via r.reclass in to a
+    virtual map, 1 for cells to mask and NULL otherwise. Expressions test
+    this map, a single table hit per cell, instead of comparing each cell
+    against the masked values. Building expressions does not create the
+    map: stages evaluating them via r.mapcalc call create_mask_map() first.
+    """
+
+    def __init__(
+            self,
+            mapname,
+            qa_pixel=None,
+            collection=2,
+            conditions=QA_DEFAULT_CONDITIONS,
+            confidence='high',
+            qa=True,
+            values=None,
+            mask_map=None,
+        ):
+        """
+        Parameters
+        ----------
+        mapname
+            A Quality Assessment band or, if 'qa' is False, a map of which
+            any non-NULL cell is masked
+
+        qa_pixel
+            A sequence of QA values to mask as they are, overriding the
+            decoding of the QA band by bit flags
+
+        collection, conditions, confidence
+            See qa_mask()
+
+        values
+            The values of the QA band to decode, all values within the range
+            of the band if not given
+
+        mask_map
+            A name for the r.reclass map of the masked values, a temporary
+            one if not given. See create_mask_map().
+        """
+        self.mapname = mapname
+        self.qa = qa
+        self.qa_pixel = [int(value) for value in qa_pixel or ()]
+        self.collection = collection
+        self.conditions = tuple(conditions)
+        self.confidence = confidence
+        self.values = values
+        self._masked_values = None
+        self._mask_map = mask_map
+        self._mask_map_created = False
+
+    def __str__(self):
+        if not self.qa:
+            return f'non-NULL cells of {self.mapname}'
+        if self.qa_pixel:
+            values = ', '.join(str(value) for value in self.qa_pixel)
+            return f'pixel values <{values}> of {self.mapname}'
+        conditions = ', '.join(self.conditions)
+        return (f'{conditions} ({self.confidence} confidence) of the '
+                f'Collection {self.collection} Quality Assessment band '
+                f'{self.mapname}')
+
+    @property
+    def masked_values(self):
+        """
+        Sorted QA values to mask: the given 'qa_pixel' values or those
+        decoded, once per value of the band, via qa_lookup_table()
+        """
+        if self._masked_values is None:
+            if self.qa_pixel:
+                self._masked_values = sorted(set(self.qa_pixel))
+            else:
+                if self.values is None:
+                    self.values = read_qa_values(self.mapname)
+                lookup = qa_lookup_table(
+                        self.values,
+                        collection=self.collection,
+                        conditions=self.conditions,
+                        confidence=self.confidence,
+                )
+                self._masked_values = [value for value, masked
+                                       in sorted(lookup.items()) if masked]
+        return self._masked_values
+
+    @property
+    def empty(self):
+        """
+        True if there is nothing to mask, that is if no value of a QA band
+        is masked. Tested via the masked values, creating no map.
+        """
+        return self.qa and not self.masked_values
+
+    @property
+    def reclass_rules(self):
+        """
+        r.reclass rules of the QA band, reclassifying runs of masked values
+        to 1. Other values are left out, thus reclassified to NULL.
+        """
+        rules = []
+        for low, high in value_ranges(self.masked_values):
+            values = f'{low}' if low == high else f'{low} thru {high}'
+            rules.append(f'{values} = 1')
+        return '\n'.join(rules)
+
+    @property
+    def mask_map(self):
+        """
+        The name of a map which is not NULL for cells to mask: the given map,
+        if not a QA band, or else the r.reclass map of the masked values. See
+        create_mask_map().
+        """
+        if not self.qa:
+            return self.mapname
+        if self._mask_map is None:
+            from helpers import tmp_map_name
+            self._mask_map = tmp_map_name('cloud_mask')
+        return self._mask_map
+
+    def create_mask_map(self):
+        """
+        Create the r.reclass map of the masked values of a QA band, once, for
+        r.mapcalc expressions referencing it. Nothing is created for a given
+        map, nor if there is nothing to mask.
+        """
+        if not self.qa or self._mask_map_created or self.empty:
+            return
+        grass.write_command(
+                'r.reclass',
+                input=self.mapname,
+                output=self.mask_map,
+                rules='-',
+                stdin=self.reclass_rules,
+                overwrite=True,
+                quiet=True,
+        )
+        self._mask_map_created = True
+
+    def expression_at(self, modifier=''):
+        """
+        Return an r.mapcalc expression which is true, never NULL, for cells
+        to mask, or None if there is nothing to mask
+
+        Parameters
+        ----------
+        modifier
+            An r.mapcalc neighborhood modifier, for example '[-1,0]', to
+            test an adjacent cell instead
+        """
+        if self.empty:
+            return None
+        return f'!isnull({self.mask_map}{modifier})'
+
+    @property
+    def expression(self):
+        """
+        An r.mapcalc expression which is true, never NULL, for cells to mask,
+        or None if there is nothing to mask. See expression_at().
+        """
+        return self.expression_at()
+
+    def apply(self, expression, modifier=''):
+        """
+        Return an r.mapcalc expression which is NULL for cells to mask, the
+        cell being tested optionally offset by a neighborhood modifier
+        """
+        mask_expression = self.expression_at(modifier)
+        if mask_expression is None:
+            return expression
+        return f'if({mask_expression}, null(), {expression})'
+
+    def compute_array(self, values):
+        """
+        Decide which cells to mask, indexing a table of the masked values by
+        the values of the cells
+
+        Parameters
+        ----------
+        values
+            A NumPy array of the mask map's values, NULL cells as NaN
+
+        Returns
+        -------
+        A boolean NumPy array, True for the cells to mask
+        """
+        import numpy
+        values = numpy.asarray(values)
+        if not self.qa:
+            return ~numpy.isnan(values)
+        masked = numpy.zeros(values.shape, dtype=bool)
+        if self.empty:
+            return masked
+        table = numpy.zeros(self.masked_values[-1] + 1, dtype=bool)
+        table[self.masked_values] = True
+        codes = numpy.nan_to_num(values, nan=-1).astype(numpy.int64)
+        inside = (codes >= 0) & (codes < len(table))
+        masked[inside] = table[codes[inside]]
+        return masked
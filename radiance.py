@@ -5,6 +5,17 @@ from constants import DUMMY_MAPCALC_STRING_RADIANCE
 from constants import EQUATION
 import grass.script as grass
 from helpers import run
+from helpers import open_raster_rows
+from helpers import read_raster_row
+from helpers import write_raster_row
+
+def null_zero_digital_numbers(expression):
+    """
+    Return an r.mapcalc expression of Digital Numbers (see
+    DUMMY_MAPCALC_STRING_DN) which is NULL where Digital Numbers are zero (0)
+    """
+    return f'if({DUMMY_MAPCALC_STRING_DN}, {expression}, null())'
+
 
 def digital_numbers_to_radiance(
         outname,
@@ -15,15 +26,11 @@ def digital_numbers_to_radiance(
     ):
     """
     Convert Digital Number values to TOA Radiance. For details, see in Landsat8
-    class.  Zero (0) DNs set to NULL here (not via the class' function).
+    class.  Zero (0) DNs set to NULL here (not via the class' function),
+    within the expression, leaving the input band untouched.
     """
     if null:
-        msg = f'\n|i Setting zero (0) Digital Numbers in {band} to NULL'
-        g.message(msg)
-        run('r.null',
-                map=band,
-                setnull=0,
-        )
+        radiance_expression = null_zero_digital_numbers(radiance_expression)
 
     msg = f'\n|i Rescaling {band} digital numbers to spectral radiance'
 
@@ -82,3 +89,148 @@ def radiance_to_brightness_temperature(
                 map=outname,
                 flags='r',
         )
+
+
+def digital_numbers_to_brightness_temperatures(
+        outnames,
+        bands,
+        temperature_expressions,
+        null=False,
+        info=False,
+        mask=None,
+    ):
+    """
+    Convert Digital Number values of one or more bands directly to
+    At-Satellite Brightness Temperature, in a single r.mapcalc pass writing
+    all output maps. Expressions, one per band, are those of the Landsat8
+    class' toar_brightness_temperature(). Zero (0) DNs set to NULL here,
+    within the expressions, leaving the input bands untouched. Likewise, an
+    optional CloudMask sets masked cells to NULL within the expressions.
+    """
+    bands_string = ', '.join(bands)
+    msg = ('\n|i Converting digital numbers of '
+           f'{bands_string} to at-satellite temperature')
+    if null:
+        msg += ', zero (0) digital numbers as NULL'
+    if mask:
+        msg += f', masking {mask}'
+    equations = []
+    for outname, band, temperature_expression in zip(
+            outnames, bands, temperature_expressions):
+        if null:
+            temperature_expression = null_zero_digital_numbers(
+                    temperature_expression)
+        if mask:
+            temperature_expression = mask.apply(temperature_expression)
+        if info:
+            msg += f'\n   {temperature_expression}'
+        temperature_expression = replace_dummies(
+                temperature_expression,
+                instring=DUMMY_MAPCALC_STRING_DN,
+                outstring=band,
+        )
+        equations.append(EQUATION.format(
+                result=outname,
+                expression=temperature_expression,
+        ))
+    g.message(msg)
+
+    if mask:
+        mask.create_mask_map()
+    grass.mapcalc('\n'.join(equations), overwrite=True)
+
+    if info:
+        for outname in outnames:
+            run('r.info',
+                    map=outname,
+                    flags='r',
+            )
+
+
+def lookup_brightness_temperature(digital_numbers, table, null=False):
+    """
+    Convert digital numbers to at-satellite brightness temperature by
+    gathering from a look-up table (see the Landsat8_MTL class'
+    brightness_temperature_table()).
+
+    Parameters
+    ----------
+    digital_numbers
+        A NumPy array, NULL cells as NaN
+
+    table
+        A NumPy array of temperatures indexed by digital number
+
+    null
+        Treat zero digital numbers as NULL
+
+    Returns
+    -------
+    A NumPy array of temperatures, NULL cells and digital numbers outside
+    the table as NaN
+    """
+    import numpy
+    valid = (digital_numbers >= 0) & (digital_numbers < len(table))  # NaN
+    if null:
+        valid &= digital_numbers != 0
+    indices = numpy.where(valid, digital_numbers, 0).astype(numpy.intp)
+    return numpy.where(valid, numpy.take(table, indices), numpy.nan)
+
+
+def lookup_digital_numbers_to_brightness_temperatures(
+        outnames,
+        bands,
+        temperature_tables,
+        null=False,
+        info=False,
+        mask=None,
+    ):
+    """
+    Convert Digital Number values of one or more bands to At-Satellite
+    Brightness Temperature, row by row, gathering the temperature of each
+    Digital Number from a table (see the Landsat8 class'
+    brightness_temperature_table()) via NumPy instead of evaluating a
+    logarithm per pixel. Each band is read once. Zero (0) DNs, if 'null',
+    and DNs outside the table are set to NULL. Likewise, an optional
+    CloudMask sets masked cells to NULL, reading its map in the same pass.
+    """
+    bands_string = ', '.join(bands)
+    import numpy
+    msg = ('\n|i Looking up at-satellite temperatures for the digital '
+           f'numbers of {bands_string}')
+    if null:
+        msg += ', zero (0) digital numbers as NULL'
+    if mask and mask.empty:
+        mask = None
+    if mask:
+        msg += f', masking {mask}'
+    g.message(msg)
+
+    readers = [open_raster_rows(band) for band in bands]
+    writers = [open_raster_rows(outname, mode='w') for outname in outnames]
+    mask_reader = open_raster_rows(mask.mapname) if mask else None
+    try:
+        for row in range(readers[0].info.rows):
+            if mask:
+                masked = mask.compute_array(read_raster_row(mask_reader, row))
+            for reader, writer, table in zip(readers, writers,
+                                             temperature_tables):
+                temperatures = lookup_brightness_temperature(
+                        read_raster_row(reader, row),
+                        table,
+                        null,
+                )
+                if mask:
+                    temperatures[masked] = numpy.nan
+                write_raster_row(writer, temperatures)
+    finally:
+        for raster in readers + writers + [mask_reader]:
+            if raster:
+                raster.close()
+
+    if info:
+        for outname in outnames:
+            run('r.info',
+                    map=outname,
+                    flags='r',
+            )
@@ -12,15 +12,22 @@ from constants import DUMMY_MAPCALC_STRING_T11
 from constants import DUMMY_MAPCALC_STRING_AVG_LSE
 from constants import DUMMY_MAPCALC_STRING_DELTA_LSE
 from constants import DUMMY_MAPCALC_STRING_FROM_GLC
+from constants import DUMMY_MAPCALC_STRING_LANDCOVER_CLASS
 from constants import DUMMY_MAPCALC_STRING_CWV
 from constants import FROM_GLC_LEGEND
-from constants import LST_FORMULA
+from expressions import Variable
+from expressions import as_expression
+from expressions import evaluate
+from expressions import share
+from expressions import memoise
 from data_validation import check_t1x_range
 from data_validation import check_cwv
 import csv_to_dictionary as coefficients
 EMISSIVITIES = coefficients.get_average_emissivities()
 COLUMN_WATER_VAPOR = coefficients.get_column_water_vapor()
+EMISSIVITY_ARRAYS = ('average', 'delta', 't10', 't11')
 import random
+import itertools
 
 
 class SplitWindowLST():
@@ -140,13 +147,80 @@ class SplitWindowLST():
             # if no fixed land cover class requested
             self.landcover_class = False
 
-            # use mapcalc expressions instead,
-            # containing DUMMY strings for map names
-            self.average_lse_mapcalc = self._build_average_emissivity_expression()
-            self.delta_lse_mapcalc = self._build_delta_emissivity_expression()
+        # mapcalc expressions, containing DUMMY strings for map names, are
+        # built lazily, see the properties below
 
-        # all-in-one split-window lst expression for mapcalc
-        self.sw_lst_mapcalc = self._build_swlst_expression()
+    def _expression_key(self):
+        """
+        Return the attributes which determine the expressions built by an
+        object, keying the caches of memoised methods
+        """
+        return (self.landcover_class,)
+
+    @property
+    def average_lse_mapcalc(self):
+        """
+        Average emissivity expression for a FROM-GLC map
+        """
+        return self._build_average_emissivity_expression()
+
+    @property
+    def delta_lse_mapcalc(self):
+        """
+        Delta emissivity expression for a FROM-GLC map
+        """
+        return self._build_delta_emissivity_expression()
+
+    @property
+    def average_lse_recode_rules(self):
+        """
+        Average emissivity r.recode rules for a FROM-GLC map
+        """
+        return self._build_emissivity_recode_rules('average')
+
+    @property
+    def delta_lse_recode_rules(self):
+        """
+        Delta emissivity r.recode rules for a FROM-GLC map
+        """
+        return self._build_emissivity_recode_rules('delta')
+
+    @property
+    def emissivity_class_reclass_rules(self):
+        """
+        r.reclass rules of a FROM-GLC map to the land cover classes of
+        distinct emissivities, see emissivity_class_mapcalc()
+        """
+        return self._build_emissivity_class_reclass_rules()
+
+    def emissivity_recode_rules(self, emissivity):
+        """
+        Emissivity r.recode rules for a FROM-GLC map, for one of
+        EMISSIVITY_ARRAYS
+        """
+        return self._build_emissivity_recode_rules(emissivity)
+
+    def emissivity_class_mapcalc(self, emissivity):
+        """
+        Emissivity expression, for one of EMISSIVITY_ARRAYS, for a FROM-GLC
+        map reclassified via emissivity_class_reclass_rules
+        """
+        return self._build_emissivity_class_expression(emissivity)
+
+    @property
+    def sw_lst_landcover_mapcalc(self):
+        """
+        Split-window lst expression looking up emissivity terms directly from
+        a FROM-GLC map
+        """
+        return self._build_swlst_landcover_expression()
+
+    @property
+    def sw_lst_mapcalc(self):
+        """
+        All-in-one split-window lst expression for mapcalc
+        """
+        return self._build_swlst_expression()
 
     def __str__(self):
         """
@@ -336,6 +410,7 @@ class SplitWindowLST():
         msg = "Associated RMSE: "
         return msg + str(self.rmse)
 
+    @memoise
     def _build_average_emissivity_expression(self):
         """
         Build average emissivity expression for GRASS GIS' mapcalc
@@ -383,6 +458,7 @@ class SplitWindowLST():
                       ' null() )))))))))))')
         return expression
 
+    @memoise
     def _build_delta_emissivity_expression(self):
         """
         Build delta emissivity expression for GRASS GIS' mapcalc
@@ -430,6 +506,70 @@ class SplitWindowLST():
                       ' null() )))))))))))')
         return expression
 
+    def _landcover_code_runs(self):
+        """
+        Return the runs of consecutive FROM-GLC codes of the same class of
+        _landcover_emissivity_classes(), as (first code, last code, class
+        index) tuples, leaving out codes without emissivities
+        """
+        _, lookup = self._landcover_emissivity_classes()
+        runs = []
+        for group, codes in itertools.groupby(range(len(lookup)),
+                                              key=lookup.__getitem__):
+            codes = list(codes)
+            if group < 0:
+                continue
+            runs.append((codes[0], codes[-1], group))
+        return runs
+
+    @memoise
+    def _build_emissivity_recode_rules(self, emissivity):
+        """
+        Build r.recode rules for an emissivity of a FROM-GLC map, one of
+        EMISSIVITY_ARRAYS, looking up each code's emissivity once per pixel
+        instead of testing the class predicates of
+        _build_average_emissivity_expression(). Consecutive codes of the
+        same class share a rule, codes without emissivities are left out,
+        thus recoded to NULL.
+        """
+        classes, _ = self._landcover_emissivity_classes()
+        emissivities = [self._landcover_class_emissivity(landcover_class,
+                                                         emissivity)
+                        for landcover_class in classes]
+        rules = [f'{low}:{high}:{emissivities[group]!r}'
+                 for low, high, group in self._landcover_code_runs()]
+        return '\n'.join(rules)
+
+    @memoise
+    def _build_emissivity_class_reclass_rules(self):
+        """
+        Build r.reclass rules of a FROM-GLC map to the classes of
+        _landcover_emissivity_classes(), numbered from 1. Codes without
+        emissivities are left out, thus reclassified to NULL. The
+        reclassified map is read through the rules, it is not written.
+        """
+        rules = []
+        for low, high, group in self._landcover_code_runs():
+            codes = f'{low}' if low == high else f'{low} thru {high}'
+            rules.append(f'{codes} = {group + 1}')
+        return '\n'.join(rules)
+
+    @memoise
+    def _build_emissivity_class_expression(self, emissivity):
+        """
+        Build an r.mapcalc expression for an emissivity, one of
+        EMISSIVITY_ARRAYS, of a map reclassified via
+        _build_emissivity_class_reclass_rules(), looking up the emissivity
+        of each class via graph(). The expressions of several emissivities
+        evaluated by one r.mapcalc call read the land cover map once.
+        """
+        classes, _ = self._landcover_emissivity_classes()
+        knots = ', '.join(
+                f'{index + 1}, '
+                f'{self._landcover_class_emissivity(landcover_class, emissivity)!r}'
+                for index, landcover_class in enumerate(classes))
+        return f'graph({DUMMY_MAPCALC_STRING_LANDCOVER_CLASS}, {knots})'
+
     def _build_model(self, coefficients):
         """
         Build model for __str__
@@ -449,6 +589,7 @@ class SplitWindowLST():
                                    t11=self.emissivity_t11)
         return model
 
+    @memoise
     def _build_subrange_expression(self, subrange):
         """
         Build formula for GRASS GIS' mapcalc for the given cwv subrange.
@@ -471,27 +612,288 @@ class SplitWindowLST():
             avg_lse = DUMMY_MAPCALC_STRING_AVG_LSE
             delta_lse = DUMMY_MAPCALC_STRING_DELTA_LSE
 
-        b0, b1, b2, b3, b4, b5, b6, b7 = self._retrieve_cwv_coefficients(subrange)
-        mapcalc = LST_FORMULA.format(
-                    b0=b0,
-                    b1=b1,
-                    b2=b2,
-                    ae=avg_lse,
-                    de=delta_lse,
-                    b3=b3,
-                    b4=b4,
-                    b5=b5,
-                    b6=b6,
-                    b7=b7,
-                    DUMMY_T10=DUMMY_MAPCALC_STRING_T10,
-                    DUMMY_T11=DUMMY_MAPCALC_STRING_T11,
-                  )
-        return mapcalc
+        coefficients = self._retrieve_cwv_coefficients(subrange)
+        if self.landcover_class:
+            return self._build_folded_formula(
+                    *self._fold_emissivity_terms(coefficients, avg_lse, delta_lse))
 
+        return str(self._lst_model(coefficients, avg_lse, delta_lse))
+
+    @memoise
     def _build_swlst_expression(self):
         """
         Build and return a valid expression for GRASS GIS' r.mapcalc to
         determine LST.
+
+        The LST formula is linear in the coefficients b0..b7. Hence, the
+        average of the LSTs of two adjacent subranges, within their overlap,
+        equals the LST of their averaged coefficients and each coefficient is
+        a piecewise constant function of column water vapor (see
+        _cwv_coefficient_buckets()). The expression counts the limits a
+        pixel's column water vapor exceeds, looks up the coefficients of the
+        resulting bucket via graph() and evaluates LST_FORMULA once.
+        """
+        DUMMY_CWV = DUMMY_MAPCALC_STRING_CWV
+        comparisons, coefficients = self._cwv_coefficient_buckets()
+        bucket = ' + '.join(f'({DUMMY_CWV} {operator} {limit})'
+                            for limit, operator in comparisons)
+
+        if self.landcover_class:
+            # fixed emissivities: fold the emissivity terms in to constants
+            avg_lse = self._compute_average_emissivity(self.landcover_class)
+            delta_lse = self._compute_delta_emissivity(self.landcover_class)
+            coefficients = [self._fold_emissivity_terms(bucket_coefficients,
+                                                        avg_lse,
+                                                        delta_lse)
+                            for bucket_coefficients in coefficients]
+            names = ('b0', 'a', 'b', 'b7')
+        else:
+            names = ('b0', 'b1', 'b2', 'b3', 'b4', 'b5', 'b6', 'b7')
+
+        curves = {}
+        for name, values in zip(names, zip(*coefficients)):
+            if len(set(values)) == 1:
+                curves[name] = values[0]
+                continue
+            points = ', '.join(f'{index}, {value}'
+                               for index, value in enumerate(values))
+            curves[name] = f'graph(bucket, {points})'
+        terms = {name: name if isinstance(curve, str) else curve
+                 for name, curve in curves.items()}
+
+        shared = []
+        if self.landcover_class:
+            formula = self._build_folded_formula(**terms)
+        else:
+            # compute the emissivity terms shared by the coefficients once
+            shared, formula = share(
+                    self._lst_model([terms[name] for name in names]))
+        bindings = ''.join(f'\\ \n {name} = {curve},'
+                           for name, curve in list(curves.items()) + shared
+                           if not isinstance(curve, (int, float)))
+        expression = (f'eval( bucket = {bucket},'
+                      f'{bindings}'
+                      f'\\ \n {formula})')
+        return expression
+
+    def _fold_emissivity_terms(self, coefficients, average_emissivity,
+                               delta_emissivity):
+        """
+        Fold the emissivity terms of the LST formula, for given average and
+        delta emissivities, in to the coefficients b0..b7. The formula
+        reduces to:
+
+            LST = b0 + A * (t10 + t11) / 2 + B * (t10 - t11) / 2
+                  + b7 * (t10 - t11)^2
+
+        where:
+
+            A = b1 + b2 * (1 - ae) / ae^2 + b3 * de / ae^2
+            B = b4 + b5 * (1 - ae) / ae + b6 * de / ae^2
+
+        Returns
+        -------
+        A tuple (b0, A, B, b7)
+        """
+        b0, b1, b2, b3, b4, b5, b6, b7 = coefficients
+        ae = average_emissivity
+        de = delta_emissivity
+        return (b0,
+                b1 + b2 * ((1 - ae) / ae**2) + b3 * (de / ae**2),
+                b4 + b5 * ((1 - ae) / ae) + b6 * (de / ae**2),
+                b7)
+
+    def _build_folded_formula(self, b0, a, b, b7):
+        """
+        Build the LST formula for GRASS GIS' mapcalc from folded coefficients
+        (see _fold_emissivity_terms()), numbers or names of variables. A
+        quadratic term of coefficient 0 is omitted.
+        """
+        t10 = DUMMY_MAPCALC_STRING_T10
+        t11 = DUMMY_MAPCALC_STRING_T11
+        formula = (f'{b0} + ({a}) * (({t10}+{t11})/2)'
+                   f' + ({b}) * (({t10}-{t11})/2)')
+        if b7 != 0:
+            formula += f' + ({b7}) * ({t10} - {t11})^2'
+        return formula
+
+    @memoise
+    def _cwv_coefficient_buckets(self):
+        """
+        Return the column water vapor comparisons which sort values in to
+        buckets of constant coefficients, and the coefficients b0..b7 of
+        each bucket.
+
+        The buckets follow the subrange cases of _cwv_subrange_cases(),
+        merging adjacent ones of the same subranges. The coefficients of a
+        bucket within the overlap of two subranges are the averages of their
+        coefficients.
+
+        Returns
+        -------
+        comparisons
+            A list of (limit, operator) tuples. The bucket of a value is the
+            count of the comparisons 'value operator limit' that hold.
+
+        coefficients
+            A list of (b0, ..., b7) tuples, one per bucket
+        """
+        limits, cases = self._cwv_subrange_cases()
+        comparisons = []
+        bucket_cases = [cases[0]]
+        for code in range(1, len(cases)):
+            if cases[code] == cases[code - 1]:
+                continue
+            limit = limits[(code - 1) // 2]
+            operator = '>=' if code % 2 else '>'  # odd codes: at a limit
+            comparisons.append((limit, operator))
+            bucket_cases.append(cases[code])
+
+        coefficients = []
+        for case in bucket_cases:
+            subrange_coefficients = [self._retrieve_cwv_coefficients(subrange)
+                                     for subrange in case]
+            coefficients.append(tuple(sum(values) / len(values)
+                                      for values in zip(*subrange_coefficients)))
+        return comparisons, coefficients
+
+    def _select_emissivity_class(self, landcover_code):
+        """
+        Return the land cover class whose average emissivities apply to the
+        given FROM-GLC code, exactly as in the nested if() of
+        _build_average_emissivity_expression(), or None for codes without
+        emissivities (e.g. Cloud).
+        """
+        code = landcover_code
+        if 10 <= code < 20:
+            return 'Cropland'
+        if 20 <= code < 30:
+            return 'Forest'
+        if code == 51 or code == 72 or 30 <= code < 40:
+            return 'Grasslands'
+        if code == 71 or 40 <= code < 50:
+            return 'Shrublands'
+        if 50 <= code < 52:  # Wetlands
+            return 'Waterbodies'
+        if 60 <= code < 70:
+            return 'Waterbodies'
+        if 70 <= code < 72:  # Tundra
+            return 'Shrublands'
+        if 80 <= code < 90:
+            return 'Impervious'
+        if code == 52 or 90 <= code < 100:
+            return 'Barren_Land'
+        if 100 <= code < 120:
+            return 'Snow_and_ice'
+        return None
+
+    @memoise
+    def _landcover_emissivity_classes(self):
+        """
+        Return the land cover classes of distinct emissivities and a look-up
+        table of 256 entries, one per FROM-GLC code, of the index of each
+        code's class, or -1 for codes without emissivities.
+        """
+        classes = []
+        lookup = []
+        for code in range(256):
+            landcover_class = self._select_emissivity_class(code)
+            if landcover_class is None:
+                lookup.append(-1)
+                continue
+            if landcover_class not in classes:
+                classes.append(landcover_class)
+            lookup.append(classes.index(landcover_class))
+        return classes, lookup
+
+    @memoise
+    def _landcover_coefficient_table(self):
+        """
+        Return the combined coefficients of the LST formula for each land
+        cover class of _landcover_emissivity_classes() and each column water
+        vapor bucket of _cwv_coefficient_buckets().
+
+        The emissivity terms of the formula depend only on the land cover
+        class, hence fold in to the coefficients of each bucket, see
+        _fold_emissivity_terms().
+
+        Returns
+        -------
+        A nested list, per land cover class and bucket, of (b0, A, B, b7)
+        tuples
+        """
+        classes, _ = self._landcover_emissivity_classes()
+        _, coefficients = self._cwv_coefficient_buckets()
+        table = []
+        for landcover_class in classes:
+            ae = self._compute_average_emissivity(landcover_class)
+            de = self._compute_delta_emissivity(landcover_class)
+            table.append([self._fold_emissivity_terms(bucket_coefficients,
+                                                      ae,
+                                                      de)
+                          for bucket_coefficients in coefficients])
+        return table
+
+    @memoise
+    def _build_swlst_landcover_expression(self):
+        """
+        Build and return a valid expression for GRASS GIS' r.mapcalc to
+        determine LST directly from a FROM-GLC land cover map, without
+        average and delta emissivity maps.
+
+        The land cover class and the column water vapor bucket of a pixel
+        index the combined coefficients of _landcover_coefficient_table(),
+        looked up via graph().
+        """
+        landcover = DUMMY_MAPCALC_STRING_FROM_GLC
+        comparisons, _ = self._cwv_coefficient_buckets()
+        bucket = ' + '.join(f'({DUMMY_MAPCALC_STRING_CWV} {operator} {limit})'
+                            for limit, operator in comparisons)
+
+        # runs of consecutive FROM-GLC codes of the same class
+        _, lookup = self._landcover_emissivity_classes()
+        runs = []
+        for code, index in enumerate(lookup):
+            if runs and runs[-1][2] == index and runs[-1][1] == code:
+                runs[-1][1] = code + 1
+            else:
+                runs.append([code, code + 1, index])
+        group = 'null()'
+        for low, high, index in reversed(runs):
+            if index < 0:
+                continue
+            if high - low == 1:
+                condition = f'{landcover} == {low}'
+            else:
+                condition = f'{landcover} >= {low} && {landcover} < {high}'
+            group = f'if( {condition}, {index}, {group})'
+
+        table = self._landcover_coefficient_table()
+        buckets = len(comparisons) + 1
+        b0 = ', '.join(f'{index}, {coefficients[0]}'
+                       for index, coefficients in enumerate(table[0]))
+        a, b = (', '.join(f'{index * buckets + bucket}, {coefficients[term]}'
+                          for index, row in enumerate(table)
+                          for bucket, coefficients in enumerate(row))
+                for term in (1, 2))
+        formula = self._build_folded_formula('b0', 'a', 'b', 0)
+        expression = (f'eval( bucket = {bucket},'
+                      f'\\ \n group = {group},'
+                      f'\\ \n entry = group * {buckets} + bucket,'
+                      f'\\ \n b0 = graph(bucket, {b0}),'
+                      f'\\ \n a = graph(entry, {a}),'
+                      f'\\ \n b = graph(entry, {b}),'
+                      f'\\ \n {formula})')
+        return expression
+
+    @memoise
+    def _build_swlst_subranges_expression(self):
+        """
+        Build and return a valid expression for GRASS GIS' r.mapcalc to
+        determine LST, evaluating the formulas of all subranges before
+        selecting one, or the average of two, for each pixel. Superseded by
+        _build_swlst_expression(), kept as the reference of the subrange
+        selection.
         """
         DUMMY_CWV = DUMMY_MAPCALC_STRING_CWV
         low_1, high_1 = COLUMN_WATER_VAPOR['Range_1'].subrange
@@ -533,6 +935,282 @@ class SplitWindowLST():
                       ' sw_lst_6 ))))))))))')  # ' null() ))))))))))')
         return expression
 
+    def _select_cwv_subranges(self, column_water_vapor):
+        """
+        Return the subranges whose formulas apply to the given column water
+        vapor value, exactly as in the nested if() of
+        _build_swlst_subranges_expression(): a pair of adjacent subranges
+        within their overlap, a single subrange or else the complete range
+        (Range_6).
+        Unlike _retrieve_adjacent_cwv_subranges(), this does not check the
+        value.
+        """
+        keys = [f'Range_{index}' for index in range(1, 6)]
+        in_range = [low < column_water_vapor < high
+                    for low, high in (COLUMN_WATER_VAPOR[key].subrange
+                                      for key in keys)]
+        for index in range(len(keys) - 1):
+            if in_range[index] and in_range[index + 1]:
+                return keys[index], keys[index + 1]
+        for index, key in enumerate(keys):
+            if in_range[index]:
+                return (key,)
+        return ('Range_6',)
+
+    @memoise
+    def _cwv_subrange_cases(self):
+        """
+        Return the sorted subrange limits and the subranges which apply to
+        each of the open intervals between and at the limits, indexed by the
+        codes of _cwv_subrange_codes(). The subranges change only at the
+        limits, hence one representative value per code suffices.
+        """
+        limits = sorted({limit
+                         for index in range(1, 6)
+                         for limit in COLUMN_WATER_VAPOR[f'Range_{index}'].subrange})
+        representatives = [limits[0] - 1]
+        for low, high in zip(limits, limits[1:] + [limits[-1] + 2]):
+            representatives += [low, (low + high) / 2]
+        cases = [self._select_cwv_subranges(value)
+                 for value in representatives]
+        return limits, cases
+
+    def _cwv_subrange_codes(self, cwv, limits):
+        """
+        Return, for an array of column water vapor values, the index of the
+        open interval between the sorted 'limits' (even codes) or of the
+        limit itself (odd codes) each value lies in
+        """
+        import numpy
+        left = numpy.searchsorted(limits, cwv, side='left')
+        right = numpy.searchsorted(limits, cwv, side='right')
+        return 2 * left + (right > left)
+
+    def _compute_subrange_lst(self, subrange, t10, t11, avg_lse, delta_lse):
+        """
+        Evaluate the LST_FORMULA of a cwv subrange on arrays, or scalars, of
+        brightness temperatures and emissivities
+        """
+        return self._compute_lst(self._retrieve_cwv_coefficients(subrange),
+                                 t10, t11, avg_lse, delta_lse)
+
+    def _lst_model(
+            self,
+            coefficients,
+            average_emissivity=DUMMY_MAPCALC_STRING_AVG_LSE,
+            delta_emissivity=DUMMY_MAPCALC_STRING_DELTA_LSE,
+        ):
+        """
+        Return the expression tree (see expressions.py) of the LST formula:
+
+            b0 + (b1 + b2 * (1 - ae) / ae^2 + b3 * de / ae^2) * (t10 + t11) / 2
+               + (b4 + b5 * (1 - ae) / ae + b6 * de / ae^2) * (t10 - t11) / 2
+               + b7 * (t10 - t11)^2
+
+        Parameters
+        ----------
+        coefficients
+            The coefficients b0..b7: numbers or names of variables
+
+        average_emissivity, delta_emissivity
+            Numbers or names of variables, by default the DUMMY strings of
+            the average and delta emissivity maps
+        """
+        b0, b1, b2, b3, b4, b5, b6, b7 = (as_expression(coefficient)
+                                          for coefficient in coefficients)
+        ae = as_expression(average_emissivity)
+        de = as_expression(delta_emissivity)
+        t10 = Variable(DUMMY_MAPCALC_STRING_T10)
+        t11 = Variable(DUMMY_MAPCALC_STRING_T11)
+        return (b0
+                + (b1
+                   + b2 * ((1 - ae) / ae ** 2)
+                   + b3 * (de / ae ** 2)) * ((t10 + t11) / 2)
+                + (b4
+                   + b5 * ((1 - ae) / ae)
+                   + b6 * (de / ae ** 2)) * ((t10 - t11) / 2)
+                + b7 * (t10 - t11) ** 2)
+
+    def _compute_lst(self, coefficients, t10, t11, avg_lse, delta_lse):
+        """
+        Evaluate the LST formula for the coefficients b0..b7, scalars or
+        arrays of per pixel coefficients, on arrays, or scalars, of
+        brightness temperatures and emissivities
+        """
+        names = ('b0', 'b1', 'b2', 'b3', 'b4', 'b5', 'b6', 'b7')
+        values = dict(zip(names, coefficients))
+        values.update({DUMMY_MAPCALC_STRING_T10: t10,
+                       DUMMY_MAPCALC_STRING_T11: t11,
+                       DUMMY_MAPCALC_STRING_AVG_LSE: avg_lse,
+                       DUMMY_MAPCALC_STRING_DELTA_LSE: delta_lse})
+        return evaluate(self._lst_model(names), values)
+
+    def compute_lst_array(
+            self,
+            t10,
+            t11,
+            cwv,
+            average_emissivity=None,
+            delta_emissivity=None,
+            landcover=None,
+        ):
+        """
+        Compute land surface temperature from NumPy arrays, as an alternative
+        to the expressions built by _build_swlst_expression() and
+        _build_swlst_landcover_expression().
+
+        Instead of evaluating all six subrange formulas for every pixel, the
+        column water vapor values are sorted in to the buckets of
+        _cwv_coefficient_buckets() and the formula is evaluated once, with
+        the coefficients of each pixel's bucket.
+
+        Parameters
+        ----------
+        t10, t11
+            2D arrays of brightness temperatures, NULL cells as NaN
+
+        cwv
+            2D array of column water vapor, NULL cells as NaN
+
+        average_emissivity, delta_emissivity
+            2D arrays of emissivities, required unless a fixed land cover
+            class or a landcover array is given
+
+        landcover
+            2D array of FROM-GLC codes, NULL cells as NaN, looking up the
+            combined coefficients of _landcover_coefficient_table() instead of
+            emissivities
+
+        Returns
+        -------
+        A 2D array of land surface temperatures, NULL cells as NaN
+        """
+        import numpy
+        if landcover is not None and not self.landcover_class:
+            return self._compute_lst_landcover_array(t10, t11, cwv, landcover)
+        if self.landcover_class:
+            average_emissivity = self.average_emissivity
+            delta_emissivity = self.delta_emissivity
+        average_emissivity = numpy.broadcast_to(average_emissivity, cwv.shape)
+        delta_emissivity = numpy.broadcast_to(delta_emissivity, cwv.shape)
+
+        comparisons, coefficients = self._cwv_coefficient_buckets()
+        bucket = numpy.zeros(cwv.shape, dtype=numpy.intp)
+        with numpy.errstate(invalid='ignore'):
+            for limit, operator in comparisons:
+                bucket += (cwv >= limit) if operator == '>=' else (cwv > limit)
+        table = numpy.asarray(coefficients)
+        lst = self._compute_lst(numpy.moveaxis(table[bucket], -1, 0),
+                                t10,
+                                t11,
+                                average_emissivity,
+                                delta_emissivity)
+        lst[numpy.isnan(cwv)] = numpy.nan
+        return lst
+
+    def _landcover_class_emissivity(self, landcover_class, emissivity):
+        """
+        Return an emissivity of a land cover class, one of EMISSIVITY_ARRAYS
+        """
+        if emissivity == 'average':
+            return self._compute_average_emissivity(landcover_class)
+        if emissivity == 'delta':
+            return self._compute_delta_emissivity(landcover_class)
+        emissivity_t10, emissivity_t11 = \
+            self._retrieve_average_emissivities(landcover_class)
+        if emissivity == 't10':
+            return float(emissivity_t10)
+        return float(emissivity_t11)
+
+    @memoise
+    def _landcover_emissivity_table(self):
+        """
+        Return a NumPy array of the emissivities of each land cover class of
+        _landcover_emissivity_classes(), one column per item of
+        EMISSIVITY_ARRAYS, and a last row of NaN for codes without
+        emissivities.
+        """
+        import numpy
+        classes, _ = self._landcover_emissivity_classes()
+        table = [tuple(self._landcover_class_emissivity(landcover_class,
+                                                       emissivity)
+                       for emissivity in EMISSIVITY_ARRAYS)
+                 for landcover_class in classes]
+        table.append((numpy.nan,) * len(EMISSIVITY_ARRAYS))
+        return numpy.array(table)
+
+    def emissivity_lookup_digest(self):
+        """
+        Return a digest of the emissivities looked up per FROM-GLC code,
+        identifying maps derived via compute_emissivity_arrays()
+        """
+        import hashlib
+        _, lookup = self._landcover_emissivity_classes()
+        table = self._landcover_emissivity_table()
+        digest = hashlib.sha256(repr(lookup).encode('utf-8'))
+        digest.update(table.tobytes())
+        return digest.hexdigest()
+
+    def compute_emissivity_arrays(
+            self,
+            landcover,
+            emissivities=('average', 'delta'),
+        ):
+        """
+        Return emissivities for a NumPy array of FROM-GLC codes, as the
+        expressions of _build_average_emissivity_expression() and
+        _build_delta_emissivity_expression() do. The class of each pixel is
+        looked up once for all requested emissivities.
+
+        Parameters
+        ----------
+        landcover
+            An array of FROM-GLC codes, NULL cells as NaN
+
+        emissivities
+            Items of EMISSIVITY_ARRAYS: 'average', 'delta' or the channel
+            emissivities 't10', 't11'
+
+        Returns
+        -------
+        A tuple of arrays, one per requested emissivity. NULL cells and codes
+        without emissivities give NaN.
+        """
+        import numpy
+        _, lookup = self._landcover_emissivity_classes()
+        table = self._landcover_emissivity_table()
+        codes = numpy.nan_to_num(landcover, nan=-1)
+        inside = (codes >= 0) & (codes < len(lookup))
+        group = numpy.full(landcover.shape, -1, dtype=numpy.intp)
+        group[inside] = numpy.asarray(lookup)[codes[inside].astype(numpy.intp)]
+        return tuple(table[group, EMISSIVITY_ARRAYS.index(emissivity)]
+                     for emissivity in emissivities)
+
+    def _compute_lst_landcover_array(self, t10, t11, cwv, landcover):
+        """
+        Compute land surface temperature from NumPy arrays of brightness
+        temperatures, column water vapor and FROM-GLC codes. See
+        compute_lst_array().
+        """
+        import numpy
+        comparisons, _ = self._cwv_coefficient_buckets()
+        bucket = numpy.zeros(cwv.shape, dtype=numpy.intp)
+        with numpy.errstate(invalid='ignore'):
+            for limit, operator in comparisons:
+                bucket += (cwv >= limit) if operator == '>=' else (cwv > limit)
+
+        _, lookup = self._landcover_emissivity_classes()
+        codes = numpy.nan_to_num(landcover, nan=-1)
+        inside = (codes >= 0) & (codes < len(lookup))
+        group = numpy.full(cwv.shape, -1, dtype=numpy.intp)
+        group[inside] = numpy.asarray(lookup)[codes[inside].astype(numpy.intp)]
+
+        table = numpy.asarray(self._landcover_coefficient_table())
+        b0, a, b, _ = numpy.moveaxis(table[group.clip(0), bucket], -1, 0)
+        lst = b0 + a * ((t10 + t11) / 2) + b * ((t10 - t11) / 2)
+        lst[numpy.isnan(cwv) | (group < 0)] = numpy.nan
+        return lst
+
 # reusable & stand-alone
 if __name__ == "__main__":
     print('Split-Window Algorithm for Estimating Land Surface Temperature '
@@ -1,75 +1,125 @@
 from helpers import extract_number_from_string
 from helpers import tmp_map_name
 from landsat8_mtl import Landsat8_MTL
-from radiance import digital_numbers_to_radiance
-from radiance import radiance_to_brightness_temperature
+from radiance import digital_numbers_to_brightness_temperatures
+from radiance import lookup_digital_numbers_to_brightness_temperatures
 from grass.pygrass.modules.shortcuts import general as g
 from dummy_mapcalc_strings import replace_dummies
 from constants import DUMMY_MAPCALC_STRING_AVG_LSE
 from constants import DUMMY_MAPCALC_STRING_DELTA_LSE
 from constants import DUMMY_MAPCALC_STRING_CWV
+from constants import DUMMY_MAPCALC_STRING_FROM_GLC
 from constants import DUMMY_MAPCALC_STRING_T10
 from constants import DUMMY_MAPCALC_STRING_T11
 from constants import EQUATION
 import grass.script as grass
 from helpers import run
+from helpers import read_raster
+from helpers import read_masked_rasters
+from helpers import write_raster
+
+LST_ENGINES = ('mapcalc', 'numpy')
+BRIGHTNESS_TEMPERATURE_ENGINES = ('mapcalc', 'lut')
 
 def tirs_to_at_satellite_temperature(
         tirs_1x,
         mtl_file,
         brightness_temperature_prefix=None,
         null=False,
-        info=False):
+        info=False,
+        engine='mapcalc',
+        mask=None):
     """
     Helper function to convert TIRS bands 10 or 11 in to at-satellite
+    temperatures. See tirs_to_at_satellite_temperatures().
+
+    The output is a temporary at-Satellite Temperature map.
+    """
+    return tirs_to_at_satellite_temperatures(
+            [tirs_1x],
+            mtl_file,
+            brightness_temperature_prefix,
+            null,
+            info=info,
+            engine=engine,
+            mask=mask,
+    )[0]
+
+
+def tirs_to_at_satellite_temperatures(
+        tirs_bands,
+        mtl_file,
+        brightness_temperature_prefix=None,
+        null=False,
+        info=False,
+        engine='mapcalc',
+        mask=None):
+    """
+    Helper function to convert TIRS bands 10 and 11 in to at-satellite
     temperatures.
 
+    The conversion of Digital Numbers to spectral radiance is composed in to
+    the conversion of spectral radiance to at-satellite temperature, so that
+    a single r.mapcalc pass converts all bands, without in-between radiance
+    maps.
+
+    Alternatively, the 'lut' engine looks up the temperature of each Digital
+    Number in a table, row by row via NumPy.
+
     This function uses the pre-defined functions:
 
     - extract_number_from_string()
-    - digital_numbers_to_radiance()
-    - radiance_to_brightness_temperature()
+    - digital_numbers_to_brightness_temperatures()
+    - lookup_digital_numbers_to_brightness_temperatures()
 
     The inputs are:
 
-    - a name for the input tirs band (10 or 11)
+    - a list of names of the input tirs bands (10 and/or 11)
     - a Landsat8 MTL file
+    - optionally, a CloudMask, setting masked cells to NULL
 
-    The output is a temporary at-Satellite Temperature map.
+    The output is a list of temporary at-Satellite Temperature maps, one per
+    band.
     """
-    # which band number and MTL file
-    band_number = extract_number_from_string(tirs_1x)
-    tmp_radiance = tmp_map_name('radiance') + '.' + band_number
-    tmp_brightness_temperature = tmp_map_name('brightness_temperature') + '.' + \
-        band_number
     landsat8 = Landsat8_MTL(mtl_file)
+    outnames = []
+    conversions = []
+    for tirs_1x in tirs_bands:
+        band_number = extract_number_from_string(tirs_1x)
 
-    # rescale DNs to spectral radiance
-    radiance_expression = landsat8.toar_radiance(band_number)
-    digital_numbers_to_radiance(
-            tmp_radiance,
-            tirs_1x,
-            radiance_expression,
-            null,
-            info,
-    )
-
-    # convert spectral radiance to at-satellite temperature
-    temperature_expression = landsat8.radiance_to_temperature(band_number)
-    radiance_to_brightness_temperature(
-            tmp_brightness_temperature,
-            tmp_radiance,
-            temperature_expression,
-            info,
-    )
-
-    # save Brightness Temperature map?
-    if brightness_temperature_prefix:
-        bt_output = brightness_temperature_prefix + band_number
-        run('g.rename', raster=(tmp_brightness_temperature, bt_output))
-        tmp_brightness_temperature = bt_output
+        # save Brightness Temperature map?
+        if brightness_temperature_prefix:
+            outname = brightness_temperature_prefix + band_number
+        else:
+            outname = tmp_map_name('brightness_temperature') + '.' + \
+                band_number
+        outnames.append(outname)
+        if engine == 'lut':
+            conversions.append(
+                    landsat8.brightness_temperature_table(band_number))
+        else:
+            conversions.append(
+                    landsat8.toar_brightness_temperature(band_number))
 
-    return tmp_brightness_temperature
+    if engine == 'lut':
+        lookup_digital_numbers_to_brightness_temperatures(
+                outnames,
+                tirs_bands,
+                conversions,
+                null,
+                info,
+                mask=mask,
+        )
+    else:
+        digital_numbers_to_brightness_temperatures(
+                outnames,
+                tirs_bands,
+                conversions,
+                null,
+                info,
+                mask=mask,
+        )
+    return outnames
 
 
 def estimate_lst(
@@ -85,10 +135,15 @@ def estimate_lst(
         rounding,
         celsius,
         info=False,
+        engine='mapcalc',
+        split_window_lst=None,
+        mask=None,
     ):
     """
     Produce a Land Surface Temperature map based on a mapcalc expression
-    returned from a SplitWindowLST object.
+    returned from a SplitWindowLST object (engine='mapcalc') or on the
+    SplitWindowLST object's array evaluator (engine='numpy'), which
+    evaluates only the subrange formulas each pixel requires.
 
     Parameters
     ----------
@@ -105,6 +160,9 @@ def estimate_lst(
     avg_lse_map
 
     delta_lse_map
+        Average and delta emissivity maps. If None along with a landcover
+        map, the expression is expected to look up the emissivity terms
+        from the landcover map (see SplitWindowLST.sw_lst_landcover_mapcalc)
 
     cwv_map
 
@@ -116,6 +174,15 @@ def estimate_lst(
 
     info
 
+    engine
+        Either of 'mapcalc' or 'numpy'
+
+    split_window_lst
+        A SplitWindowLST object, required by the 'numpy' engine
+
+    mask
+        An optional CloudMask, setting masked cells to NULL
+
     Inputs are:
 
     - brightness temperature maps t10, t11
@@ -123,12 +190,39 @@ def estimate_lst(
     - a temporary filename
     - a valid mapcalc expression
     """
+    if engine == 'numpy':
+        _estimate_lst_numpy(
+                outname,
+                t10,
+                t11,
+                landcover_map,
+                avg_lse_map,
+                delta_lse_map,
+                cwv_map,
+                split_window_lst,
+                rounding,
+                celsius,
+                info,
+                mask,
+        )
+        return
+
     msg = '\n|i Estimating land surface temperature '
     if info:
         msg += f'\n   Expression:\n {lst_expression}'
     g.message(msg)
 
-    if landcover_map:
+    if landcover_map and avg_lse_map is None:
+        split_window_expression = replace_dummies(lst_expression,
+                                                  in_cwv=DUMMY_MAPCALC_STRING_CWV,
+                                                  out_cwv=cwv_map,
+                                                  in_ti=DUMMY_MAPCALC_STRING_T10,
+                                                  out_ti=t10,
+                                                  in_tj=DUMMY_MAPCALC_STRING_T11,
+                                                  out_tj=t11,
+                                                  in_landcover=DUMMY_MAPCALC_STRING_FROM_GLC,
+                                                  out_landcover=landcover_map)
+    elif landcover_map:
         split_window_expression = replace_dummies(lst_expression,
                                                   in_avg_lse=DUMMY_MAPCALC_STRING_AVG_LSE,
                                                   out_avg_lse=avg_lse_map,
@@ -149,6 +243,9 @@ def estimate_lst(
                                                   in_tj=DUMMY_MAPCALC_STRING_T11,
                                                   out_tj=t11)
 
+    if mask:
+        split_window_expression = mask.apply(split_window_expression)
+
     if rounding:
         split_window_expression = f'(round({split_window_expression}, 2, 0.5))'
         msg = '\n|i Rounding temperature figures to 2 decimals'
@@ -163,9 +260,74 @@ def estimate_lst(
             result=outname,
             expression=split_window_expression,
     )
+    if mask:
+        mask.create_mask_map()
     grass.mapcalc(
             split_window_equation,
             overwrite=True,
     )
     if info:
         run('r.info', map=outname, flags='r')
+
+
+def round_like_mapcalc(values, step, offset=0):
+    """
+    Round values to the nearest value of the series offset + i * step, half
+    away from zero, as r.mapcalc's round(x, y, z) does
+    """
+    import numpy
+    values = (values - offset) / step
+    return numpy.sign(values) * numpy.floor(numpy.abs(values) + 0.5) * step \
+        + offset
+
+
+def _estimate_lst_numpy(
+        outname,
+        t10,
+        t11,
+        landcover_map,
+        avg_lse_map,
+        delta_lse_map,
+        cwv_map,
+        split_window_lst,
+        rounding,
+        celsius,
+        info=False,
+        mask=None,
+    ):
+    """
+    Produce a Land Surface Temperature map based on the array evaluator of a
+    SplitWindowLST object. See estimate_lst().
+    """
+    msg = '\n|i Estimating land surface temperature in subrange buckets'
+    g.message(msg)
+
+    average_emissivity = delta_emissivity = landcover = None
+    if landcover_map and avg_lse_map is None:
+        landcover = read_raster(landcover_map)
+    elif landcover_map:
+        average_emissivity = read_raster(avg_lse_map)
+        delta_emissivity = read_raster(delta_lse_map)
+    t10_array, t11_array = read_masked_rasters([t10, t11], mask)
+    lst = split_window_lst.compute_lst_array(
+            t10_array,
+            t11_array,
+            read_raster(cwv_map),
+            average_emissivity,
+            delta_emissivity,
+            landcover,
+    )
+
+    if rounding:
+        lst = round_like_mapcalc(lst, 2, 0.5)
+        msg = '\n|i Rounding temperature figures to 2 decimals'
+        g.message(msg)
+
+    if celsius:
+        lst = lst - 273.15
+        msg = '\n|i Converting temperature figures to Celsius degrees'
+        g.message(msg)
+
+    write_raster(lst, outname)
+    if info:
+        run('r.info', map=outname, flags='r')
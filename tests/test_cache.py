@@ -0,0 +1,294 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@author nik | Created on October 2026
+"""
+
+import os
+import tempfile
+import cache
+from cache import StageCache
+from cache import cache_key
+from cache import read_index
+from cache import write_index
+from cache import index_lock
+from cache import touch
+from cache import evict
+from cache import provenance_digest
+from cache import code_digest
+
+REGION = {'n': 100, 's': 0, 'e': 100, 'w': 0, 'nsres': 30, 'ewres': 30,
+          'rows': 4, 'cols': 4, 'cells': 16}
+
+
+def test_cache_key():
+    """
+    Keys change with the landcover map, the region and the look-up table,
+    not with other region settings
+    """
+    landcover = {'name': 'FROM_GLC@PERMANENT', 'digest': 'a'}
+    key = cache_key(landcover, REGION, 'lut')
+    assert key == cache_key(landcover, dict(REGION, cells=None), 'lut')
+    assert key != cache_key(dict(landcover, digest='b'), REGION, 'lut')
+    assert key != cache_key(landcover, dict(REGION, nsres=15), 'lut')
+    assert key != cache_key(landcover, REGION, 'other')
+
+
+def test_least_recently_used_eviction():
+    """
+    Entries beyond the cache size are evicted, least recently used first
+    """
+    index = {}
+    touch(index, 'a', ('average', 'delta'), now=1)
+    touch(index, 'b', ('average',), now=2)
+    touch(index, 'c', ('average',), now=3)
+    touch(index, 'a', now=4)
+    evicted = evict(index, 2)
+    assert sorted(index) == ['a', 'c']
+    assert evicted == ['swlst_emissivity_b_average']
+    assert sorted(index['a']['maps']) == ['average', 'delta']
+    assert evict(index, 2) == []
+
+
+def test_provenance_digest():
+    """
+    Digests of stage outputs follow every item of their provenance, not the
+    order of the items
+    """
+    digest = provenance_digest('column_water_vapor', window_sizes=[7, 9],
+                               median=False, temperatures={'t10': 'a'})
+    assert digest == provenance_digest('column_water_vapor', median=False,
+                                       temperatures={'t10': 'a'},
+                                       window_sizes=[7, 9])
+    assert digest != provenance_digest('column_water_vapor', median=True,
+                                       temperatures={'t10': 'a'},
+                                       window_sizes=[7, 9])
+    assert digest != provenance_digest('land_surface_temperature',
+                                       window_sizes=[7, 9], median=False,
+                                       temperatures={'t10': 'a'})
+    assert code_digest() == code_digest()
+
+
+def test_code_digest():
+    """
+    The code digest follows the coefficient tables, not only the source
+    files
+    """
+    import csv_to_dictionary
+    digest = code_digest()
+    column_water_vapor = csv_to_dictionary.get_column_water_vapor()
+    subrange = sorted(column_water_vapor)[0]
+    get_column_water_vapor = csv_to_dictionary.get_column_water_vapor
+    b0 = column_water_vapor[subrange].b0
+    column_water_vapor[subrange].b0 = b0 + 1
+    csv_to_dictionary.get_column_water_vapor = lambda: column_water_vapor
+    try:
+        assert code_digest() != digest
+    finally:
+        column_water_vapor[subrange].b0 = b0
+        csv_to_dictionary.get_column_water_vapor = get_column_water_vapor
+    assert code_digest() == digest
+
+
+def test_index_files():
+    """
+    Indices are replaced as a whole, and missing or truncated ones read as
+    empty
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'index.json')
+        assert read_index(path) == {}
+        write_index(path, {'a': {'maps': {}, 'used': 1}})
+        assert read_index(path) == {'a': {'maps': {}, 'used': 1}}
+        assert os.listdir(directory) == ['index.json']
+        with open(path, 'w') as index_file:
+            index_file.write('{"a": {"maps"')
+        assert read_index(path) == {}
+
+
+def test_index_lock():
+    """
+    An index is locked by one run at a time
+    """
+    import fcntl
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'index.json')
+        with open(path + '.lock', 'a') as lock_file:
+            with index_lock(path):
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = False
+                except BlockingIOError:
+                    locked = True
+            assert locked
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+def test_map_identity():
+    """
+    Maps are identified by their content, floating point cells included,
+    not by the modification time of their files
+    """
+    with tempfile.TemporaryDirectory() as mapset:
+        for element in ('cell', 'cellhd', 'fcell',
+                        os.path.join('cell_misc', 'lst')):
+            os.makedirs(os.path.join(mapset, element))
+        for path, content in ((os.path.join('cell', 'lst'), b''),
+                              (os.path.join('cellhd', 'lst'), b'rows: 4'),
+                              (os.path.join('fcell', 'lst'), b'\x01\x02'),
+                              (os.path.join('cell_misc', 'lst', 'null'),
+                               b'\x00')):
+            with open(os.path.join(mapset, path), 'wb') as map_file:
+                map_file.write(content)
+        cell_path = os.path.join(mapset, 'cell', 'lst')
+        find_file = cache.grass.find_file
+        cache.grass.find_file = lambda name, element: {
+                'file': cell_path if name == 'lst' else '',
+                'fullname': name + '@mapset'}
+        try:
+            identity = cache.map_identity('lst')
+            assert identity['name'] == 'lst@mapset'
+            assert cache.map_identity('other') is None
+            os.utime(cell_path, (1, 1))
+            assert cache.map_identity('lst') == identity
+            with open(os.path.join(mapset, 'fcell', 'lst'), 'wb') as map_file:
+                map_file.write(b'\x01\x03')
+            assert cache.map_identity('lst') != identity
+        finally:
+            cache.grass.find_file = find_file
+
+
+class Messages():
+    """
+    Record messages instead of printing them
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def message(self, msg):
+        self.messages.append(msg)
+
+
+def test_skip_requires_read_outputs():
+    """
+    A stage whose named outputs are current is not skipped if later stages
+    read temporary maps of it: for example, with a column water vapor
+    accuracy output only, while land surface temperature is stale
+    """
+    existing = {'cwv_accuracy', 'cwv'}
+    replaced = (cache.map_identity, cache.region_identity, cache.g)
+    cache.map_identity = lambda mapname: ({'name': mapname}
+                                          if mapname in existing else None)
+    cache.region_identity = lambda: REGION
+    cache.g = Messages()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            stages = StageCache(os.path.join(directory, 'stages.json'))
+            digest = stages.digest('column_water_vapor', window_sizes=[7])
+            stages.record(['cwv_accuracy', 'cwv'], digest)
+
+            # accuracy output only, the CWV map read by LST is temporary
+            assert stages.is_current(['cwv_accuracy'], digest)
+            assert not stages.skip(['', 'cwv_accuracy'], digest, 'cwv',
+                                   reads=[''])
+            # named CWV output, read by LST
+            assert stages.skip(['cwv', 'cwv_accuracy'], digest, 'cwv',
+                               reads=['cwv'])
+            assert not stages.skip(['cwv'], digest, 'cwv',
+                                   reads=['cwv', 'other'])
+            assert StageCache(stages.index_path).index == stages.index
+
+            # records of concurrent runs are merged, not overwritten
+            concurrent = StageCache(stages.index_path)
+            stages.record(['cwv'], 'other')
+            concurrent.record(['cwv_accuracy'], 'other')
+            index = read_index(stages.index_path)
+            assert index['cwv']['digest'] == index['cwv_accuracy']['digest']
+
+            # no stage is skipped unless reusing outputs
+            reruns = StageCache(stages.index_path, reuse=False)
+            assert not reruns.skip(['cwv'], 'other', 'cwv')
+            assert stages.skip(['cwv'], 'other', 'cwv')
+    finally:
+        cache.map_identity, cache.region_identity, cache.g = replaced
+
+
+def test_rerun_reuses_existing_outputs():
+    """
+    A rerun over existing, named outputs, as with --overwrite, skips the
+    stages whose outputs are unmodified, unless reusing is disabled (flag
+    -d)
+    """
+    maps = {'lst': 'a', 'cwv': 'b'}
+    replaced = (cache.map_identity, cache.region_identity, cache.g)
+    cache.map_identity = lambda mapname: ({'name': mapname,
+                                           'digest': maps[mapname]}
+                                          if mapname in maps else None)
+    cache.region_identity = lambda: REGION
+    cache.g = Messages()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            index_path = os.path.join(directory, 'stages.json')
+            first_run = StageCache(index_path)
+            digest = first_run.digest('land_surface_temperature', cwv='b')
+            assert not first_run.skip(['lst'], digest, 'lst', reads=['lst'])
+            first_run.record(['lst'], digest)
+
+            # rerun, the outputs exist
+            rerun = StageCache(index_path)
+            assert rerun.skip(['lst'], digest, 'lst', reads=['lst'])
+            assert 'lst' in cache.g.messages[-1]
+            assert not rerun.skip(['lst'], rerun.digest(
+                    'land_surface_temperature', cwv='c'), 'lst')
+
+            # flag -d
+            assert not StageCache(index_path, reuse=False).skip(
+                    ['lst'], digest, 'lst')
+
+            # outputs modified after being recorded
+            maps['lst'] = 'c'
+            assert not StageCache(index_path).skip(['lst'], digest, 'lst')
+    finally:
+        cache.map_identity, cache.region_identity, cache.g = replaced
+
+
+def test_record_waits_for_index_lock():
+    """
+    Recording outputs waits for a concurrent run holding the index lock,
+    then merges in to the index as the concurrent run wrote it
+    """
+    import threading
+    replaced = (cache.map_identity, cache.region_identity)
+    cache.map_identity = lambda mapname: {'name': mapname}
+    cache.region_identity = lambda: REGION
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            stages = StageCache(os.path.join(directory, 'stages.json'))
+            recording = threading.Thread(target=stages.record,
+                                         args=(['lst'], 'a'))
+            with index_lock(stages.index_path):
+                recording.start()
+                recording.join(0.2)
+                assert recording.is_alive()
+                write_index(stages.index_path, {'cwv': {'digest': 'b'}})
+            recording.join()
+            assert sorted(read_index(stages.index_path)) == ['cwv', 'lst']
+    finally:
+        cache.map_identity, cache.region_identity = replaced
+
+
+# reusable & stand-alone
+if __name__ == "__main__":
+    print('Testing the emissivity cache')
+    test_cache_key()
+    test_least_recently_used_eviction()
+    test_provenance_digest()
+    test_code_digest()
+    test_index_files()
+    test_index_lock()
+    test_map_identity()
+    test_skip_requires_read_outputs()
+    test_rerun_reuses_existing_outputs()
+    test_record_waits_for_index_lock()
@@ -1,9 +1,50 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import re
+from types import SimpleNamespace
+import numpy
 from column_water_vapor import *
 from randomness import random_window_size
 from randomness import random_adjacent_pixel_values
+from quality_assessment import CloudMask
+from window_moments import window_moments
+from test_split_window_lst_array import mapcalc_eval
+
+
+def mapcalc_cells(expression, maps, row, col):
+    """
+    Evaluate an r.mapcalc expression of neighborhood modifiers in Python, at
+    a cell of the given NumPy arrays, keyed by map name. Cells outside the
+    arrays or NaN are NULL (None).
+    """
+    def cell(match):
+        array = maps[match.group(1)]
+        cell_row = row + int(match.group(2))
+        cell_col = col + int(match.group(3))
+        if 0 <= cell_row < array.shape[0] and 0 <= cell_col < array.shape[1] \
+                and not numpy.isnan(array[cell_row, cell_col]):
+            return f'({float(array[cell_row, cell_col])!r})'
+        return 'null()'
+    expression = re.sub(r'(\w+)\[(-?\d+),\s*(-?\d+)\]', cell, expression)
+    if not expression.startswith('eval('):
+        expression = f'eval({expression})'
+    return mapcalc_eval(expression, {})
+
+
+def mapcalc_arrays(expression, maps, shape):
+    """
+    Evaluate an r.mapcalc expression of neighborhood modifiers at every cell,
+    NULL cells as NaN
+    """
+    result = numpy.full(shape, numpy.nan)
+    for row in range(shape[0]):
+        for col in range(shape[1]):
+            value = mapcalc_cells(expression, maps, row, col)
+            if value is not None:
+                result[row, col] = value
+    return result
+
 
 # helper functions
 def test_column_water_vapor():
@@ -77,7 +118,241 @@ def test_column_water_vapor():
     print(" | One big mapcalc expression:\n\n", obj._big_cwv_expression())
     print()
 
+
+def test_masked_cells():
+    """
+    A cloud mask is tested at each adjacent pixel of Ti and Tj, in every
+    window expression, and keys the memoised expressions, without creating
+    the mask map
+    """
+    mask = CloudMask('clouds', qa=False)
+    cwv = Column_Water_Vapor(7, 'A', 'B', mask=mask)
+    assert 'if(!isnull(clouds[-2, 1]), null(), A[-2, 1])' in \
+        cwv.mean_ti_expression
+    assert 'if(!isnull(clouds[-2, 1]), null(), B[-2, 1])' in \
+        cwv.mean_tj_expression
+    row_sums = cwv._row_sum_expressions()
+    assert 'if(!isnull(clouds[0,-2]), null(), A[0,-2])' in row_sums['ti']
+    assert cwv.mean_ti_expression != \
+        Column_Water_Vapor(7, 'A', 'B').mean_ti_expression
+    cwv = Column_Water_Vapor(7, 'A', 'B', min_valid_fraction=0.5, mask=mask)
+    median = cwv._window_median_expressions()['median_ti']
+    assert 'if(isnull(if(!isnull(clouds[-2, 1]), null(), B[-2, 1])), ' \
+        'null(), if(!isnull(clouds[-2, 1]), null(), A[-2, 1]))' in median
+
+    # building expressions over a QA band creates no r.reclass map, an
+    # empty mask keys the same expressions as none
+    import quality_assessment
+    reclassified = []
+    write_command = quality_assessment.grass.write_command
+    quality_assessment.grass.write_command = \
+        lambda module, **kwargs: reclassified.append(kwargs['output'])
+    try:
+        mask = CloudMask('QA', values=numpy.array([1, 2]), mask_map='QA_mask')
+        cwv = Column_Water_Vapor(7, 'A', 'B', mask=mask)
+        assert 'if(!isnull(QA_mask[-2, 1]), null(), A[-2, 1])' in \
+            cwv.mean_ti_expression
+        empty = CloudMask('QA', values=numpy.array([2]), mask_map='QA_mask')
+        assert Column_Water_Vapor(7, 'A', 'B', mask=empty)._expression_key() \
+            == Column_Water_Vapor(7, 'A', 'B')._expression_key()
+        assert not reclassified
+    finally:
+        quality_assessment.grass.write_command = write_command
+
+
+def test_separable_window_sums():
+    """
+    The row sums of _row_sum_expressions(), summed along the columns by
+    _separable_bindings(), give the covariance and variance terms of the
+    window moments, for complete windows
+    """
+    rng = numpy.random.default_rng(11)
+    shape = (13, 12)
+    ti = rng.normal(300, 2, shape)
+    tj = ti - rng.uniform(0, 2, shape)
+    for window_stride in (1, 2):
+        cwv = Column_Water_Vapor(7, 'TI', 'TJ', window_stride)
+        maps = {'TI': ti, 'TJ': tj}
+        row_sums = {}
+        for moment, expression in cwv._row_sum_expressions().items():
+            row_sums[moment] = f'RowSum_{moment}'
+            maps[row_sums[moment]] = mapcalc_arrays(expression, maps, shape)
+        bindings = cwv._separable_bindings(row_sums)
+        numerator = mapcalc_arrays(f'eval({bindings}\\ \n  numerator)',
+                                   maps, shape)
+        denominator = mapcalc_arrays(f'eval({bindings}\\ \n  denominator)',
+                                     maps, shape)
+
+        moments, _ = window_moments(ti, tj, cwv.window_radius, window_stride)
+        count = len(cwv.adjacent_pixels)
+        complete = moments.count == count
+        expected_numerator = moments.ti_tj - moments.ti * moments.tj / count
+        expected_denominator = moments.ti_ti - moments.ti ** 2 / count
+        assert complete.any()
+        assert numpy.array_equal(~numpy.isnan(numerator), complete)
+        assert numpy.allclose(numerator[complete],
+                              expected_numerator[complete])
+        assert numpy.allclose(denominator[complete],
+                              expected_denominator[complete])
+
+
+def test_moment_expressions():
+    """
+    The expressions of _moment_bindings(), evaluated for the window moments
+    of a single window, give its column water vapor and retrieval accuracy,
+    based on window means or medians, and NULL for incomplete windows
+    """
+    rng = numpy.random.default_rng(5)
+    cwv = Column_Water_Vapor(7, 'A', 'B')
+    ti = rng.normal(300, 2, len(cwv.adjacent_pixels))
+    tj = ti - rng.uniform(0, 2, ti.shape)
+    offset = TEMPERATURE_OFFSET
+    values = {
+        'Wcount': len(ti),
+        'Wmeani': ti.mean(),
+        'Wmeanj': tj.mean(),
+        'Wprodij': ((ti - offset) * (tj - offset)).mean(),
+        'Wsqii': ((ti - offset) ** 2).mean(),
+        'Wsqjj': ((tj - offset) ** 2).mean(),
+        'Wmediani': numpy.median(ti),
+        'Wmedianj': numpy.median(tj),
+    }
+    for median in (False, True):
+        ai, aj = ((values['Wmediani'], values['Wmedianj']) if median
+                  else (ti.mean(), tj.mean()))
+        numerator = ((ti - ai) * (tj - aj)).sum()
+        rji = numerator / ((ti - ai) ** 2).sum()
+        rij = numerator / ((tj - aj) ** 2).sum()
+        medians = ('Wmediani', 'Wmedianj') if median else (None, None)
+        expression = cwv._cwv_expression_from_moments(
+                'Wcount', 'Wmeani', 'Wmeanj', 'Wprodij', 'Wsqii', *medians)
+        assert abs(mapcalc_eval(expression, values)
+                   - cwv._cwv_from_ratio(rji)) < 1e-6, median
+        expression = cwv._accuracy_expression_from_moments(
+                'Wcount', 'Wmeani', 'Wmeanj', 'Wprodij', 'Wsqii', 'Wsqjj',
+                *medians)
+        assert abs(mapcalc_eval(expression, values) - rji * rij) < 1e-6, \
+            median
+        assert mapcalc_eval(expression, dict(values, Wcount=len(ti) - 1)) \
+            is None
+
+
+def test_separable_reason():
+    """
+    The mapcalc engine uses separable window sums only for large windows,
+    valid-pixel counts or the retrieval accuracy
+    """
+    from column_water_vapor import _separable_reason
+    assert _separable_reason(Column_Water_Vapor(7, 'A', 'B')) is None
+    assert _separable_reason(Column_Water_Vapor(SEPARABLE_WINDOW_SIZE,
+                                                'A', 'B'))
+    assert _separable_reason(Column_Water_Vapor(7, 'A', 'B',
+                                                min_valid_fraction=0.5))
+    assert _separable_reason(Column_Water_Vapor(7, 'A', 'B'), 'accuracy')
+
+
+class ArrayRaster():
+    """
+    A raster map held in a NumPy array, read by blocks of rows and written
+    row by row in place of a RasterRow
+    """
+
+    def __init__(self, array=None):
+        self.array = array
+        self.info = SimpleNamespace(rows=0 if array is None else len(array))
+        self.blocks = []
+        self.written = []
+
+    def close(self):
+        pass
+
+
+def test_numpy_engine_row_blocks():
+    """
+    The numpy engine, reading blocks of rows extended by the largest window
+    radius, matches computing whole arrays, masked cells and the retrieval
+    accuracy included, and never holds more than a block and its halo
+    """
+    import column_water_vapor
+    rng = numpy.random.default_rng(3)
+    shape = (29, 14)
+    maps = {'TI': rng.normal(300, 2, shape)}
+    maps['TJ'] = maps['TI'] - rng.uniform(0, 2, shape)
+    maps['clouds'] = numpy.where(rng.uniform(size=shape) < 0.1, 1, numpy.nan)
+    rasters = {}
+
+    def open_raster_rows(mapname, mode='r'):
+        rasters[mapname] = ArrayRaster(maps.get(mapname))
+        return rasters[mapname]
+
+    def read_raster_rows(raster, start, end):
+        raster.blocks.append((start, end))
+        return raster.array[start:end]
+
+    def write_raster_row(raster, values):
+        raster.written.append(values)
+
+    replaced = (column_water_vapor.open_raster_rows,
+                column_water_vapor.read_raster_rows,
+                column_water_vapor.write_raster_row)
+    column_water_vapor.open_raster_rows = open_raster_rows
+    column_water_vapor.read_raster_rows = read_raster_rows
+    column_water_vapor.write_raster_row = write_raster_row
+    try:
+        mask = CloudMask('clouds', qa=False)
+        cwvs = [Column_Water_Vapor(size, 'TI', 'TJ', min_valid_fraction=0.5,
+                                   mask=mask) for size in (7, 11)]
+        column_water_vapor._estimate_cwv_numpy(
+                cwvs, ['cwv_7', 'cwv_11'], accuracy_maps=[None, 'acc_11'],
+                block_rows=4)
+    finally:
+        (column_water_vapor.open_raster_rows,
+         column_water_vapor.read_raster_rows,
+         column_water_vapor.write_raster_row) = replaced
+
+    masked = ~numpy.isnan(maps['clouds'])
+    ti = numpy.where(masked, numpy.nan, maps['TI'])
+    tj = numpy.where(masked, numpy.nan, maps['TJ'])
+    expected = compute_column_water_vapor_arrays(cwvs, ti, tj, accuracy=True)
+    for (cwv_array, accuracy_array), outname in zip(expected,
+                                                   ['cwv_7', 'cwv_11']):
+        assert numpy.allclose(numpy.array(rasters[outname].written), cwv_array,
+                              equal_nan=True)
+    assert numpy.allclose(numpy.array(rasters['acc_11'].written),
+                          expected[1][1], equal_nan=True)
+    halo = cwvs[1].window_radius
+    for mapname in ('TI', 'TJ', 'clouds'):
+        blocks = rasters[mapname].blocks
+        assert len(blocks) == 8
+        assert all(end - start <= 4 + 2 * halo for start, end in blocks)
+
+
+def test_coarse_region():
+    """
+    Coarse grids share the north and west edges of the region and cover it,
+    and are coarser than the region
+    """
+    from column_water_vapor import coarse_region
+    region = {'n': 1000.0, 's': 10.0, 'w': 20.0, 'e': 1010.0,
+              'nsres': 30.0, 'ewres': 30.0}
+    assert coarse_region(region, 90) == {'n': 1000.0, 's': 10.0,
+                                         'w': 20.0, 'e': 1010.0, 'res': 90}
+    assert coarse_region(region, 100) == {'n': 1000.0, 's': 0.0,
+                                          'w': 20.0, 'e': 1020.0, 'res': 100}
+    for resolution in (30, 15):
+        try:
+            coarse_region(region, resolution)
+            assert False, resolution
+        except AssertionError as error:
+            assert 'Coarse resolution' in str(error)
+
 # reusable & stand-alone
 if __name__ == "__main__":
     print('Testing the SplitWindowLST class')
     test_column_water_vapor()
+    test_masked_cells()
+    test_separable_window_sums()
+    test_moment_expressions()
+    test_separable_reason()
+    test_numpy_engine_row_blocks()
+    test_coarse_region()
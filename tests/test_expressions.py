@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@author nik | Created on October 2026
+"""
+
+import re
+import numpy
+from expressions import Constant
+from expressions import Variable
+from expressions import function
+from expressions import summation
+from expressions import render
+from expressions import evaluate
+from expressions import common_subexpressions
+from expressions import compose
+from expressions import substitute
+from expressions import memoise
+from expressions import EXPRESSION_CACHE_SIZE
+
+
+def mapcalc_to_python(text):
+    """
+    Translate a (non-eval) r.mapcalc expression to Python. r.mapcalc binds
+    the unary minus of a name or number tighter than ^, Python does not,
+    hence these are parenthesised.
+    """
+    text = re.sub(r'(^|[-+*/^(,]\s*)-(\w+(?:\.\w+)?)', r'\1(-\2)', text)
+    return text.replace('^', '**')
+
+
+def test_render_precedence():
+    """
+    Rendered text keeps the grouping of the tree, with minimal parentheses
+    """
+    x = Variable('x')
+    y = Variable('y')
+    z = Variable('z')
+    expressions = (x - (y - z),
+                   (x - y) - z,
+                   x / (y * z),
+                   x * y / z,
+                   (x ** 2) ** 3,
+                   x ** (y ** 2),
+                   -(x + y) * z,
+                   Constant(-0.5) ** 2 + x,
+                   x - Constant(-2) * y,
+                   2 / (x + 1) ** 2,
+                   -(x ** 2),
+                   -(x ** 2) * z,
+                   (-x) ** 2,
+                   z ** -(x ** 2))
+    values = {'x': 1.7, 'y': -0.3, 'z': 2.9}
+    for expression in expressions:
+        text = render(expression)
+        assert abs(eval(mapcalc_to_python(text), {}, values)
+                   - evaluate(expression, values)) < 1e-12, text
+    assert render(x - (y - z)) == 'x - (y - z)'
+    assert render((x - y) - z) == 'x - y - z'
+    assert render(-(x ** 2)) == '-(x ^ 2)'
+    assert render((-x) ** 2) == '(-x) ^ 2'
+
+
+def test_constant_folding():
+    """
+    Operations of numbers fold in to constants, neutral elements drop
+    """
+    x = Variable('x')
+    assert render((1 - 0.5) / 0.5 ** 2 * x) == '2.0 * x'
+    assert render(x * 1 + 0) == 'x'
+    assert render(Constant('3.3420E-04') * x) == '3.3420E-04 * x'
+
+
+def test_bindings():
+    """
+    Variables bind to map names while rendering, names which contain
+    other variables' names are not replaced again
+    """
+    x = Variable('Input_T10')
+    y = Variable('Input_T11')
+    text = render(x - y, {'Input_T10': 'Input_T11_copy', 'Input_T11': 'b11'})
+    assert text == 'Input_T11_copy - b11'
+    assert substitute('Input_T10 - Input_T1', {'Input_T1': 'a',
+                                               'Input_T10': 'Input_T1'}) \
+        == 'Input_T1 - a'
+
+
+def test_common_subexpressions():
+    """
+    Repeated subexpressions are bound once in an eval(), in dependency order
+    """
+    x = Variable('x')
+    y = Variable('y')
+    difference = x - y
+    square = difference ** 2
+    expression = square + square / difference + function('log', difference)
+    assert common_subexpressions(expression) == [difference, square]
+    text = render(expression, share_subexpressions=True)
+    assert text.startswith('eval(\\ \n shared_0 = x - y,')
+    assert text.count('x - y') == 1
+
+
+def test_evaluate():
+    """
+    Trees evaluate on NumPy arrays like r.mapcalc, NULL cells as NaN
+    """
+    x = Variable('x')
+    y = Variable('y')
+    values = {'x': numpy.array([1.0, 2.0, numpy.nan]), 'y': 3.0}
+    result = evaluate(function('log', summation([x, y, 2, x]) / y), values)
+    expected = numpy.log((2 * values['x'] + 5) / 3)
+    assert numpy.allclose(result, expected, equal_nan=True)
+
+    bucket = function('graph', x, 1, 10, 2, 20)
+    selection = function('if', x - 1, bucket, function('null'))
+    result = evaluate(selection, values)
+    assert numpy.isnan(result[[0, 2]]).all() and result[1] == 20
+
+
+def test_compose():
+    """
+    Composing trees, like digital numbers to radiance to temperature, equals
+    evaluating them one after the other
+    """
+    digital_number = Variable('DigitalNumber')
+    radiance = Variable('Radiance')
+    radiance_model = Constant('3.3420E-04') * digital_number + Constant('0.1')
+    temperature_model = Constant('1321.0789') / function(
+            'log', Constant('774.8853') / radiance + 1)
+    composed = compose(temperature_model, {'Radiance': radiance_model})
+    values = numpy.array([20000.0, 25000.0, numpy.nan])
+    expected = evaluate(temperature_model, {
+        'Radiance': evaluate(radiance_model, {'DigitalNumber': values})})
+    assert numpy.allclose(evaluate(composed, {'DigitalNumber': values}),
+                          expected, equal_nan=True)
+    assert 'Radiance' not in render(composed)
+    assert abs(eval(mapcalc_to_python(render(composed)),
+                    {'log': numpy.log}, {'DigitalNumber': 20000.0})
+               - expected[0]) < 1e-9
+
+
+def test_memoise():
+    """
+    Memoised methods build once per key, across objects, within a bounded
+    cache
+    """
+    calls = []
+
+    class Model():
+        def __init__(self, size):
+            self.size = size
+
+        def _expression_key(self):
+            return (self.size,)
+
+        @memoise
+        def expression(self, name):
+            calls.append((self.size, name))
+            return render(summation([Variable(name)] * self.size))
+
+    assert Model(3).expression('x') is Model(3).expression('x')
+    assert len(calls) == 1
+    Model(4).expression('x')
+    assert len(calls) == 2
+    for size in range(EXPRESSION_CACHE_SIZE + 1):
+        Model(10 + size).expression('y')
+    assert len(Model.expression.cache) == EXPRESSION_CACHE_SIZE
+
+
+# reusable & stand-alone
+if __name__ == "__main__":
+    print('Testing the expression tree for r.mapcalc')
+    test_render_precedence()
+    test_constant_folding()
+    test_bindings()
+    test_common_subexpressions()
+    test_evaluate()
+    test_compose()
+    test_memoise()
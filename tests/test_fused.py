@@ -0,0 +1,160 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@author nik | Created on October 2026
+"""
+
+import os
+import numpy
+from landsat8_mtl import Landsat8_MTL
+from constants import DUMMY_MAPCALC_STRING_DN
+from expressions import evaluate
+from column_water_vapor import Column_Water_Vapor
+from column_water_vapor import compute_column_water_vapor_arrays
+from split_window_lst import SplitWindowLST
+from fused import RowWindow
+from radiance import lookup_brightness_temperature
+from radiance import null_zero_digital_numbers
+from fused import fused_blocks
+from test_split_window_lst_array import mapcalc_eval
+
+MTLFILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'mtl.txt')
+
+
+def random_scene(rows=23, cols=17, seed=16):
+    """
+    Random brightness temperatures, NULL cells included, and FROM-GLC codes
+    """
+    generator = numpy.random.default_rng(seed)
+    t10 = generator.uniform(285, 305, (rows, cols))
+    t11 = t10 - generator.uniform(0.5, 2.5, (rows, cols))
+    t10[3, 4] = numpy.nan
+    t11[11, 7] = numpy.nan
+    landcover = generator.choice([10, 20, 30, 50, 80, 90], (rows, cols))
+    return t10, t11, landcover.astype(numpy.float64)
+
+
+def row_window(array, reads):
+    """
+    A RowWindow over an array, recording the rows read
+    """
+    def read_row(row):
+        reads.append(row)
+        return array[row]
+    return RowWindow(read_row)
+
+
+def test_fused_blocks():
+    """
+    Streaming blocks of rows reads each row once and reproduces the
+    composition of the full-array steps
+    """
+    t10, t11, landcover = random_scene()
+    cwvs = [Column_Water_Vapor(size, 'A', 'B') for size in (7, 9)]
+    swlst = SplitWindowLST('')
+    expected_cwvs = compute_column_water_vapor_arrays(cwvs, t10, t11)
+    average, delta = swlst.compute_emissivity_arrays(landcover)
+
+    reads = []
+    windows = {'t10': row_window(t10, reads),
+               't11': row_window(t11, []),
+               'landcover': row_window(landcover, [])}
+    rows = t10.shape[0]
+    covered = []
+    for start, end, products in fused_blocks(windows, rows, cwvs, swlst,
+                                             emissivities=True, block_rows=5):
+        covered.extend(range(start, end))
+        assert numpy.array_equal(products['avg_lse'], average[start:end],
+                                 equal_nan=True)
+        for index, cwv in enumerate(expected_cwvs):
+            assert numpy.allclose(products['cwv'][index], cwv[start:end],
+                                  equal_nan=True)
+            expected_lst = swlst.compute_lst_array(t10[start:end],
+                                                   t11[start:end],
+                                                   cwv[start:end],
+                                                   landcover=landcover[start:end])
+            assert numpy.allclose(products['lst'][index], expected_lst,
+                                  equal_nan=True)
+    assert covered == list(range(rows))
+    assert reads == list(range(rows))
+
+
+def test_fused_blocks_masked():
+    """
+    Masked cells are NULL in every product depending on the brightness
+    temperatures, as if read through a MASK
+    """
+    t10, t11, landcover = random_scene()
+    masked = numpy.zeros(t10.shape, dtype=bool)
+    masked[5:9, 2:6] = True
+    cwvs = [Column_Water_Vapor(7, 'A', 'B', min_valid_fraction=0.5)]
+    swlst = SplitWindowLST('')
+    t10_masked = numpy.where(masked, numpy.nan, t10)
+    t11_masked = numpy.where(masked, numpy.nan, t11)
+    expected_cwv, = compute_column_water_vapor_arrays(cwvs, t10_masked,
+                                                      t11_masked)
+
+    windows = {'t10': row_window(t10, []),
+               't11': row_window(t11, []),
+               'landcover': row_window(landcover, []),
+               'mask': row_window(masked, [])}
+    for start, end, products in fused_blocks(windows, t10.shape[0], cwvs,
+                                             swlst, block_rows=4):
+        assert numpy.array_equal(products['t10'], t10_masked[start:end],
+                                 equal_nan=True)
+        assert numpy.allclose(products['cwv'][0], expected_cwv[start:end],
+                              equal_nan=True)
+        assert numpy.isnan(products['lst'][0][masked[start:end]]).all()
+
+
+def test_lookup_brightness_temperature():
+    """
+    Looking up brightness temperatures per digital number equals evaluating
+    the conversion per pixel
+    """
+    landsat8 = Landsat8_MTL(MTLFILE)
+    digital_numbers = numpy.array([[0, 1, 20345], [30000, numpy.nan, 65535]])
+    for band in ('10', '11'):
+        table = landsat8.brightness_temperature_table(band)
+        expected = evaluate(landsat8.brightness_temperature_model(band),
+                            {DUMMY_MAPCALC_STRING_DN: digital_numbers})
+        looked_up = lookup_brightness_temperature(digital_numbers, table)
+        assert numpy.allclose(looked_up, expected, equal_nan=True)
+        looked_up = lookup_brightness_temperature(digital_numbers, table,
+                                                  null=True)
+        assert numpy.isnan(looked_up[0, 0]) and looked_up[0, 1] > 0
+
+
+def test_null_zero_digital_numbers():
+    """
+    Conversions of Digital Numbers, within r.mapcalc, give NULL for zero (0)
+    DNs and, as the look-up table, the temperature of non-zero DNs
+    """
+    landsat8 = Landsat8_MTL(MTLFILE)
+    for band in ('10', '11'):
+        table = landsat8.brightness_temperature_table(band)
+        expression = null_zero_digital_numbers(
+                landsat8.toar_brightness_temperature(band))
+        for digital_number in (0, 1, 20345, 65535):
+            temperature = mapcalc_eval(f'eval({expression})',
+                                       {DUMMY_MAPCALC_STRING_DN:
+                                        digital_number})
+            if digital_number == 0:
+                assert temperature is None
+            else:
+                assert numpy.isclose(temperature, table[digital_number])
+        radiance = null_zero_digital_numbers(landsat8.toar_radiance(band))
+        assert mapcalc_eval(f'eval({radiance})',
+                            {DUMMY_MAPCALC_STRING_DN: 0}) is None
+        assert mapcalc_eval(f'eval({radiance})',
+                            {DUMMY_MAPCALC_STRING_DN: 1}) > 0
+
+
+# reusable & stand-alone
+if __name__ == "__main__":
+    print('Testing the fused, single-pass pipeline')
+    test_lookup_brightness_temperature()
+    test_null_zero_digital_numbers()
+    test_fused_blocks()
+    test_fused_blocks_masked()
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@author nik | Created on October 2026
+"""
+
+import numpy
+from quality_assessment import decode_qa
+from quality_assessment import qa_mask
+from quality_assessment import qa_lookup_table
+from quality_assessment import value_ranges
+from quality_assessment import CloudMask
+
+
+def test_decode_qa():
+    """
+    Bit fields of known Collection 1 and Collection 2 QA values
+    """
+    # Collection 2: clear, low cloud confidence, low cirrus confidence
+    assert decode_qa(21824, 'clear') == 1
+    assert decode_qa(21824, 'cloud') == 0
+    assert decode_qa(21824, 'cloud_confidence') == 1
+    # Collection 2: high confidence cloud
+    assert decode_qa(22280, 'cloud') == 1
+    assert decode_qa(22280, 'cloud_confidence') == 3
+    # Collection 1: cloud, high cloud confidence
+    assert decode_qa(2800, 'cloud', collection=1) == 1
+    assert decode_qa(2800, 'cloud_confidence', collection=1) == 3
+    assert decode_qa(1, 'fill', collection=1) == 1
+
+
+def test_qa_mask():
+    """
+    Values are masked if a flag is set or a confidence reaches the level
+    """
+    values = numpy.array([1, 21824, 22280, 23888, 54596])
+    assert qa_mask(values).tolist() == [True, False, True, True, True]
+    assert qa_mask(values, conditions=('cloud',)).tolist() == \
+        [False, False, True, False, False]
+    assert qa_mask(values, conditions=('cloud',),
+                   confidence='low').tolist() == [False, True, True, True, True]
+    values = numpy.array([1, 2720, 2800, 61440])
+    assert qa_mask(values, collection=1).tolist() == [True, False, True, False]
+    assert qa_mask(values, collection=1, conditions=('cirrus',),
+                   confidence='medium').tolist() == [False, False, False, True]
+
+
+def test_qa_lookup_table():
+    """
+    A look-up table of unique values to whether they are masked
+    """
+    values = numpy.array([[21824, 22280], [22280, 21824]])
+    assert qa_lookup_table(values) == {21824: False, 22280: True}
+
+
+def test_value_ranges():
+    """
+    Runs of consecutive values are grouped in to ranges
+    """
+    assert value_ranges([1, 3, 4, 5]) == [(1, 1), (3, 5)]
+    assert value_ranges([7]) == [(7, 7)]
+    assert value_ranges([]) == []
+
+
+def test_cloud_mask():
+    """
+    Cloud masks decide per cell, via the look-up table of the QA values,
+    never masking NULL cells. Expressions reference the r.reclass map of the
+    masked values, created once, on request only.
+    """
+    import quality_assessment
+    reclassified = {}
+
+    def write_command(module, **kwargs):
+        assert module == 'r.reclass'
+        reclassified[kwargs['output']] = kwargs['stdin']
+    grass_write_command = quality_assessment.grass.write_command
+    quality_assessment.grass.write_command = write_command
+    try:
+        check_cloud_mask(reclassified)
+    finally:
+        quality_assessment.grass.write_command = grass_write_command
+
+
+def check_cloud_mask(reclassified):
+    """
+    Check cloud masks, given a dictionary collecting the rules of each
+    r.reclass map written
+    """
+    values = numpy.array([[numpy.nan, 21824, 22280], [22280, 1, 21824]])
+    unique = numpy.array([1, 2, 21824, 22280])
+    mask = CloudMask('QA', values=unique, mask_map='QA_mask')
+    assert mask.masked_values == [1, 22280] and not mask.empty
+    assert mask.compute_array(values).tolist() == \
+        [[False, False, True], [True, True, False]]
+    assert mask.reclass_rules == '1 = 1\n22280 = 1'
+    assert mask.expression == '!isnull(QA_mask)'
+    assert mask.apply('T10') == f'if({mask.expression}, null(), T10)'
+    assert mask.expression_at('[0,-1]') == '!isnull(QA_mask[0,-1])'
+    assert not reclassified
+    mask.create_mask_map()
+    assert reclassified == {'QA_mask': mask.reclass_rules}
+    reclassified.clear()
+    mask.create_mask_map()
+    assert not reclassified
+
+    mask = CloudMask('QA', values=numpy.array([1, 8, 9, 10, 16]),
+                     conditions=('fill', 'cloud'), mask_map='QA_mask')
+    assert mask.reclass_rules == '1 = 1\n8 thru 10 = 1'
+
+    mask = CloudMask('QA', qa_pixel=['21824'], mask_map='QA_mask')
+    assert mask.compute_array(values).tolist() == \
+        [[False, True, False], [False, False, True]]
+    assert mask.reclass_rules == '21824 = 1'
+
+    mask = CloudMask('clouds', qa=False)
+    assert mask.compute_array(values).tolist() == \
+        [[False, True, True], [True, True, True]]
+    assert mask.expression == '!isnull(clouds)' and not mask.empty
+    mask.create_mask_map()
+    assert not reclassified
+
+    mask = CloudMask('QA', values=numpy.array([21824]))
+    assert mask.empty
+    assert mask.expression is None and mask.apply('T10') == 'T10'
+    assert not mask.compute_array(values).any()
+    mask.create_mask_map()
+    assert not reclassified
+
+
+# reusable & stand-alone
+if __name__ == "__main__":
+    print('Testing the decoding of Quality Assessment bit flags')
+    test_decode_qa()
+    test_qa_mask()
+    test_qa_lookup_table()
+    test_value_ranges()
+    test_cloud_mask()
@@ -0,0 +1,306 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@author nik | Created on October 2026
+"""
+
+import re
+import math
+import numpy
+from split_window_lst import SplitWindowLST
+from constants import DUMMY_MAPCALC_STRING_AVG_LSE
+from constants import DUMMY_MAPCALC_STRING_DELTA_LSE
+from constants import DUMMY_MAPCALC_STRING_T10
+from constants import DUMMY_MAPCALC_STRING_T11
+from constants import DUMMY_MAPCALC_STRING_CWV
+from constants import DUMMY_MAPCALC_STRING_FROM_GLC
+
+
+def mapcalc_subrange_lst(swlst, subrange, t10, t11, avg_lse, delta_lse):
+    """
+    Evaluate the mapcalc expression of a cwv subrange in Python
+    """
+    expression = swlst._build_subrange_expression(subrange)
+    for dummy, value in ((DUMMY_MAPCALC_STRING_AVG_LSE, avg_lse),
+                         (DUMMY_MAPCALC_STRING_DELTA_LSE, delta_lse),
+                         (DUMMY_MAPCALC_STRING_T10, t10),
+                         (DUMMY_MAPCALC_STRING_T11, t11)):
+        expression = expression.replace(dummy, repr(float(value)))
+    return eval(expression.replace('^', '**'))
+
+
+def graph(x, *points):
+    """
+    Evaluate r.mapcalc's graph() at the knots
+    """
+    knots = dict(zip(points[::2], points[1::2]))
+    return knots.get(x)
+
+
+def mapcalc_if(condition, true, false):
+    """
+    Evaluate r.mapcalc's if(), NULL (None) conditions giving NULL
+    """
+    if condition is None:
+        return None
+    return true if condition else false
+
+
+def mapcalc_eval(expression, values):
+    """
+    Evaluate an eval() expression for r.mapcalc in Python, for the given
+    values of its DUMMY strings. Arithmetic on NULL (None) gives NULL.
+    """
+    for dummy, value in values.items():
+        expression = expression.replace(dummy, repr(float(value)))
+    expression = (expression.replace('^', '**')
+                  .replace('&&', ' and ')
+                  .replace('||', ' or ')
+                  .replace('null()', 'None'))
+    expression = re.sub(r'\bif\(', 'mapcalc_if(', expression)
+    pieces = expression[len('eval('):-1].lstrip('\\ \n').split(',\\ \n')
+    bindings = []
+    while re.match(r'\s*\w+ = ', pieces[0]):
+        bindings.append(pieces.pop(0))
+    result = ','.join(pieces)
+    variables = {'graph': graph, 'mapcalc_if': mapcalc_if, 'log': math.log}
+    for binding in bindings + [f'result = {result}']:
+        name, value = binding.split('=', 1)
+        try:
+            variables[name.strip()] = eval(value.replace('\\ \n', ''),
+                                           variables)
+        except TypeError:
+            variables[name.strip()] = None
+    return variables['result']
+
+
+def mapcalc_swlst(swlst, cwv, t10, t11, avg_lse, delta_lse):
+    """
+    Evaluate the eval() expression of the split-window LST in Python
+    """
+    return mapcalc_eval(swlst._build_swlst_expression(),
+                        {DUMMY_MAPCALC_STRING_CWV: cwv,
+                         DUMMY_MAPCALC_STRING_AVG_LSE: avg_lse,
+                         DUMMY_MAPCALC_STRING_DELTA_LSE: delta_lse,
+                         DUMMY_MAPCALC_STRING_T10: t10,
+                         DUMMY_MAPCALC_STRING_T11: t11})
+
+
+def test_cwv_subrange_cases():
+    """
+    Subrange codes agree with the scalar subrange retrieval, including at
+    the subrange limits
+    """
+    swlst = SplitWindowLST('Cropland')
+    limits, cases = swlst._cwv_subrange_cases()
+    values = numpy.concatenate([limits, numpy.linspace(0.01, 6.29, 157)])
+    codes = swlst._cwv_subrange_codes(values, limits)
+    for value, code in zip(values, codes):
+        expected = swlst._retrieve_adjacent_cwv_subranges(value)
+        if isinstance(expected, str):
+            expected = (expected,)
+        assert cases[code] == tuple(expected), value
+
+
+def test_swlst_expression():
+    """
+    The single formula over coefficient curves matches the subrange
+    formulas, averaging these within overlaps, including at the limits
+    """
+    for swlst in (SplitWindowLST('Map'), SplitWindowLST('Barren_Land')):
+        limits, _ = swlst._cwv_subrange_cases()
+        values = numpy.concatenate([limits, [-0.2, 6.9],
+                                    numpy.linspace(0.01, 6.29, 53)])
+        for cwv in values:
+            inputs = (301.2, 299.4, 0.975, 0.004)
+            expected = [mapcalc_subrange_lst(swlst, subrange, *inputs)
+                        for subrange in swlst._select_cwv_subranges(cwv)]
+            expected = sum(expected) / len(expected)
+            assert abs(mapcalc_swlst(swlst, cwv, *inputs) - expected) < 1e-9, cwv
+
+
+def test_swlst_landcover_expression():
+    """
+    Looking up combined coefficients by FROM-GLC code matches the formula
+    over average and delta emissivity maps, for all codes
+    """
+    swlst = SplitWindowLST('Map')
+    t10, t11 = 295.3, 293.1
+    for code in range(256):
+        average = mapcalc_eval(swlst.average_lse_mapcalc,
+                               {DUMMY_MAPCALC_STRING_FROM_GLC: code})
+        delta = mapcalc_eval(swlst.delta_lse_mapcalc,
+                             {DUMMY_MAPCALC_STRING_FROM_GLC: code})
+        for cwv in (-0.2, 1.0, 2.0, 2.2, 3.5, 6.3):
+            lst = mapcalc_eval(swlst.sw_lst_landcover_mapcalc,
+                               {DUMMY_MAPCALC_STRING_FROM_GLC: code,
+                                DUMMY_MAPCALC_STRING_CWV: cwv,
+                                DUMMY_MAPCALC_STRING_T10: t10,
+                                DUMMY_MAPCALC_STRING_T11: t11})
+            if average is None:
+                assert lst is None, code
+                continue
+            expected = mapcalc_swlst(swlst, cwv, t10, t11, average, delta)
+            assert abs(lst - expected) < 1e-9, (code, cwv)
+
+
+def test_emissivity_recode_rules():
+    """
+    Recoding FROM-GLC codes matches the average and delta emissivity
+    expressions, for all codes
+    """
+    swlst = SplitWindowLST('Map')
+    for rules, expression in ((swlst.average_lse_recode_rules,
+                               swlst.average_lse_mapcalc),
+                              (swlst.delta_lse_recode_rules,
+                               swlst.delta_lse_mapcalc)):
+        recode = {}
+        for rule in rules.splitlines():
+            low, high, value = rule.split(':')
+            for code in range(int(low), int(high) + 1):
+                recode[code] = float(value)
+        for code in range(256):
+            expected = mapcalc_eval(expression,
+                                    {DUMMY_MAPCALC_STRING_FROM_GLC: code})
+            assert recode.get(code) == expected, code
+
+
+def test_emissivity_class_expressions():
+    """
+    Reclassifying FROM-GLC codes and looking up the emissivities of each
+    class matches the recode rules, for all codes and emissivities
+    """
+    from constants import DUMMY_MAPCALC_STRING_LANDCOVER_CLASS
+    swlst = SplitWindowLST('Map')
+    reclass = {}
+    for rule in swlst.emissivity_class_reclass_rules.splitlines():
+        codes, group = rule.split(' = ')
+        low, _, high = codes.partition(' thru ')
+        for code in range(int(low), int(high or low) + 1):
+            reclass[code] = int(group)
+    for emissivity in ('average', 'delta', 't10', 't11'):
+        recode = {}
+        for rule in swlst.emissivity_recode_rules(emissivity).splitlines():
+            low, high, value = rule.split(':')
+            for code in range(int(low), int(high) + 1):
+                recode[code] = float(value)
+        expression = swlst.emissivity_class_mapcalc(emissivity)
+        for code in range(256):
+            if code not in reclass:
+                assert code not in recode, code
+                continue
+            value = eval(expression.replace(
+                    DUMMY_MAPCALC_STRING_LANDCOVER_CLASS,
+                    str(reclass[code])))
+            assert value == recode[code], (emissivity, code)
+
+
+def test_emissivity_arrays():
+    """
+    Looking up all emissivities at once matches the average and delta
+    emissivity expressions, and the channel emissivities combine to them
+    """
+    swlst = SplitWindowLST('Map')
+    codes = numpy.array([[float(code) for code in range(256)] + [numpy.nan]])
+    average, delta, t10, t11 = swlst.compute_emissivity_arrays(
+            codes,
+            ('average', 'delta', 't10', 't11'),
+    )
+    for index, code in enumerate(range(256)):
+        expected = mapcalc_eval(swlst.average_lse_mapcalc,
+                                {DUMMY_MAPCALC_STRING_FROM_GLC: code})
+        if expected is None:
+            assert numpy.isnan(average[0, index]), code
+            continue
+        assert average[0, index] == expected, code
+    assert numpy.isnan(delta[0, -1]) and numpy.isnan(t10[0, -1])
+    valid = ~numpy.isnan(average)
+    assert numpy.allclose(average[valid], (t10[valid] + t11[valid]) / 2)
+    assert numpy.allclose(delta[valid], t10[valid] - t11[valid])
+
+
+def test_fixed_class_folding():
+    """
+    Fixed land cover classes emit fully reduced numeric coefficients which
+    match the unfolded formula
+    """
+    from split_window_lst import EMISSIVITIES
+    t10, t11 = 301.2, 299.4
+    for landcover_class in EMISSIVITIES:
+        swlst = SplitWindowLST(landcover_class)
+        average = swlst.average_emissivity
+        delta = swlst.delta_emissivity
+        for index in range(1, 7):
+            subrange = f'Range_{index}'
+            expression = swlst._build_subrange_expression(subrange)
+            assert expression.count('/') == 2  # halving only
+            expected = swlst._compute_subrange_lst(subrange, t10, t11,
+                                                   average, delta)
+            lst = mapcalc_subrange_lst(swlst, subrange, t10, t11, 0, 0)
+            assert abs(lst - expected) < 1e-9, (landcover_class, subrange)
+
+
+def test_compute_lst_array():
+    """
+    The array evaluator matches the mapcalc subrange formulas, averaging
+    these within overlaps, and keeps NULL cells
+    """
+    rng = numpy.random.default_rng(17)
+    shape = (9, 11)
+    t10 = rng.uniform(280, 310, shape)
+    t11 = t10 - rng.uniform(0, 3, shape)
+    avg_lse = rng.uniform(0.96, 0.99, shape)
+    delta_lse = rng.uniform(-0.01, 0.01, shape)
+    cwv = rng.uniform(-0.5, 6.8, shape)
+    cwv[0, :4] = (2.0, 2.5, 3.0, 6.3)
+    cwv[1, 1] = numpy.nan
+
+    swlst = SplitWindowLST('Map')
+    lst = swlst.compute_lst_array(t10, t11, cwv, avg_lse, delta_lse)
+    assert numpy.isnan(lst[1, 1])
+    for row in range(shape[0]):
+        for col in range(shape[1]):
+            if numpy.isnan(cwv[row, col]):
+                continue
+            subranges = swlst._select_cwv_subranges(cwv[row, col])
+            values = [mapcalc_subrange_lst(swlst, subrange,
+                                           t10[row, col], t11[row, col],
+                                           avg_lse[row, col],
+                                           delta_lse[row, col])
+                      for subrange in subranges]
+            expected = sum(values) / len(values)
+            assert abs(lst[row, col] - expected) < 1e-9
+
+    landcover = rng.choice([10, 20, 51, 52, 71, 90, 101, 120], shape)
+    landcover = landcover.astype(float)
+    landcover[2, 2] = numpy.nan
+    classes = [swlst._select_emissivity_class(code) for code in (10, 20, 51, 52,
+                                                                 71, 90, 101)]
+    for code, landcover_class in zip((10, 20, 51, 52, 71, 90, 101), classes):
+        avg_lse[landcover == code] = \
+            swlst._compute_average_emissivity(landcover_class)
+        delta_lse[landcover == code] = \
+            swlst._compute_delta_emissivity(landcover_class)
+    lookup = swlst.compute_lst_array(t10, t11, cwv, landcover=landcover)
+    expected = swlst.compute_lst_array(t10, t11, cwv, avg_lse, delta_lse)
+    known = ~numpy.isnan(landcover) & (landcover != 120)
+    assert numpy.allclose(lookup[known], expected[known], equal_nan=True)
+    assert numpy.isnan(lookup[~known]).all()
+
+    barren = SplitWindowLST('Barren_Land')
+    lst = barren.compute_lst_array(t10, t11, cwv)
+    expected = mapcalc_subrange_lst(barren, 'Range_6', t10[0, 3], t11[0, 3],
+                                    barren.average_emissivity,
+                                    barren.delta_emissivity)
+    assert abs(lst[0, 3] - expected) < 1e-9
+
+
+# reusable & stand-alone
+if __name__ == "__main__":
+    print('Testing the array evaluator of the split-window LST')
+    test_cwv_subrange_cases()
+    test_swlst_expression()
+    test_swlst_landcover_expression()
+    test_fixed_class_folding()
+    test_compute_lst_array()
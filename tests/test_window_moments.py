@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+@author nik | Created on October 2026
+"""
+
+import numpy
+from window_moments import integral_image
+from window_moments import window_sum
+from window_moments import strided_window_sum
+from window_moments import window_moments
+from window_moments import window_median
+from window_moments import row_blocks
+
+
+def brute_force_window_sum(array, radius):
+    """
+    Sum of each (2 * radius + 1)^2 window, clipped to the array bounds
+    """
+    rows, cols = array.shape
+    sums = numpy.zeros(array.shape)
+    for row in range(rows):
+        for col in range(cols):
+            sums[row, col] = array[max(row - radius, 0):row + radius + 1,
+                                   max(col - radius, 0):col + radius + 1].sum()
+    return sums
+
+
+def test_window_sum():
+    """
+    Window sums from a summed-area table equal brute force sums
+    """
+    array = numpy.random.default_rng(7).normal(300, 5, (23, 17))
+    for radius in (1, 2, 5):
+        sums = window_sum(integral_image(array), radius)
+        assert numpy.allclose(sums, brute_force_window_sum(array, radius))
+
+
+def test_strided_window_sum():
+    """
+    Strided window sums add only every k-th row and column of each window
+    """
+    array = numpy.random.default_rng(5).normal(300, 5, (21, 19))
+    radius, stride = 4, 2
+    sums = strided_window_sum(array, radius, stride)
+    for row in range(array.shape[0]):
+        for col in range(array.shape[1]):
+            window = array[row % stride::stride, col % stride::stride]
+            expected = brute_force_window_sum(window, radius // stride)
+            assert numpy.isclose(sums[row, col],
+                                 expected[row // stride, col // stride])
+
+
+def test_window_moments():
+    """
+    NULL (NaN) cells do not count, neither do cells outside the array
+    """
+    rng = numpy.random.default_rng(11)
+    ti = rng.normal(290, 2, (15, 15))
+    tj = ti + rng.normal(0, 0.5, ti.shape)
+    ti[4, 4] = numpy.nan
+    moments, (offset_ti, offset_tj) = window_moments(ti, tj, 2, tj_tj=True)
+    valid = ~numpy.isnan(ti)
+    assert moments.count[4, 4] == 24
+    assert moments.count[0, 0] == 9
+    assert moments.count[10, 10] == 25
+    expected = brute_force_window_sum(numpy.where(valid, ti - offset_ti, 0), 2)
+    assert numpy.allclose(moments.ti, expected)
+    squares = numpy.where(valid, (tj - offset_tj) ** 2, 0)
+    assert numpy.allclose(moments.tj_tj, brute_force_window_sum(squares, 2))
+    assert window_moments(ti, tj, 2)[0].tj_tj is None
+
+
+def test_window_median():
+    """
+    Running histogram medians equal sorted window medians for values on the
+    quantisation grid
+    """
+    rng = numpy.random.default_rng(3)
+    array = numpy.round(rng.normal(300, 2, (19, 26)), 2)
+    array[2:4, 5:9] = numpy.nan
+    radius = 2
+    medians = window_median(array, radius)
+    for row in range(array.shape[0]):
+        for col in range(array.shape[1]):
+            window = array[max(row - radius, 0):row + radius + 1,
+                           max(col - radius, 0):col + radius + 1]
+            expected = numpy.nanmedian(window)
+            assert abs(medians[row, col] - expected) < 1e-9
+
+
+def test_window_median_even_count():
+    """
+    Of an even number of valid cells, the median is the mean of the two
+    middle values, as by numpy.nanmedian, r.mapcalc's nmedian() and
+    r.neighbors' median
+    """
+    array = numpy.array([[290.0, 291.0, numpy.nan],
+                         [295.0, numpy.nan, 300.5],
+                         [numpy.nan, 293.25, 299.0]])
+    medians = window_median(array, 1)
+    assert medians[1, 1] == numpy.nanmedian(array)  # 6 valid cells
+    assert medians[0, 0] == numpy.nanmedian(array[:2, :2])  # 3 valid cells
+    assert medians[0, 2] == numpy.nanmedian(array[:2, 1:])  # 2 valid cells
+
+
+def test_row_blocks():
+    """
+    Blocks cover all rows exactly once
+    """
+    blocks = list(row_blocks(10, 4, 2))
+    assert blocks == [(0, 6, 0, 4), (2, 10, 4, 8), (6, 10, 8, 10)]
+
+
+# reusable & stand-alone
+if __name__ == "__main__":
+    print('Testing window moments based on summed-area tables')
+    test_window_sum()
+    test_strided_window_sum()
+    test_window_moments()
+    test_window_median()
+    test_window_median_even_count()
+    test_row_blocks()
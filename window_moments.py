@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+
+"""
+Spatial window moments of brightness temperature maps based on summed-area
+tables (integral images)
+
+@author nik | Created on October 2026
+"""
+
+import numpy
+from collections import namedtuple
+
+WindowMoments = namedtuple('WindowMoments',
+                           ['count', 'ti', 'tj', 'ti_ti', 'ti_tj', 'tj_tj'],
+                           defaults=(None,))
+
+
+def integral_image(array):
+    """
+    Return the summed-area table of a 2D array. The table carries a leading
+    row and column of zeros so that the sum of any rectangle is derived from
+    four look-ups:
+
+        sum(array[r0:r1, c0:c1]) = T[r1, c1] - T[r0, c1] - T[r1, c0] + T[r0, c0]
+
+    Parameters
+    ----------
+    array
+        A 2D NumPy array
+
+    Returns
+    -------
+    table
+        A float64 array of shape (rows + 1, cols + 1)
+    """
+    rows, cols = array.shape
+    table = numpy.zeros((rows + 1, cols + 1), dtype=numpy.float64)
+    numpy.cumsum(array, axis=0, dtype=numpy.float64, out=table[1:, 1:])
+    numpy.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+    return table
+
+
+def window_sum(table, radius):
+    """
+    Return the sum of all cells within a (2 * radius + 1)^2 window centered
+    on each cell, derived from a summed-area table. Windows are clipped to the
+    array bounds.
+
+    Parameters
+    ----------
+    table
+        A summed-area table as returned by integral_image()
+
+    radius
+        Half size of the window, excluding the center cell
+
+    Returns
+    -------
+    A 2D array of window sums, of the same shape as the original array
+    """
+    rows = table.shape[0] - 1
+    cols = table.shape[1] - 1
+    low_rows = numpy.clip(numpy.arange(rows) - radius, 0, rows)
+    high_rows = numpy.clip(numpy.arange(rows) + radius + 1, 0, rows)
+    low_cols = numpy.clip(numpy.arange(cols) - radius, 0, cols)
+    high_cols = numpy.clip(numpy.arange(cols) + radius + 1, 0, cols)
+    return (table[numpy.ix_(high_rows, high_cols)]
+            - table[numpy.ix_(low_rows, high_cols)]
+            - table[numpy.ix_(high_rows, low_cols)]
+            + table[numpy.ix_(low_rows, low_cols)])
+
+
+def integral_images(array, stride=1):
+    """
+    Return the summed-area tables of each of the stride^2 lattices (rows and
+    columns of equal remainder modulo 'stride') of a 2D array, in row-major
+    order of their first cell. For a stride of 1, this is a single table of
+    the whole array.
+    """
+    return [integral_image(array[row::stride, col::stride])
+            for row in range(stride)
+            for col in range(stride)]
+
+
+def lattice_window_sum(tables, radius, stride=1):
+    """
+    Return the sum of the cells at row and column offsets that are multiples
+    of 'stride' within a (2 * radius + 1)^2 window centered on each cell,
+    from the summed-area tables of the lattices as returned by
+    integral_images().
+
+    The cells of such a window all lie on the same lattice as its center, on
+    which the window is contiguous with a radius of radius // stride. The
+    tables do not depend on the radius, hence they may be shared by windows
+    of different sizes.
+    """
+    if stride == 1:
+        return window_sum(tables[0], radius)
+    rows = sum(table.shape[0] - 1 for table in tables[::stride])
+    cols = sum(table.shape[1] - 1 for table in tables[:stride])
+    result = numpy.empty((rows, cols), dtype=numpy.float64)
+    for index, table in enumerate(tables):
+        row, col = divmod(index, stride)
+        result[row::stride, col::stride] = window_sum(table, radius // stride)
+    return result
+
+
+def strided_window_sum(array, radius, stride=1):
+    """
+    Return the sum of the cells at row and column offsets that are multiples
+    of 'stride' within a (2 * radius + 1)^2 window centered on each cell.
+    See lattice_window_sum().
+    """
+    return lattice_window_sum(integral_images(array, stride), radius, stride)
+
+
+def on_lattices(function, array, radius, stride):
+    """
+    Apply a windowed 'function(array, radius)' separately on each of the
+    stride^2 lattices of an array, turning it in to a function of strided
+    windows.
+    """
+    if stride == 1:
+        return function(array, radius)
+    result = numpy.empty(array.shape, dtype=numpy.float64)
+    for row in range(stride):
+        for col in range(stride):
+            result[row::stride, col::stride] = function(
+                    array[row::stride, col::stride],
+                    radius // stride,
+            )
+    return result
+
+
+def moment_tables(ti, tj, stride=1, tj_tj=False):
+    """
+    Return the summed-area tables required for the window moments of the
+    MSWCVM method, for any window size: see window_moments().
+
+    Returns
+    -------
+    tables
+        A WindowMoments named tuple of lists of summed-area tables, as
+        returned by integral_images()
+
+    offsets
+        A tuple (offset_ti, offset_tj) of the values subtracted from ti, tj
+    """
+    valid = ~(numpy.isnan(ti) | numpy.isnan(tj))
+    if valid.any():
+        offset_ti = float(ti[valid].mean())
+        offset_tj = float(tj[valid].mean())
+    else:
+        offset_ti = offset_tj = 0.0
+    ti = numpy.where(valid, ti - offset_ti, 0.0)
+    tj = numpy.where(valid, tj - offset_tj, 0.0)
+
+    tables = WindowMoments(
+            count=integral_images(valid, stride),
+            ti=integral_images(ti, stride),
+            tj=integral_images(tj, stride),
+            ti_ti=integral_images(ti * ti, stride),
+            ti_tj=integral_images(ti * tj, stride),
+            tj_tj=integral_images(tj * tj, stride) if tj_tj else None,
+    )
+    return tables, (offset_ti, offset_tj)
+
+
+def moments_from_tables(tables, radius, stride=1):
+    """
+    Return the window moments for a given window 'radius' from the tables
+    returned by moment_tables()
+    """
+    return WindowMoments(*(
+        lattice_window_sum(table, radius, stride) if table is not None
+        else None
+        for table in tables))
+
+
+def window_moments(ti, tj, radius, stride=1, tj_tj=False):
+    """
+    Return the window moments required for the ratio Rji of the MSWCVM
+    method: the count of valid cells and the sums of Ti, Tj, Ti^2 and Ti*Tj.
+    The ratio Rij, hence the retrieval accuracy Rji * Rij, requires in
+    addition the sums of Tj^2.
+
+    Cells that are NaN (NULL) in either of the input arrays do not count.
+    Each band is centered on its own mean before summing, which keeps the
+    summed-area tables of full scenes free of cancellation errors.
+    Covariances and variances are invariant to this shift, window means and
+    medians are not: see 'offsets' in the returned tuple.
+
+    Parameters
+    ----------
+    ti, tj
+        2D arrays of brightness temperatures for the channels i and j
+
+    radius
+        Half size of the window, excluding the center cell
+
+    stride
+        Use only cells at row and column offsets that are multiples of it
+
+    tj_tj
+        Sum Tj^2 as well, else the 'tj_tj' moment is None
+
+    Returns
+    -------
+    moments
+        A WindowMoments named tuple of 2D arrays
+
+    offsets
+        A tuple (offset_ti, offset_tj) of the values subtracted from ti, tj
+    """
+    tables, offsets = moment_tables(ti, tj, stride, tj_tj)
+    return moments_from_tables(tables, radius, stride), offsets
+
+
+def window_median(array, radius, precision=0.01, stride=1):
+    """
+    Return the median of all valid cells within a (2 * radius + 1)^2 window
+    centered on each cell, based on a running histogram (Huang's algorithm).
+
+    Values are quantised to 'precision' (here 0.01 K, well below the noise
+    equivalent temperature difference of TIRS) and counted in one histogram
+    per row. Sliding the windows of all rows one column to the right removes
+    the leaving column, adds the entering one and moves each median pointer
+    by the few bins the median shifts. The cost per pixel is O(n) instead of
+    sorting all n^2 values of each window.
+
+    NaN (NULL) cells do not count. Of an even number of valid cells, the mean
+    of the two middle values is returned, as by r.mapcalc's nmedian() and
+    r.neighbors' median. Windows without any valid cell are NaN.
+
+    Parameters
+    ----------
+    array
+        A 2D array, NULL cells as NaN
+
+    radius
+        Half size of the window, excluding the center cell
+
+    precision
+        Quantisation step of the histogram
+
+    stride
+        Use only cells at row and column offsets that are multiples of it
+
+    Returns
+    -------
+    A 2D array of window medians, exact to 'precision' / 2
+    """
+    if stride > 1:
+        return on_lattices(
+                lambda lattice, lattice_radius: window_median(
+                    lattice,
+                    lattice_radius,
+                    precision,
+                ),
+                array,
+                radius,
+                stride,
+        )
+
+    rows, cols = array.shape
+    size = 2 * radius + 1
+    valid = ~numpy.isnan(array)
+    median = numpy.full(array.shape, numpy.nan)
+    if not valid.any():
+        return median
+
+    minimum = array[valid].min()
+    quantised = numpy.full((rows + 2 * radius, cols), -1, dtype=numpy.int64)
+    quantised[radius:radius + rows][valid] = numpy.rint(
+            (array[valid] - minimum) / precision)
+    bins = int(quantised.max()) + 1
+
+    # vertical windows of each column, one per row: shape (rows, size)
+    windows = numpy.lib.stride_tricks.sliding_window_view(
+            quantised, size, axis=0)
+    row_index = numpy.arange(rows)
+
+    histogram = numpy.zeros((rows, bins), dtype=numpy.int32)
+    count = numpy.zeros(rows, dtype=numpy.int64)
+    pointer = numpy.zeros(rows, dtype=numpy.int64)
+    below = numpy.zeros(rows, dtype=numpy.int64)
+
+    def update(column, step):
+        values = windows[:, column, :]
+        inside = values >= 0
+        # one cell per row at a time, hence no duplicate indices
+        for cell in range(size):
+            histogram[row_index, values[:, cell].clip(0)] += \
+                step * inside[:, cell]
+        count[:] += step * inside.sum(axis=1)
+        below[:] += step * (inside & (values < pointer[:, None])).sum(axis=1)
+
+    for column in range(min(radius, cols)):
+        update(column, 1)
+
+    for column in range(cols):
+        entering = column + radius
+        leaving = column - radius - 1
+        if entering < cols:
+            update(entering, 1)
+        if leaving >= 0:
+            update(leaving, -1)
+
+        target = (count - 1) // 2
+        active = numpy.flatnonzero(count > 0)
+
+        # move pointers down while too many values lie below them
+        moving = active[below[active] > target[active]]
+        while moving.size:
+            pointer[moving] -= 1
+            below[moving] -= histogram[moving, pointer[moving]]
+            moving = moving[below[moving] > target[moving]]
+
+        # move pointers up while the median lies above them
+        moving = active[below[active] + histogram[active, pointer[active]]
+                        <= target[active]]
+        while moving.size:
+            below[moving] += histogram[moving, pointer[moving]]
+            pointer[moving] += 1
+            moving = moving[below[moving] + histogram[moving, pointer[moving]]
+                            <= target[moving]]
+
+        # the upper middle value, of an even count, may lie in a higher bin
+        upper = pointer.copy()
+        moving = active[below[active] + histogram[active, pointer[active]]
+                        <= count[active] // 2]
+        while moving.size:
+            upper[moving] += 1
+            moving = moving[histogram[moving, upper[moving]] == 0]
+
+        median[active, column] = minimum + \
+            (pointer[active] + upper[active]) / 2 * precision
+
+    return median
+
+
+def row_blocks(rows, block_rows, halo):
+    """
+    Split a number of rows in to blocks of (at most) 'block_rows' rows,
+    extended by 'halo' rows on either side, for block-wise processing of
+    windowed statistics.
+
+    Yields
+    ------
+    Tuples (read_start, read_end, start, end) where [read_start, read_end) is
+    the range of rows to read and [start, end) the range of rows for which
+    the window statistics are complete.
+    """
+    for start in range(0, rows, block_rows):
+        end = min(start + block_rows, rows)
+        yield max(start - halo, 0), min(end + halo, rows), start, end